@@ -72,7 +72,7 @@ class BaseVedaSetFetcher(BatchFetchTracer):
                  lbl_payload_executor=concurrent.futures.ThreadPoolExecutor,
                  img_payload_executor=concurrent.futures.ThreadPoolExecutor,
                  write_executor=concurrent.futures.ThreadPoolExecutor,
-                 run_tracer=False, *args, **kwargs):
+                 serialize_writes=True, run_tracer=False, *args, **kwargs):
 
 
         self.max_concurrent_reqs = min(total_count, max_concurrent_requests)
@@ -99,6 +99,7 @@ class BaseVedaSetFetcher(BatchFetchTracer):
         self._img_payload_executor = img_payload_executor(max_workers=num_img_payload_threads)
         self._n_write_workers = num_write_workers
         self._n_write_threads = num_write_threads
+        self._serialize_writes = serialize_writes
         self._write_executor = write_executor(max_workers=num_write_threads)
 
         self.lbl_payload_handler = functools.partial(self._payload_handler,
@@ -172,7 +173,10 @@ class BaseVedaSetFetcher(BatchFetchTracer):
         self._source_exhausted = asyncio.Event(loop=loop)
         self._qreq = asyncio.Queue(maxsize=self.max_concurrent_reqs, loop=loop)
         self._qwrite = asyncio.Queue(loop=loop)
-        self._write_lock = asyncio.Lock(loop=loop)
+        if self._serialize_writes:
+            self._write_lock = asyncio.Lock(loop=loop)
+        else:
+            self._write_lock = asyncio.Semaphore(self._n_write_threads, loop=loop)
         self._consumers = [asyncio.ensure_future(self.consume_reqs(), loop=loop) for _ in range(self.max_concurrent_reqs)]
         self._writers = [asyncio.ensure_future(self.write_stack(), loop=loop) for _ in range(self._n_write_workers)]
 
@@ -255,15 +259,50 @@ class VedaStreamFetcher(BaseVedaSetFetcher):
     def __init__(self, streamer, **kwargs):
         self.streamer = streamer
         super(VedaStreamFetcher, self).__init__(**kwargs)
+        self.paused = False
+        self._resumed = None
+
+    def resume(self):
+        """ Lets request production continue, called on the loop once the stream drains to its low watermarks """
+        self.paused = False
+        if self._resumed is not None:
+            self._resumed.set()
+
+    def _pause(self):
+        if self._resumed is None:
+            self._resumed = asyncio.Event()
+        if not self.paused:
+            self.paused = True
+            self._resumed.clear()
+            logger.debug("STREAM PAUSED AT {}".format(self.streamer.occupancy))
+
+    async def _wait_for_room(self, poll=1.0):
+        """ Once the stream reaches a high watermark, waits until it drains to the low
+        watermarks. Consumers resume() production, the poll only guards against a
+        missed wakeup. """
+        if self.streamer._above_high():
+            self._pause()
+        while self.paused:
+            if self.streamer._below_low():
+                self.paused = False
+                break
+            try:
+                await asyncio.wait_for(self._resumed.wait(), poll)
+            except asyncio.TimeoutError:
+                pass
 
     async def write_stack(self):
         await asyncio.sleep(0.0)
         while True:
             try:
-                item = await self._qwrite.get()
-                self.streamer._buf.append(item)
+                label, image = await self._qwrite.get()
                 async with self._write_lock:
-                    self.streamer._q.put_nowait(item)
+                    # Copies the sample into the stream's ring off the loop thread
+                    await self.loop.run_in_executor(self._write_executor, self.streamer._buf.put, label, image)
+                    self.streamer._in_flight -= 1
+                # The first sample sizes the byte budget, which may leave room to resume
+                if self.paused and self.streamer._below_low():
+                    self.resume()
                 self._qreq.task_done()
                 self._qwrite.task_done()
             except CancelledError:
@@ -280,5 +319,9 @@ class VedaStreamFetcher(BaseVedaSetFetcher):
             if req is None:
                 self._source_exhausted.set()
                 return True
+            await self._wait_for_room()
+            self.streamer._in_flight += 1
             await self._qreq.put(req)
+            if self.streamer._above_high():
+                self._pause()
         return True
@@ -1,40 +1,94 @@
 from functools import partial
 import os
+import threading
 import numpy as np
 from pyveda.fetch.aiohttp.client import ThreadedAsyncioRunner, VedaBaseFetcher
+from pyveda.fetch.partition import PartitionedWriter
+from pyveda.vedaset.store.metadata import sample_metadata
+
+def _append(node, images, labels, metadata, start, stop):
+    if metadata is None:
+        node.append_batch(images[start:stop], labels[start:stop])
+    else:
+        node.append_batch(images[start:stop], labels[start:stop], metadata=metadata[start:stop])
 
 def vedabase_batch_write(data, database=None, partition=[70, 20, 10]):
     trainp, testp, valp = partition
-    images, labels = data
+    images, labels = data[:2]
+    metadata = data[2] if len(data) > 2 else None
     batch_size = images.shape[0]
     ntrain = round(batch_size * (trainp * 0.01))
     ntest = round(batch_size * (testp * 0.01))
     nval = round(batch_size * (valp * 0.01))
 
     # write training data
-    database.train.images.append_batch(images[:ntrain])
-    database.train.labels.append_batch(labels[:ntrain])
+    _append(database.train, images, labels, metadata, 0, ntrain)
 
     # write testing data
-    database.test.images.append_batch(images[ntrain:ntrain + ntest])
-    database.test.labels.append_batch(labels[ntrain:ntrain + ntest])
+    _append(database.test, images, labels, metadata, ntrain, ntrain + ntest)
 
     # write validation data
-    database.validate.images.append_batch(images[ntrain + ntest:])
-    database.validate.labels.append_batch(labels[ntrain + ntest:])
+    _append(database.validate, images, labels, metadata, ntrain + ntest, None)
+
+def _label_with_metadata(item, handler=None):
+    """ Parses a label payload, keeping the datapoint id, bounds and tile coords it carries """
+    return handler(item), sample_metadata(item)
+
+def _split_metadata(items, transform=None):
+    # Failed fetches come through as bare payloads without metadata
+    items = [item if isinstance(item, tuple) else (item, None) for item in items]
+    return transform([label for label, _ in items]), [meta for _, meta in items]
+
+def _write_with_metadata(data, write_fn=None):
+    images, (labels, metadata) = data
+    return write_fn([images, labels, metadata])
+
+class _Checkpointer(object):
+    """ Flushes the writer every `every` written samples, so a crash loses at most that many """
+    def __init__(self, writer, write_fn, every):
+        self._writer = writer
+        self._write_fn = write_fn
+        self._every = every
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, data):
+        self._write_fn(data)
+        with self._lock:
+            self._written += len(data[0])
+            if self._written >= self._every:
+                self._writer.flush()
+                self._written = 0
 
-def build_vedabase(database, source, partition, total, token, label_threads=1, image_threads=10):
+def build_vedabase(database, source, partition, total, token, label_threads=1, image_threads=10,
+                   write_threads=4, checkpoint=None, seed=0, stratify=False, batch_rows=256):
+    # Stores that commit independent chunks (directory backend) accept concurrent writes
+    concurrent = getattr(database, "_concurrent_writes", False)
+    # Samples are split by datapoint id, stores with a metadata table also record the
+    # ids with the bounds and tile coords
+    writer = PartitionedWriter(database, partition, seed=seed, stratify=stratify, batch_rows=batch_rows)
+    write_fn = partial(_write_with_metadata, write_fn=writer)
+    lbl_batch_transform = partial(_split_metadata, transform=database._label_klass._batch_transform)
+    lbl_payload_handler = partial(_label_with_metadata,
+                                  handler=partial(database._label_klass._payload_handler,
+                                                  klasses=database.classes,
+                                                  out_shape=database.image_shape))
+    if checkpoint:
+        write_fn = _Checkpointer(writer, write_fn, checkpoint)
     abf = VedaBaseFetcher(source, total_count=total, token=token,
-                          write_fn=partial(vedabase_batch_write, database=database, partition=partition),
+                          serialize_writes=not concurrent,
+                          num_write_workers=write_threads if concurrent else 1,
+                          num_write_threads=write_threads if concurrent else 1,
+                          write_fn=write_fn,
                           img_batch_transform=database._image_klass._batch_transform,
-                          lbl_batch_transform=database._label_klass._batch_transform,
+                          lbl_batch_transform=lbl_batch_transform,
                           img_payload_handler=database._image_klass._payload_handler,
-                          lbl_payload_handler=partial(database._label_klass._payload_handler,
-                                                      klasses=database.classes,
-                                                      out_shape=database.image_shape),
+                          lbl_payload_handler=lbl_payload_handler,
                           num_lbl_payload_threads=label_threads, num_img_payload_threads=image_threads)
 
     with ThreadedAsyncioRunner(abf.run_loop, abf.start_fetch) as tar:
         tar(loop=tar._loop)
+    writer.flush()
+    return writer.partitioner
 
 
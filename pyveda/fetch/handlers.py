@@ -30,11 +30,7 @@ class NDImageHandler(object):
             fd.file.write(bstring)
             fd.file.flush()
             fd.close()
-            arr = imread(fd.name)
-            if len(arr.shape) == 3:
-                arr = np.rollaxis(arr, 2, 0)
-            else:
-                arr = np.expand_dims(arr, axis=0)
+            arr = NDImageHandler._path_to_array(fd.name)
         except Exception as e:
             arr = NDImageHandler._on_fail()
         finally:
@@ -43,6 +39,19 @@ class NDImageHandler(object):
         return arr
 
 
+    @staticmethod
+    def _path_to_array(path):
+        """ Reads a local image tile or .npy file as a band-first array """
+        if path.endswith(".npy"):
+            return np.load(path)
+        arr = imread(path)
+        if len(arr.shape) == 3:
+            arr = np.rollaxis(arr, 2, 0)
+        else:
+            arr = np.expand_dims(arr, axis=0)
+        return arr
+
+
 class BaseLabelHandler(object):
     @staticmethod
     def _get_transform(bounds, height, width):
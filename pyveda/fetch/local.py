@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from pyveda.fetch.handlers import NDImageHandler
+from pyveda.fetch.partition import PartitionedWriter, PARTITIONS
+from pyveda.vedaset.store.metadata import sample_metadata
+
+has_tqdm = False
+try:
+    from tqdm import tqdm
+    has_tqdm = True
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".tif", ".tiff", ".png", ".jpg", ".jpeg", ".npy")
+LABEL_EXTENSIONS = (".json", ".geojson")
+
+
+def find_samples(dirpath):
+    """
+    Pairs every image tile under dirpath with the label file sharing its name,
+    e.g. tiles/0001.tif and tiles/0001.json. Tiles without a label are skipped.
+
+    Returns:
+        list: (image path, label path) tuples in sorted order
+    """
+    samples = []
+    for root, dirs, files in os.walk(dirpath):
+        dirs.sort()
+        names = set(files)
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in IMAGE_EXTENSIONS:
+                continue
+            for label_ext in LABEL_EXTENSIONS:
+                if stem + label_ext in names:
+                    samples.append((os.path.join(root, name), os.path.join(root, stem + label_ext)))
+                    break
+            else:
+                logger.info("NO LABEL FOR TILE: {}".format(os.path.join(root, name)))
+    return samples
+
+
+def _read_label(label):
+    """ Loads a label file into the Veda label format the label handlers parse.
+    Bare {class: label} mappings are wrapped as a feature's properties. """
+    if isinstance(label, str):
+        with open(label) as f:
+            label = json.load(f)
+    if "properties" not in label:
+        label = {"properties": {"label": label}}
+    return label
+
+
+def read_image(image):
+    """ Reads an image tile path, e.g. a GeoTIFF or .npy file, or passes an array through """
+    if isinstance(image, str):
+        return NDImageHandler._path_to_array(image)
+    return np.asarray(image)
+
+
+def _load_batch(samples, label_handler=None, image_shape=None):
+    """ Decodes a batch of samples in a worker process, dropping any that fail """
+    images, labels, metadata, failed = [], [], [], 0
+    for image, label in samples:
+        try:
+            arr = read_image(image)
+            if image_shape is not None and list(arr.shape) != list(image_shape):
+                raise ValueError("Image shape {} does not match {}".format(arr.shape, image_shape))
+            doc = _read_label(label)
+            lbl = label_handler(doc)
+            meta = sample_metadata(doc)
+        except Exception as e:
+            logger.info("FAILED TO LOAD {}: {}".format(image, e))
+            failed += 1
+            continue
+        images.append(arr)
+        labels.append(lbl)
+        metadata.append(meta)
+    return images, labels, metadata, failed
+
+
+def _batches(samples, batch_size):
+    batch = []
+    for sample in samples:
+        batch.append(sample)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest(database, source, partition=[70, 20, 10], batch_size=256, workers=None, seed=0, stratify=False):
+    """
+    Fills a VedaBase from local image tiles and labels without the Veda API.
+    Tiles are decoded by a pool of processes and written from this process with
+    batched append_batch calls.
+
+    Args:
+        database (VedaBase): Target store, its classes and image_shape drive the label handlers
+        source (str or iterable): A directory of tiles and same-named .json/.geojson labels, or an
+            iterable of (image, label) pairs. Images are paths (GeoTIFF, PNG, JPEG or band-first .npy)
+            or arrays, labels are paths, Veda label features or {class: label} dicts. The id, bounds
+            and tile_coords properties of label features are recorded in the store's metadata table.
+        partition (list): Percentages of samples to write to [train, test, validate]
+        batch_size (int): Samples decoded per task and written per append_batch
+        workers (int): Number of decoding processes, defaults to the cpu count. 0 decodes in this process.
+        seed (int): Seed of the hash assigning samples to partitions, see StreamingPartitioner
+        stratify (bool): Balance class presence over the partitions
+    Returns:
+        dict: Written and failed sample counts, elapsed seconds, samples/sec and samples per partition
+    """
+    samples = find_samples(source) if isinstance(source, str) else source
+    total = len(samples) if hasattr(samples, "__len__") else None
+    load = partial(_load_batch,
+                   label_handler=partial(database._label_klass._payload_handler,
+                                         klasses=database.classes,
+                                         out_shape=database.image_shape),
+                   image_shape=database.image_shape)
+    write = PartitionedWriter(database, partition, seed=seed, stratify=stratify, batch_rows=batch_size)
+    pbar = tqdm(total=total) if has_tqdm and total else None
+    stats = {"count": 0, "failed": 0}
+    start = time.time()
+
+    def _write(result):
+        images, labels, metadata, failed = result
+        stats["failed"] += failed
+        if images:
+            write([database._image_klass._batch_transform(images),
+                   database._label_klass._batch_transform(labels), metadata])
+            stats["count"] += len(images)
+        if pbar is not None:
+            pbar.update(len(images) + failed)
+        logger.info("SUCCESS WRITE {} DATAPOINTS ({:.1f} samples/sec)".format(
+            len(images), stats["count"] / max(time.time() - start, 1e-9)))
+
+    if workers == 0:
+        for batch in _batches(samples, batch_size):
+            _write(load(batch))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers) as executor:
+            # Keep a bounded number of batches in flight so decoded tiles never
+            # pile up in memory faster than they are written
+            pending, depth = deque(), 2 * workers
+            for batch in _batches(samples, batch_size):
+                pending.append(executor.submit(load, batch))
+                if len(pending) >= depth:
+                    _write(pending.popleft().result())
+            while pending:
+                _write(pending.popleft().result())
+
+    write.flush()
+    if pbar is not None:
+        pbar.close()
+    stats["seconds"] = time.time() - start
+    stats["rate"] = stats["count"] / max(stats["seconds"], 1e-9)
+    stats["partitions"] = dict(zip(PARTITIONS, write.partitioner.counts.tolist()))
+    logger.info("INGESTED {count} DATAPOINTS, {failed} FAILED, {rate:.1f} samples/sec".format(**stats))
+    return stats
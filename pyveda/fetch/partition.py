@@ -0,0 +1,175 @@
+import hashlib
+import threading
+import numpy as np
+
+PARTITIONS = ["train", "test", "validate"]
+
+
+def _unit_hash(key, seed):
+    """ Maps a key to a uniform float in [0, 1), stable across processes and runs """
+    digest = hashlib.blake2b("{}:{}".format(seed, key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") / 2.0 ** 64
+
+
+class StreamingPartitioner(object):
+    """
+    Assigns samples to partitions as they stream in, in a single pass. Every sample
+    goes to the partition its hashed datapoint id (and seed) falls in, so the same
+    collection and seed always split the same way, whatever the batch sizes.
+    Samples without an id are hashed by arrival order instead.
+
+    With stratify, class presence is balanced as well: every sample belongs to the
+    stratum of its rarest class seen so far (or a background stratum), and once a
+    partition falls a whole sample behind its share of a stratum the next sample of
+    that stratum goes there instead of where its hash points. Assignments then also
+    depend on the order samples arrive in.
+
+    Args:
+        fractions (list): Relative partition sizes, e.g. [70, 20, 10]
+        seed (int): Hash seed
+        stratify (bool): Balance class presence over the partitions
+        nclasses (int): Number of classes, required to stratify
+
+    Attributes:
+        counts (ndarray): Samples assigned to every partition
+    """
+    def __init__(self, fractions=[70, 20, 10], seed=0, stratify=False, nclasses=None):
+        fractions = np.asarray(fractions, dtype=np.float64)
+        if fractions.min() < 0 or not fractions.sum():
+            raise ValueError("Partition fractions must be non-negative and not all zero")
+        if stratify and not nclasses:
+            raise ValueError("Stratifying needs the number of classes")
+        self.fractions = fractions / fractions.sum()
+        self._edges = np.cumsum(self.fractions)
+        self._edges[-1] = 1.0
+        self.seed = seed
+        self.stratify = stratify
+        self.counts = np.zeros(len(fractions), dtype=np.int64)
+        # One row per class plus a last row for samples without any class
+        self.strata = np.zeros((nclasses + 1, len(fractions)), dtype=np.int64) if stratify else None
+        self._seq = 0
+
+    def _draw(self, key):
+        if not key:
+            key = "#{}".format(self._seq)
+        self._seq += 1
+        return int(np.searchsorted(self._edges, _unit_hash(key, self.seed), side="right"))
+
+    def _stratum(self, hits):
+        present = np.flatnonzero(hits > 0)
+        if not present.size:
+            return len(self.strata) - 1
+        return int(present[np.argmin(self.strata[present].sum(axis=1))])
+
+    def assign(self, ids=None, hits=None, n=None):
+        """
+        Args:
+            ids (list): Datapoint ids, None entries are hashed by arrival order
+            hits (ndarray): (n, nclasses) class counts per sample, required to stratify
+            n (int): Number of samples when ids is None
+        Returns:
+            ndarray: Partition index of every sample
+        """
+        if ids is None:
+            ids = [None] * n
+        if self.stratify and hits is None:
+            raise ValueError("Stratifying needs the class counts of every sample")
+        out = np.empty(len(ids), dtype=np.int64)
+        for idx, key in enumerate(ids):
+            part = self._draw(key)
+            if self.stratify:
+                stratum = self._stratum(hits[idx])
+                deficit = self.fractions * (self.strata[stratum].sum() + 1) - self.strata[stratum]
+                if deficit.max() >= 1:
+                    part = int(np.argmax(deficit))
+                self.strata[stratum, part] += 1
+            self.counts[part] += 1
+            out[idx] = part
+        return out
+
+    @property
+    def ratios(self):
+        """ Realized share of samples per partition """
+        return self.counts / float(max(self.counts.sum(), 1))
+
+
+def _take(items, sel):
+    if items is None:
+        return None
+    if isinstance(items, np.ndarray):
+        return items[sel]
+    return [items[i] for i in sel]
+
+
+def _concat(parts):
+    if parts[0] is None:
+        return None
+    if isinstance(parts[0], np.ndarray):
+        return np.concatenate(parts)
+    return [item for part in parts for item in part]
+
+
+class PartitionedWriter(object):
+    """
+    Write stage of a store build: assigns the samples of every fetched batch to
+    partitions with a StreamingPartitioner and appends them to each partition in
+    batches of batch_rows, so small fetch batches neither skew the split nor turn
+    into many tiny appends. Call flush() once the fetch is done to write the rest.
+
+    Args:
+        database (VedaBase): Target store
+        partition (list): Percentages of samples to write to [train, test, validate]
+        seed (int): Hash seed of the assignment
+        stratify (bool): Balance class presence over the partitions
+        batch_rows (int): Samples held per partition before appending them
+    """
+    def __init__(self, database, partition=[70, 20, 10], seed=0, stratify=False, batch_rows=256):
+        self._database = database
+        self._names = PARTITIONS[:len(partition)]
+        self.partitioner = StreamingPartitioner(partition, seed=seed, stratify=stratify,
+                                                nclasses=len(database.classes))
+        self._batch_rows = batch_rows
+        self._pending = [[] for _ in self._names]
+        self._records_metadata = getattr(database, "_records_metadata", False)
+        self._lock = threading.Lock()
+
+    def __call__(self, data):
+        """ Writes [images, labels] or [images, labels, metadata], as built by the fetchers """
+        images, labels = data[:2]
+        metadata = data[2] if len(data) > 2 else None
+        ids = None
+        if metadata is not None:
+            ids = [meta[0].decode() if meta is not None else None for meta in metadata]
+        hits = None
+        if self.partitioner.stratify:
+            hits = self._database._label_klass._hits(labels, len(self._database.classes))
+        ready = []
+        with self._lock:
+            parts = self.partitioner.assign(ids, hits=hits, n=len(images))
+            for idx, pending in enumerate(self._pending):
+                sel = np.flatnonzero(parts == idx)
+                if sel.size:
+                    pending.append((images[sel], _take(labels, sel), _take(metadata, sel)))
+                if sum([len(batch[0]) for batch in pending]) >= self._batch_rows:
+                    ready.append((idx, self._pop(idx)))
+        for idx, batch in ready:
+            self._append(idx, *batch)
+
+    def _pop(self, idx):
+        pending, self._pending[idx] = self._pending[idx], []
+        return [_concat([batch[k] for batch in pending]) for k in range(3)]
+
+    def _append(self, idx, images, labels, metadata):
+        node = getattr(self._database, self._names[idx])
+        if metadata is None or not self._records_metadata:
+            node.append_batch(images, labels)
+        else:
+            node.append_batch(images, labels, metadata=metadata)
+
+    def flush(self):
+        """ Appends every held sample and flushes the store """
+        with self._lock:
+            ready = [(idx, self._pop(idx)) for idx in range(len(self._names)) if self._pending[idx]]
+        for idx, batch in ready:
+            self._append(idx, *batch)
+        self._database.flush()
@@ -0,0 +1,15 @@
+def framework_loader(fw):
+    """ Per-sample output transform returning framework-native tensors for a VedaBase framework """
+    if fw == "PyTorch":
+        from pyveda.frameworks.pytorch import to_tensor, _require_torch
+        _require_torch()
+        return to_tensor
+    if fw == "TensorFlow":
+        from pyveda.frameworks.tf import to_tensor, _require_tf
+        _require_tf()
+        return to_tensor
+    return _identity
+
+
+def _identity(x):
+    return x
@@ -3,6 +3,7 @@ import math
 from random import choice
 
 from pyveda.frameworks.transforms import *
+from pyveda.frameworks.samplers import ClassSampler, BlockShuffler, chunk_reads
 
 
 def transform_b(revised_y_lst):
@@ -18,17 +19,25 @@ class BaseGenerator():
     batch_size (int): Number of samples in batch
     steps (int): Number of steps of batches to run in one epoch. If not provided, will calculate maximum possible number of complete batches
     loop (Boolean): Loop batcher indefinitely. If false, StopIteration is thrown after one epoch.
-    shuffle (Boolean): Shuffle data between epochs.
+    shuffle (Boolean or str): Shuffle data between epochs. "block" shuffles whole storage chunks and
+        then samples within windows of shuffle_window samples, so batches read few chunks of compressed stores
     channels_last (Boolean): To return image data as Height-Width-Depth, instead of the default Depth-Height-Width
-    rescale (Boolean): Return images rescaled to values between 0 and 1
+    rescale (Boolean or str): Return images rescaled to values between 0 and 1. Uses the per-band
+        min/max recorded in the store when available, "standard" normalizes to zero mean and unit variance.
     flip_horizontal (Boolean): Horizontally flip image and labels (50% probability)
     flip_vertical (Boolean): Vertically flip image and labels (50% probability)
     pad (int): Pad image with zeros to this dimension.
+    sampler (str or array): Draw every epoch's samples with replacement instead of shuffling:
+        "balanced" gives every class equal draws, "inverse_frequency" weights samples by the
+        inverse frequency of their classes, or an array gives a weight per sample.
+        Class presence is read once from the partition's hit counts.
+    shuffle_window (int): Samples shuffled together by the block shuffle, defaults to batch_size.
+        Larger windows give more random batches that read more chunks, see chunk_reads_per_batch
     '''
 
     def __init__(self, cache, batch_size=32, steps=None, loop=True, shuffle=True, channels_last=False, expand_dims=False, rescale=False,
                     flip_horizontal=False, flip_vertical=False, pad=None, label_transform=None, batch_label_transform=None,
-                    image_transform=None):
+                    image_transform=None, sampler=None, shuffle_window=None):
         self.cache = cache
         self.batch_size = batch_size
         self.epoch = 1
@@ -41,11 +50,19 @@ class BaseGenerator():
         self.loop = loop
         self.id_lut = np.arange(len(self.cache))
         self.shuffle = shuffle
-        if self.shuffle:
+        self._chunks = None
+        self._shuffler = None
+        if isinstance(shuffle, str) and shuffle == "block":
+            self._shuffler = BlockShuffler(self.chunk_ids, shuffle_window or batch_size)
+        self._sampler = None
+        if sampler is not None and not (isinstance(sampler, str) and sampler == "uniform"):
+            self._sampler = ClassSampler.from_node(self.cache, sampler)
+        if self.shuffle or self._sampler is not None:
             self.shuffle_ids()
         self.channels_last = channels_last
         self.expand_dims = expand_dims
         self.rescale = rescale
+        self._norm = self._normalizer(rescale)
         self.flip_h = flip_horizontal
         self.flip_v = flip_vertical
         self.pad = pad
@@ -70,13 +87,67 @@ class BaseGenerator():
     def mltype(self):
         return self.cache._vset.mltype
 
+    @property
+    def _per_sample(self):
+        ''' True when samples must be transformed one at a time rather than as a stacked batch '''
+        return any([self.flip_h, self.flip_v, self.image_transform, self.label_transform,
+                    self.mltype == "object_detection"])
+
     @property
     def shape(self):
         return self.cache._vset.image_shape
 
+    def _normalizer(self, rescale):
+        ''' Per-band (scale, offset) from the store's precomputed stats, shaped to broadcast over a batch '''
+        if not rescale:
+            return None
+        method = "minmax" if rescale is True else rescale
+        stats = getattr(getattr(self.cache, "_vset", None), "stats", None)
+        if stats is None or not stats.count.any():
+            if method != "minmax":
+                raise ValueError("Normalizing with {} requires image stats, see compute_stats".format(method))
+            return None
+        scale, offset = stats.normalizer(method)
+        if not self.channels_last:
+            dims = (len(self.shape) - 1) * (1,)
+            scale, offset = scale.reshape(-1, *dims), offset.reshape(-1, *dims)
+        return scale, offset
+
+    def _rescale(self, x):
+        ''' Normalizes a float batch in place '''
+        if self._norm is None:
+            x /= x.max()
+            return x
+        scale, offset = self._norm
+        x *= scale
+        x += offset
+        return x
+
     def shuffle_ids(self):
-        ''' shuffle the ID lookup table '''
-        np.random.shuffle(self.id_lut)
+        ''' shuffle the ID lookup table, or draw the next epoch's samples with the sampler '''
+        if self._sampler is not None:
+            # Only the samples the epoch consumes, so balanced draws stay balanced
+            self.id_lut = self._sampler.plan(self.last_step * self.batch_size)
+        elif self._shuffler is not None:
+            self.id_lut = self._shuffler.plan()
+        else:
+            np.random.shuffle(self.id_lut)
+
+    @property
+    def chunk_ids(self):
+        ''' Storage chunk of every sample, or one chunk per sample when the store has no chunks '''
+        if self._chunks is None:
+            images = getattr(self.cache, "images", None)
+            if hasattr(images, "chunk_ids"):
+                self._chunks = images.chunk_ids()
+            else:
+                self._chunks = np.arange(len(self.cache))
+        return self._chunks
+
+    @property
+    def chunk_reads_per_batch(self):
+        ''' Expected chunk reads per batch of the current epoch '''
+        return chunk_reads(self.chunk_ids, self.id_lut, self.batch_size)
 
     def apply_augmentations(self, x, y):
         """ Applies all built-in transforms, returns augmented x/y
@@ -119,7 +190,7 @@ class BaseGenerator():
             else:
                 self.epoch += 1
                 self.step = 1
-                if self.shuffle:
+                if self.shuffle or self._sampler is not None:
                     self.shuffle_ids()
         batch = self.build_batch(self.step)
         self.step += 1
@@ -149,37 +220,46 @@ class VedaStoreGenerator(BaseGenerator):
         '''Generates data containing batch_size samples
         optionally pre-processes the data'''
 
-        #setup empty batch
-        if self.channels_last:
-            x = np.empty((self.batch_size, *self.shape[::-1]))
+        images, labels = self.cache.read_batch(batch_ids)
+
+        if not self._per_sample:
+            x = np.asarray(images, dtype=np.float64)
+            if self.channels_last:
+                x = np.ascontiguousarray(x.transpose(0, *range(x.ndim - 1, 0, -1)))
+            y = labels
+            if self.expand_dims:
+                y = np.expand_dims(y, 3)
         else:
-            x = np.empty((self.batch_size, *self.shape))
+            #setup empty batch
+            if self.channels_last:
+                x = np.empty((self.batch_size, *self.shape[::-1]))
+            else:
+                x = np.empty((self.batch_size, *self.shape))
 
-        y = []
+            y = []
 
-        for i, _id in enumerate(batch_ids):
-            x_img = self.cache.images[int(_id)]
-            y_img = self.cache.labels[int(_id)]
+            for i in range(len(batch_ids)):
+                x_img, y_img = images[i], labels[i]
 
-            x_img, y_img = self.apply_augmentations(x_img, y_img)
+                x_img, y_img = self.apply_augmentations(x_img, y_img)
 
-            if self.channels_last:
-                x_img = x_img.T
+                if self.channels_last:
+                    x_img = x_img.T
 
-            if self.image_transform:
-                x_img = self.image_transform(x_img)
+                if self.image_transform:
+                    x_img = self.image_transform(x_img)
 
-            if self.expand_dims:
-                y_img = np.expand_dims(y_img, 2)
+                if self.expand_dims:
+                    y_img = np.expand_dims(y_img, 2)
 
-            if self.label_transform:
-                y_img = [self.label_transform((_y, indx)) for indx, _x in enumerate(y_img) for _y in _x]
+                if self.label_transform:
+                    y_img = [self.label_transform((_y, indx)) for indx, _x in enumerate(y_img) for _y in _x]
 
-            x[i, ] = x_img
-            y.append(y_img)
+                x[i, ] = x_img
+                y.append(y_img)
 
         if self.rescale:
-            x /= x.max()
+            x = self._rescale(x)
 
         if self.pad:
             x = pad(x, self.pad, self.channels_last)
@@ -237,7 +317,7 @@ class VedaStreamGenerator(BaseGenerator):
                 y.append(y_img)
 
         if self.rescale:
-            x /= x.max()
+            x = self._rescale(x)
 
         if self.pad:
             x = pad(x, self.pad, self.channels_last)
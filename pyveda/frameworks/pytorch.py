@@ -0,0 +1,178 @@
+import numpy as np
+
+has_torch = False
+try:
+    import torch
+    from torch.utils.data import Dataset, IterableDataset, DataLoader, BatchSampler, RandomSampler, \
+        SequentialSampler, get_worker_info
+    has_torch = True
+except ImportError:
+    Dataset = IterableDataset = object
+
+
+def _require_torch():
+    if not has_torch:
+        raise ImportError("PyTorch adapters require torch, install it with `pip install torch`")
+
+
+def to_tensor(x):
+    """ Wraps arrays as torch tensors sharing their memory, other labels are returned unchanged """
+    if isinstance(x, np.ndarray):
+        if not x.flags.writeable:
+            x = x.copy()
+        return torch.from_numpy(np.ascontiguousarray(x))
+    return x
+
+
+def _shard_range(n, block_rows):
+    """ The [start, stop) positions of the current DataLoader worker, in whole blocks """
+    info = get_worker_info()
+    if info is None or info.num_workers < 2:
+        return 0, n
+    nblocks = -(-n // block_rows)
+    bounds = np.linspace(0, nblocks, info.num_workers + 1).astype(np.int64) * block_rows
+    return min(int(bounds[info.id]), n), min(int(bounds[info.id + 1]), n)
+
+
+class VedaDataset(Dataset):
+    """
+    Map-style torch Dataset over a VedaBase partition (any node with read_batch).
+    Indexing with a list of positions reads the whole batch at once, so
+    `DataLoader(ds, sampler=BatchSampler(...), batch_size=None)` (see `dataloader`)
+    gets batched tensors straight from the store without per-sample reads or
+    collation copies. `__getitems__` gives the default DataLoader batched reads too.
+
+    Args:
+        node: Partition, e.g. vb.train
+        transform (callable): Applied to every image batch or sample before conversion
+        target_transform (callable): Applied to every label batch or sample before conversion
+    """
+    def __init__(self, node, transform=None, target_transform=None):
+        _require_torch()
+        self.node = node
+        self.transform = transform
+        self.target_transform = target_transform
+
+    def __len__(self):
+        return len(self.node)
+
+    def _convert(self, images, labels):
+        if self.transform is not None:
+            images = self.transform(images)
+        if self.target_transform is not None:
+            labels = self.target_transform(labels)
+        return to_tensor(images), to_tensor(labels)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            images, labels = self.node.read_batch([idx])
+            return self._convert(images[0], labels[0])
+        images, labels = self.node.read_batch(idx)
+        return self._convert(images, labels)
+
+    def __getitems__(self, indices):
+        images, labels = self.node.read_batch(indices)
+        return [self._convert(image, label) for image, label in zip(images, labels)]
+
+
+class VedaIterableDataset(IterableDataset):
+    """
+    Iterable torch Dataset split across DataLoader workers.
+
+    Over a VedaBase partition every worker reads its own contiguous share of
+    blocks. A VedaStream fetches on a background thread of the process that
+    opened it, so with several workers pass a factory instead: it is called in
+    every worker as factory(worker_id, num_workers) and must return that worker's
+    share of the stream, e.g. a stream over a disjoint subset of sample ids.
+
+    Args:
+        source: Partition with read_batch, a BufferedSampleArray, or a factory of either
+        batch_size (int): Yield batches of this size instead of samples
+        shuffle (bool): Shuffle the order of blocks and of samples within them (partitions only)
+        seed (int): Shuffle seed, combined with the worker id
+        block_rows (int): Samples read at a time from a partition
+    """
+    def __init__(self, source, batch_size=None, shuffle=False, seed=None, block_rows=256):
+        _require_torch()
+        self.source = source
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.block_rows = block_rows
+
+    def _resolve(self):
+        source = self.source
+        if callable(source) and not hasattr(source, "read_batch") and not hasattr(source, "__next__"):
+            info = get_worker_info()
+            return source(info.id if info else 0, info.num_workers if info else 1)
+        return source
+
+    def _samples(self, source):
+        if not hasattr(source, "read_batch"):
+            info = get_worker_info()
+            if info is not None and info.num_workers > 1 and source is self.source:
+                raise ValueError("Stream partitions cannot be shared by DataLoader workers, "
+                                 "pass a factory building each worker's stream")
+            for image, label in source:
+                yield image, label
+            return
+        start, stop = _shard_range(len(source), self.block_rows)
+        info = get_worker_info()
+        rng = np.random.RandomState(None if self.seed is None else self.seed + (info.id if info else 0))
+        blocks = list(range(start, stop, self.block_rows))
+        if self.shuffle:
+            rng.shuffle(blocks)
+        for begin in blocks:
+            positions = np.arange(begin, min(begin + self.block_rows, stop))
+            if self.shuffle:
+                rng.shuffle(positions)
+            images, labels = source.read_batch(positions)
+            for image, label in zip(images, labels):
+                yield image, label
+
+    def __iter__(self):
+        source = self._resolve()
+        if not self.batch_size:
+            for image, label in self._samples(source):
+                yield to_tensor(image), to_tensor(label)
+            return
+        images, labels = [], []
+        for image, label in self._samples(source):
+            images.append(image)
+            labels.append(label)
+            if len(images) == self.batch_size:
+                yield self._batch(images, labels)
+                images, labels = [], []
+        if images:
+            yield self._batch(images, labels)
+
+    @staticmethod
+    def _batch(images, labels):
+        labels = np.stack(labels) if isinstance(labels[0], np.ndarray) else labels
+        return to_tensor(np.stack(images)), to_tensor(labels)
+
+
+def dataloader(node, batch_size, shuffle=True, drop_last=False, transform=None, target_transform=None,
+               **kwargs):
+    """
+    Builds a DataLoader yielding batched tensors with one batch read per step.
+    Keyword arguments such as num_workers and pin_memory go to DataLoader; VedaBase
+    stores are reopened read-only in every worker.
+
+    Args:
+        node: Partition, e.g. vb.train
+        batch_size (int): Samples per batch
+        shuffle (bool): Sample in random order
+        drop_last (bool): Drop the last incomplete batch
+    Returns:
+        torch.utils.data.DataLoader
+    """
+    _require_torch()
+    dataset = VedaDataset(node, transform=transform, target_transform=target_transform)
+    sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+    kwargs.setdefault("collate_fn", _identity)
+    return DataLoader(dataset, sampler=BatchSampler(sampler, batch_size, drop_last), batch_size=None, **kwargs)
+
+
+def _identity(batch):
+    return batch
@@ -0,0 +1,123 @@
+import numpy as np
+
+SAMPLERS = ("uniform", "balanced", "inverse_frequency")
+
+
+def class_presence(node):
+    """
+    Per-sample class presence of a partition, from its recorded hit counts rather
+    than decoded labels.
+
+    Returns:
+        ndarray: (n, nclasses + 1) bool, the last column marks samples without any class
+    """
+    hits = np.asarray(node.hit_counts()) > 0
+    return np.concatenate([hits, ~hits.any(axis=1, keepdims=True)], axis=1)
+
+
+class ClassSampler(object):
+    """
+    Draws the sample indices of every epoch with replacement, so rare classes show
+    up in batches far more often than under a uniform shuffle.
+
+    Modes:
+        "balanced": Every class, and the samples without any class, get the same
+            number of draws, spread uniformly over the samples containing them
+        "inverse_frequency": Samples are drawn with probability proportional to the
+            sum of 1 / frequency of the classes they contain
+        weights: Samples are drawn with probability proportional to a weight array
+
+    Args:
+        presence (ndarray): (n, nclasses + 1) class presence, see class_presence
+        mode (str): "balanced" or "inverse_frequency"
+        weights (array-like): Per-sample weights, used instead of mode
+    """
+    def __init__(self, presence=None, mode="balanced", weights=None):
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64).ravel()
+            if weights.min() < 0 or not weights.sum():
+                raise ValueError("Sample weights must be non-negative and not all zero")
+            self.mode = "weights"
+            self.p = weights / weights.sum()
+            self.n = len(weights)
+            return
+        if mode not in SAMPLERS[1:]:
+            raise ValueError("Unknown sampler {}, use one of {} or a weight array".format(mode, SAMPLERS))
+        presence = np.asarray(presence, dtype=bool)
+        self.mode = mode
+        self.n = len(presence)
+        freq = presence.sum(axis=0)
+        if mode == "inverse_frequency":
+            weights = (presence / np.maximum(freq, 1)).sum(axis=1)
+            self.p = weights / weights.sum()
+        else:
+            # Members of every class, grouped class by class
+            samples, klasses = np.nonzero(presence.T)[::-1]
+            self._members = samples[np.argsort(klasses, kind="stable")]
+            self._sizes = freq[freq > 0]
+            self._offsets = np.cumsum(self._sizes) - self._sizes
+
+    @classmethod
+    def from_node(cls, node, sampler):
+        """ Builds the sampler for a partition from a mode name or a weight array """
+        if isinstance(sampler, str):
+            return cls(class_presence(node), mode=sampler)
+        sampler = np.asarray(sampler, dtype=np.float64)
+        if len(sampler) != len(node):
+            raise ValueError("Provide one weight per sample, got {} for {} samples".format(len(sampler), len(node)))
+        return cls(weights=sampler)
+
+    def plan(self, size=None, rng=np.random):
+        """
+        Args:
+            size (int): Draws, defaults to the number of samples
+            rng: numpy RandomState or the np.random module
+        Returns:
+            ndarray: Sample indices in draw order
+        """
+        size = self.n if size is None else size
+        if self.mode != "balanced":
+            return rng.choice(self.n, size=size, p=self.p)
+        k = len(self._sizes)
+        klasses = rng.permutation(np.repeat(np.arange(k), size // k + (np.arange(k) < size % k)))
+        picks = (rng.random_sample(size) * self._sizes[klasses]).astype(np.int64)
+        return self._members[self._offsets[klasses] + picks]
+
+
+def chunk_reads(chunks, plan, batch_size):
+    """ Mean number of distinct chunks read per batch when batches follow plan """
+    steps = len(plan) // batch_size
+    if not steps:
+        return 0.0
+    batches = np.sort(np.asarray(chunks)[plan[:steps * batch_size]].reshape(steps, batch_size), axis=1)
+    return float(np.mean(1 + np.count_nonzero(np.diff(batches, axis=1), axis=1)))
+
+
+class BlockShuffler(object):
+    """
+    Shuffles samples while keeping reads within few storage chunks. The chunks of
+    a partition are visited in random order, each one's samples kept together, and
+    the result is then shuffled within consecutive windows of samples. A window of
+    one batch reads about batch_size / chunk length + 1 chunks per batch; larger
+    windows mix samples of more chunks into every batch at the cost of more reads,
+    up to a full shuffle once the window covers the partition.
+
+    Args:
+        chunks (ndarray): Chunk id of every sample, see WrappedDataArray.chunk_ids
+        window (int): Samples shuffled together after permuting the chunks
+    """
+    def __init__(self, chunks, window):
+        if window < 1:
+            raise ValueError("The shuffle window must hold at least one sample")
+        self.chunks = np.asarray(chunks)
+        self.window = int(window)
+        self._blocks = np.unique(self.chunks, return_inverse=True)[1].ravel()
+        self._nblocks = int(self._blocks.max()) + 1 if len(self._blocks) else 0
+
+    def plan(self, rng=np.random):
+        """ Returns every sample index once, in shuffled order """
+        n = len(self.chunks)
+        positions = np.arange(n)
+        rank = rng.permutation(self._nblocks)
+        plan = positions[np.lexsort((positions, rank[self._blocks]))]
+        return plan[np.lexsort((rng.random_sample(n), positions // self.window))]
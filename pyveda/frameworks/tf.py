@@ -0,0 +1,135 @@
+import threading
+import numpy as np
+
+has_tf = False
+try:
+    import tensorflow as tf
+    has_tf = True
+except ImportError:
+    pass
+
+
+def _require_tf():
+    if not has_tf:
+        raise ImportError("tf.data adapters require tensorflow, install it with `pip install tensorflow`")
+
+
+def to_tensor(x):
+    """ Converts arrays to tf tensors, other labels are returned unchanged """
+    if isinstance(x, np.ndarray):
+        return tf.convert_to_tensor(x)
+    return x
+
+
+def _flatten_boxes(label):
+    """ Per-class box lists of one object detection sample as (boxes, class ids) arrays """
+    flat = [(box, klass_id) for klass_id, boxes in enumerate(label) for box in boxes]
+    return (np.array([box for box, _ in flat], dtype=np.float32).reshape(-1, 4),
+            np.array([klass_id for _, klass_id in flat], dtype=np.int32))
+
+
+def _signature(vset, image_dtype=None, label_dtype=None):
+    image_dtype = np.dtype(image_dtype or vset.image_dtype)
+    label_dtype = np.dtype(label_dtype or vset._label_klass._default_dtype)
+    image = tf.TensorSpec(shape=tuple(vset.image_shape), dtype=tf.as_dtype(image_dtype))
+    if vset.mltype == "object_detection":
+        label = (tf.TensorSpec(shape=(None, 4), dtype=tf.float32), tf.TensorSpec(shape=(None,), dtype=tf.int32))
+    elif vset.mltype == "classification":
+        label = tf.TensorSpec(shape=(len(vset.classes),), dtype=tf.as_dtype(label_dtype))
+    else:
+        label = tf.TensorSpec(shape=tuple(vset.image_shape[1:]), dtype=tf.as_dtype(label_dtype))
+    return image, label
+
+
+def tf_dataset(node, batch_size=None, shuffle=False, seed=None, block_rows=256, cycle_length=4,
+               num_parallel_calls=None, prefetch=2):
+    """
+    Builds a tf.data.Dataset over a VedaBase partition. The partition is split into
+    blocks of positions that are read by interleaved generators, cycle_length at a
+    time in parallel, so reads overlap with training. Object detection labels are
+    (boxes (n, 4) float32, class ids (n,) int32) pairs.
+
+    Reads of a store backed by a single HDF5 file are serialized with a lock, since
+    HDF5 is not thread-safe; memory-mapped, directory and sharded stores read in parallel.
+
+    Args:
+        node: Partition, e.g. vb.train
+        batch_size (int): Batch the samples, object detection labels are padded with -1
+        shuffle (bool): Shuffle the blocks every epoch and the samples within each block
+        seed (int): Shuffle seed, fixing the order within blocks
+        block_rows (int): Positions read per generator call
+        cycle_length (int): Blocks read concurrently
+        num_parallel_calls (int): Interleave parallelism, defaults to tf.data.AUTOTUNE
+        prefetch (int): Batches (or samples) prefetched, 0 disables prefetching
+    Returns:
+        tf.data.Dataset
+    """
+    _require_tf()
+    vset = node._vset
+    n = len(node)
+    nblocks = -(-n // block_rows)
+    detection = vset.mltype == "object_detection"
+    lock = threading.Lock() if hasattr(vset, "_fileh") else None
+
+    def _read_block(block):
+        positions = np.arange(block * block_rows, min((block + 1) * block_rows, n))
+        if shuffle:
+            np.random.RandomState(None if seed is None else seed + int(block)).shuffle(positions)
+        if lock is not None:
+            with lock:
+                images, labels = node.read_batch(positions)
+        else:
+            images, labels = node.read_batch(positions)
+        for image, label in zip(images, labels):
+            yield image, (_flatten_boxes(label) if detection else label)
+
+    signature = _signature(vset)
+    blocks = tf.data.Dataset.range(nblocks)
+    if shuffle:
+        blocks = blocks.shuffle(max(nblocks, 1), seed=seed, reshuffle_each_iteration=True)
+    ds = blocks.interleave(
+        lambda block: tf.data.Dataset.from_generator(_read_block, output_signature=signature, args=(block,)),
+        cycle_length=cycle_length,
+        num_parallel_calls=num_parallel_calls or tf.data.AUTOTUNE,
+        deterministic=not shuffle)
+    if batch_size:
+        if detection:
+            ds = ds.padded_batch(batch_size, padding_values=(tf.constant(0, dtype=signature[0].dtype),
+                                                             (tf.constant(-1, dtype=tf.float32),
+                                                              tf.constant(-1, dtype=tf.int32))))
+        else:
+            ds = ds.batch(batch_size)
+    if prefetch:
+        ds = ds.prefetch(prefetch)
+    return ds
+
+
+def tf_stream_dataset(stream, batch_size=None, prefetch=2, image_dtype=np.float32, label_dtype=np.float32):
+    """
+    Builds a tf.data.Dataset consuming a VedaStream partition, whose samples are
+    already fetched concurrently by the stream.
+
+    Args:
+        stream (BufferedSampleArray): Stream partition, e.g. vs.train
+        batch_size (int): Batch the samples
+        prefetch (int): Batches (or samples) prefetched, 0 disables prefetching
+        image_dtype, label_dtype: Dtypes the fetched samples are cast to
+    Returns:
+        tf.data.Dataset
+    """
+    _require_tf()
+    vset = stream._vset
+    detection = vset.mltype == "object_detection"
+    signature = _signature(vset, image_dtype=image_dtype, label_dtype=label_dtype)
+
+    def _samples():
+        for image, label in stream:
+            yield (np.asarray(image, dtype=image_dtype),
+                   _flatten_boxes(label) if detection else np.asarray(label, dtype=label_dtype))
+
+    ds = tf.data.Dataset.from_generator(_samples, output_signature=signature)
+    if batch_size:
+        ds = ds.padded_batch(batch_size) if detection else ds.batch(batch_size)
+    if prefetch:
+        ds = ds.prefetch(prefetch)
+    return ds
@@ -1,13 +1,21 @@
 import numpy as np
 import scipy.ndimage as ndi
 
-def rescale_toa(arr, dtype=np.float32):
+def rescale_toa(arr, dtype=np.float32, stats=None):
     """
     Rescale any multi-dimensional array of shape (D, M, N) by first subtracting
     the min from each (M, N) array along axis 0, then divide each by the
     resulting maximum to get (float32) distributions between [0, 1].
-    Optionally spec uint8 for 0-255 ints.
+    Optionally spec uint8 for 0-255 ints. When stats (BandStats) are given the
+    store-wide per-band min and max are used instead of the image's own.
     """
+    if stats is not None:
+        scale, offset = stats.normalizer("minmax")
+        arr_rs = (arr * scale[:, np.newaxis, np.newaxis] + offset[:, np.newaxis, np.newaxis]).astype(np.float32)
+        if dtype == np.uint8:
+            arr_rs = np.array(arr_rs*255, dtype=np.uint8)
+        return arr_rs
+
     # First look at raw value dists along bands
 
     arr_trans = np.subtract(arr, arr.min(axis=(1, 2))[:, np.newaxis, np.newaxis])
@@ -3,9 +3,12 @@ from contextlib import contextmanager
 
 from pyveda.config import VedaConfig
 from pyveda.exceptions import RemoteCollectionNotFound
-from pyveda.vedaset import VedaBase, VedaStream
+from pyveda.vedaset import VedaStream
+from pyveda.vedaset.store.layout import StorageLayout
+from pyveda.vedaset.vedaset import store_backend
 from pyveda.veda.loaders import from_geo, from_tarball
 from pyveda.fetch.compat import build_vedabase
+from pyveda.fetch.local import ingest as ingest_local, find_samples, read_image
 from pyveda.veda.api import _bec, VedaCollectionProxy
 from pyveda.models import Model 
 
@@ -14,6 +17,7 @@ cfg = VedaConfig()
 __all__ = ["search",
            "open",
            "store",
+           "ingest",
            "from_id",
            "from_name",
            "create_from_geojson",
@@ -102,7 +106,7 @@ def from_name(dataset_name):
         else:
             raise ValueError("Must provide dataset_id or dataset_name arguments")
 
-def open(dataset_id=None, dataset_name=None, filename=None, partition=[70,20,10], **kwargs):
+def open(dataset_id=None, dataset_name=None, filename=None, partition=[70,20,10], backend=None, **kwargs):
     """
     Main interface to access to remote, local and synced datasets
 
@@ -111,6 +115,7 @@ def open(dataset_id=None, dataset_name=None, filename=None, partition=[70,20,10]
       dataset_name (str): A name of an existing collection
       filename (str): A local filename for a sync'd collection (created via store)
       partition (list): A list of partition percentages for train, test, validate partitions
+      backend (str): Local store backend, one of "hdf5", "directory", "memmap", "sharded". Detected from filename when None
 
     Returns:
       Either an intance of VedaStream (via dataset_id or dataset_name) or VedaBase (when filename is not None)
@@ -129,12 +134,13 @@ def open(dataset_id=None, dataset_name=None, filename=None, partition=[70,20,10]
     if vcp:
         return _load_stream(vcp, partition=partition, **kwargs)
     if filename:
-        return _load_store(filename, **kwargs)
+        return _load_store(filename, backend=backend, **kwargs)
     raise RemoteCollectionNotFound("No Collection found on Veda for identifier: {}".format(dataset_id or dataset_name))
 
 
 def store(filename, dataset_id=None, dataset_name=None, count=None,
-          partition=[70,20,10], **kwargs):
+          partition=[70,20,10], layout=None, backend="hdf5", shard_samples=None, shard_bytes=None,
+          resume=False, checkpoint=4096, seed=0, stratify=False, **kwargs):
     """ Download a collection locally into a VedaBase hdf5 store
 
     Args:
@@ -142,7 +148,21 @@ def store(filename, dataset_id=None, dataset_name=None, count=None,
         dataset_id(str): ID of dataset
         dataset_name(str): Name of dataset, if ID is not used
         count(int): Number of items to store, default is None (store all)
-        partition[list of int]: Percentages of datapoints to allocate to [train,test,validate] groups
+        partition[list of int]: Percentages of datapoints to allocate to [train,test,validate] groups.
+            Datapoints are assigned by a hash of their id, so the same seed reproduces the split.
+        layout(StorageLayout, dict or str): Compression and chunking options, or a preset name
+            ("random", "sequential"). Expected row counts default to the partition sizes.
+        backend(str): "hdf5" for a single VedaBase file, "directory" for a chunk directory
+            that supports concurrent writers and multi-process reads, or "sharded" for a directory
+            of VedaBase shards listed in a manifest
+        shard_samples(int): Samples per shard of a sharded store
+        shard_bytes(int): Image bytes per shard of a sharded store
+        resume(bool): Continue an interrupted download into an existing store, skipping the
+            datapoints it already holds. Partially written samples are dropped first.
+        checkpoint(int): Flush the store to disk every this many samples, so an interrupted
+            download keeps everything up to the last checkpoint
+        seed(int): Seed of the hash assigning datapoints to partitions
+        stratify(bool): Also balance class presence over the partitions
 
     Returns:
         vedabase
@@ -154,22 +174,93 @@ def store(filename, dataset_id=None, dataset_name=None, count=None,
         coll = from_id(dataset_id=dataset_id)
     if dataset_name:
         coll = from_name(dataset_name = dataset_name)
-    vb = VedaBase.from_path(filename,
+    if count is None:
+        count = coll.count
+    layout = StorageLayout.from_spec(layout)
+    if layout.expectedrows is None:
+        layout.expectedrows = {name: round(count * p * 0.01)
+                               for name, p in zip(["train", "test", "validate"], partition)}
+    if backend == "sharded":
+        kwargs.update(shard_samples=shard_samples, shard_bytes=shard_bytes)
+    vb = store_backend(filename, backend).from_path(filename,
                           mltype=coll.mltype,
                           klasses=coll.classes,
                           image_shape=coll.imshape,
                           image_dtype=coll.dtype,
+                          layout=layout,
                           **kwargs)
-    if count is None:
-        count = coll.count
-    urlgen = coll.gen_sample_ids(count=count)
+    kwargs.pop("shard_samples", None)
+    kwargs.pop("shard_bytes", None)
+    done = set()
+    if resume:
+        done = _resume_store(vb, coll)
+    ids = coll.gen_sample_ids(count=count, get_urls=False)
+    urlgen = (coll._sample_urls_from_id(_id) for _id in ids if _id not in done)
     token = cfg.conn.access_token
-    build_vedabase(vb, urlgen, partition, count, token,
-                       label_threads=1, image_threads=10, **kwargs)
+    build_vedabase(vb, urlgen, partition, max(count - len(done), 1), token,
+                       label_threads=1, image_threads=10, checkpoint=checkpoint, seed=seed, stratify=stratify,
+                       **kwargs)
     vb.flush()
     return vb
 
 
+def _resume_store(vb, coll):
+    """ Readies a store for an interrupted download to continue, returning the datapoint ids it holds """
+    if not getattr(vb, "_records_metadata", False):
+        raise NotImplementedError("{} does not record datapoint ids to resume from".format(type(vb).__name__))
+    if vb.mltype != coll.mltype or list(vb.classes) != list(coll.classes):
+        raise ValueError("The store was built from a collection with a different mltype or classes")
+    vb.recover()
+    return vb.stored_ids()
+
+
+def ingest(filename, source, mltype, classes, image_shape=None, image_dtype=None,
+           partition=[70,20,10], layout=None, backend="hdf5", batch_size=256, workers=None, seed=0,
+           stratify=False, **kwargs):
+    """ Build a local VedaBase from image tiles and labels on disk, without the Veda API
+
+    Args:
+        filename(str): Name of target hdf5 file or store directory
+        source(str or list): Directory of tiles with same-named .json/.geojson labels, or a list
+            of (image, label) pairs
+        mltype(str): One of "classification", "segmentation", "object_detection"
+        classes(list): Class names, in the order labels are stored
+        image_shape(list): Band-first image shape, read from the first tile when None
+        image_dtype(dtype): Image dtype, read from the first tile when None
+        partition[list of int]: Percentages of datapoints to allocate to [train,test,validate] groups
+        layout(StorageLayout, dict or str): Compression and chunking options, or a preset name
+        backend(str): "hdf5", "directory" or "sharded", which takes shard_samples/shard_bytes kwargs
+        batch_size(int): Samples per decode task and per write
+        workers(int): Number of decoding processes, defaults to the cpu count
+        seed(int): Seed of the hash assigning samples to partitions
+        stratify(bool): Also balance class presence over the partitions
+
+    Returns:
+        vedabase
+    """
+    samples = find_samples(source) if isinstance(source, str) else list(source)
+    if not samples:
+        raise ValueError("No samples found in {}".format(source))
+    if image_shape is None or image_dtype is None:
+        first = read_image(samples[0][0])
+        image_shape = list(first.shape) if image_shape is None else image_shape
+        image_dtype = first.dtype if image_dtype is None else image_dtype
+    layout = StorageLayout.from_spec(layout)
+    if layout.expectedrows is None:
+        layout.expectedrows = {name: round(len(samples) * p * 0.01)
+                               for name, p in zip(["train", "test", "validate"], partition)}
+    vb = store_backend(filename, backend).from_path(filename,
+                          mltype=mltype,
+                          klasses=classes,
+                          image_shape=image_shape,
+                          image_dtype=image_dtype,
+                          layout=layout,
+                          **kwargs)
+    ingest_local(vb, samples, partition=partition, batch_size=batch_size, workers=workers, seed=seed,
+                 stratify=stratify)
+    return vb
+
+
 def _load_stream(vc, *args, **kwargs):
     ''' Opens a Veda collection from the server
 
@@ -182,16 +273,17 @@ def _load_stream(vc, *args, **kwargs):
     return VedaStream.from_vc(vc, *args, **kwargs)
 
 
-def _load_store(filename, **kwargs):
-    ''' Opens a Veda collection from a local hdf5 file
+def _load_store(filename, backend=None, **kwargs):
+    ''' Opens a Veda collection from a local hdf5 file, chunk directory or frozen VedaBase directory
 
     Args:
-        filename(str): Path to the hdf5 file
+        filename(str): Path to the hdf5 file or store directory
+        backend(str): One of "hdf5", "directory", "memmap", "sharded". Detected from filename when None
 
     Returns:
         VedaBase
     '''
-    return VedaBase.from_path(filename, **kwargs)
+    return store_backend(filename, backend).from_path(filename, **kwargs)
 
 def create_from_geojson(geojson, image, name, tilesize=[256,256], match="INTERSECT",
                               default_label=None, label_field=None,
@@ -9,6 +9,30 @@ from pyveda.fetch.handlers import NDImageHandler, ClassificationHandler, Segment
 from pyveda.vedaset.abstract import BaseVariableArray
 from tempfile import NamedTemporaryFile
 
+def _encode_boxes(labels):
+    """ Flattens object detection labels, one list of boxes per class for every
+    sample, into columnar box, class id and per-sample box count arrays """
+    boxes, klass_ids, counts = [], [], []
+    for label in labels:
+        n = 0
+        for klass_id, klass_boxes in enumerate(label):
+            boxes.extend(klass_boxes)
+            klass_ids.extend([klass_id] * len(klass_boxes))
+            n += len(klass_boxes)
+        counts.append(n)
+    return (np.array(boxes, dtype=np.float32).reshape(-1, 4),
+            np.array(klass_ids, dtype=np.int32),
+            np.array(counts, dtype=np.int64))
+
+
+def _decode_boxes(boxes, klass_ids, nclasses):
+    """ Rebuilds the per-class box lists of one sample from its columnar rows """
+    label = [[] for _ in range(nclasses)]
+    for box, klass_id in zip(boxes.tolist(), klass_ids.tolist()):
+        label[klass_id].append(box)
+    return label
+
+
 class WrappedDataArray(BaseVariableArray):
     def __init__(self, array, trainer, output_transform=lambda x: x):
         self._arr = array
@@ -25,7 +49,90 @@ class WrappedDataArray(BaseVariableArray):
     def _output_fn(self, item):
         return item
 
+    def _output_batch_fn(self, items):
+        return items
+
+    def _buffered(self, leaf):
+        """ Returns the store's append buffer for leaf, or None when writes go straight through """
+        factory = getattr(self._vset, "_append_buffer", None)
+        if factory is None:
+            return None
+        return factory(leaf)
+
+    def _pending(self, leaf):
+        buf = self._buffered(leaf)
+        return len(buf) if buf is not None else 0
+
+    @property
+    def _leaves(self):
+        return [self._arr]
+
+    def flush(self):
+        """ Writes appends held in the store's append buffers through to the file """
+        for leaf in self._leaves:
+            buf = self._buffered(leaf)
+            if buf is not None:
+                buf.flush()
+
+    @staticmethod
+    def _coalesce(indices):
+        """ Returns sorted unique indices, the inverse map back to request order and
+        the [start, stop) bounds of every contiguous run within the unique indices """
+        uniq, inverse = np.unique(indices, return_inverse=True)
+        breaks = np.flatnonzero(np.diff(uniq) != 1) + 1
+        starts = np.concatenate([[0], breaks])
+        stops = np.concatenate([breaks, [len(uniq)]])
+        return uniq, inverse, list(zip(uniq[starts], uniq[stops - 1] + 1))
+
+    def _read_runs(self, runs):
+        parts = [self._arr[start:stop] for start, stop in runs]
+        if len(parts) == 1:
+            return parts[0]
+        if isinstance(parts[0], np.ndarray):
+            return np.concatenate(parts)
+        return [item for part in parts for item in part]
+
+    @property
+    def _cache(self):
+        return getattr(self._vset, "_cache", None)
+
+    @property
+    def _cache_key(self):
+        return (getattr(self._vset, "_fname", None), self._arr._v_pathname)
+
+    def read_batch(self, indices):
+        """
+        Reads a batch of samples with one read per contiguous run of indices,
+        through the store's sample cache when it has one.
+
+        Args:
+            indices (array-like): Sample indices, in any order and possibly repeated
+        Returns:
+            The samples stacked along axis 0 in the requested order
+        """
+        if self._cache is not None:
+            return self._cache.read(self, indices)
+        return self._read_batch(indices)
+
+    def _read_batch(self, indices):
+        self.flush()
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        n = len(self)
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("Batch indices out of range for array of length {}".format(n))
+        if not indices.size:
+            return self._output_batch_fn(self._arr[0:0])
+        uniq, inverse, runs = self._coalesce(indices)
+        data = self._read_runs(runs)
+        if isinstance(data, np.ndarray):
+            data = data[inverse]
+        else:
+            data = [data[i] for i in inverse]
+        return self._output_batch_fn(data)
+
     def __iter__(self, spec=slice(None)):
+        self.flush()
         if isinstance(spec, slice):
             for rec in self._arr.iterrows(spec.start, spec.stop, spec.step):
                 yield self._read_transform(self._output_fn(rec))
@@ -34,9 +141,12 @@ class WrappedDataArray(BaseVariableArray):
                 yield self._read_transform(self._output_fn(rec))
 
     def __getitem__(self, spec):
+        self.flush()
         if isinstance(spec, slice):
             return list(self.__iter__(spec))
         elif isinstance(spec, int):
+            if self._cache is not None:
+                return self._read_transform(self.read_batch([spec])[0])
             return self._read_transform(self._output_fn(self._arr[spec]))
         else:
             return self._arr[spec] # let pytables throw the error
@@ -45,14 +155,29 @@ class WrappedDataArray(BaseVariableArray):
         raise NotSupportedException("For your protection, overwriting raw data in ImageTrainer is not supported.")
 
     def __len__(self):
-        return len(self._arr)
+        return len(self._arr) + self._pending(self._arr)
 
     def append(self, item):
-        self._arr.append(self._input_fn(item))
+        buf = self._buffered(self._arr)
+        if buf is None:
+            self._arr.append(self._input_fn(item))
+        else:
+            buf.append(self._input_fn(item))
 
     def append_batch(self, items):
         self.append(items)
 
+    def truncate(self, n):
+        """ Drops every sample from index n on """
+        self.flush()
+        self._arr.truncate(n)
+
+    def chunk_ids(self, indices=None):
+        """ Returns the HDF5 chunk holding every sample, samples of unchunked arrays are their own chunk """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64).ravel()
+        chunkshape = getattr(self._arr, "chunkshape", None)
+        return indices // (chunkshape[0] if chunkshape else 1)
+
     @classmethod
     def create_array(cls, *args, **kwargs):
         raise NotImplementedError
@@ -69,45 +194,166 @@ class NDImageArray(WrappedDataArray, NDImageHandler):
             return item.reshape(1, *dims)
         return item # what could this thing be, let it fail
 
+    def append(self, item):
+        item = self._input_fn(item)
+        update = getattr(self._vset, "_update_stats", None)
+        if update is not None:
+            update(item)
+        super(NDImageArray, self).append(item)
+
     @classmethod
     def create_array(cls, trainer, group, dtype):
         shape = list(trainer.image_shape)
         shape.insert(0,0)
         trainer._fileh.create_earray(group, "images",
                                      atom = _atom_from_dtype(dtype),
-                                     shape = tuple(shape))
+                                     shape = tuple(shape),
+                                     **trainer.layout.earray_kwargs(group._v_name, shape[1:]))
+
+
+def _box_hits(labels, nclasses):
+    """ Per-sample box counts for every class of a batch of object detection labels """
+    boxes, klass_ids, counts = _encode_boxes(labels)
+    return _box_hits_from_columns(klass_ids, counts, nclasses)
+
+
+def _box_hits_from_columns(klass_ids, counts, nclasses):
+    hits = np.zeros((len(counts), nclasses), dtype=np.int64)
+    np.add.at(hits, (np.repeat(np.arange(len(counts)), counts), klass_ids), 1)
+    return hits
+
+
+def match_hits(hits, min_count=1, max_count=None, match="all"):
+    """ Sorted indices of the rows of a class count array matching a class query """
+    ok = hits >= min_count
+    if max_count is not None:
+        ok &= hits <= max_count
+    ok = ok.all(axis=1) if match == "all" else ok.any(axis=1)
+    return np.flatnonzero(ok).astype(np.int64)
 
 
 class LabelArray(WrappedDataArray):
     def __init__(self, hit_table, *args, **kwargs):
         self._table = hit_table
+        self._hit_cache = None
         super(LabelArray, self).__init__(*args, **kwargs)
         self.imshape = self._vset.image_shape
 
-    def _add_records(self, labels):
-        records = [tuple([self._hit_test(label[klass]) for klass in label]) for label in labels]
-        self._table.append(records)
-        self._table.flush()
+    @staticmethod
+    def _hits(labels, nclasses):
+        """ Returns an (n, nclasses) array counting the occurrences of every class per label """
+        raise NotImplementedError
 
-    def _hit_test(self, record):
-        if isinstance(record, int) and record in (0, 1):
-            return record
-        elif isinstance(record, list):
-            return len(record)
+    def _add_records(self, labels=None, hits=None):
+        if self._table is None or self._narrow_records:
+            return
+        if hits is None:
+            hits = self._hits(labels, len(self._vset.classes))
+        records = np.zeros(len(hits), dtype=self._table.dtype)
+        for idx, klass in enumerate(self._vset.classes):
+            records[klass] = hits[:, idx]
+        buf = self._buffered(self._table)
+        if buf is None:
+            self._table.append(records)
         else:
-            raise ValueError("say something")
+            buf.append(records)
+
+    @property
+    def _leaves(self):
+        leaves = super(LabelArray, self)._leaves
+        if self._table is not None:
+            leaves.append(self._table)
+        return leaves
+
+    @property
+    def _narrow_records(self):
+        """ hit_tables of files written before the table was populated have UInt8 columns,
+        too narrow for pixel or box counts, and are left untouched """
+        return self._table is not None and min([dt.itemsize for dt in self._table.coldtypes.values()]) < 4
+
+    def _uses_records(self):
+        """ Whether class queries can run on the hit_table. Otherwise counts are computed
+        from the decoded labels and cached, e.g. for legacy tables opened read-only. """
+        if self._table is None or self._narrow_records:
+            return False
+        if self._vset.read_only:
+            return len(self._table) >= len(self)
+        self._sync_records()
+        return True
+
+    def _sync_records(self, rebuild=False, block_rows=4096):
+        """ Fills hit_table rows missing for existing labels, e.g. in files written before
+        the table was populated, and makes sure every class column is indexed """
+        if self._table is None or self._narrow_records:
+            return
+        self.flush()
+        if rebuild and len(self._table):
+            self._table.remove_rows(0, len(self._table))
+        for start in range(len(self._table), len(self), block_rows):
+            self._add_records(self.read_batch(np.arange(start, min(start + block_rows, len(self)))))
+        self.flush()
+        for klass in self._vset.classes:
+            col = self._table.cols._f_col(klass)
+            if not col.is_indexed:
+                col.create_index()
+        self._table.flush()
+
+    def _decoded_hits(self, block_rows=4096):
+        if self._hit_cache is None or len(self._hit_cache) != len(self):
+            hits = [self._hits(self.read_batch(np.arange(start, min(start + block_rows, len(self)))),
+                               len(self._vset.classes)) for start in range(0, len(self), block_rows)]
+            self._hit_cache = np.concatenate(hits).astype(np.int64) if hits else \
+                np.zeros((0, len(self._vset.classes)), dtype=np.int64)
+        return self._hit_cache
+
+    def hit_counts(self):
+        """ Returns the (n, nclasses) per-sample class counts recorded in the hit_table """
+        if not self._uses_records():
+            return self._decoded_hits()
+        rows = self._table.read(stop=len(self))
+        return np.stack([rows[klass] for klass in self._vset.classes], axis=1).astype(np.int64)
+
+    def where(self, classes=None, min_count=1, max_count=None, match="all"):
+        """ Indexed hit_table query, see WrappedDataNode.where """
+        if classes is None:
+            classes = self._vset.classes
+        if not self._uses_records():
+            hits = self._decoded_hits()[:, [list(self._vset.classes).index(klass) for klass in classes]]
+            return match_hits(hits, min_count=min_count, max_count=max_count, match=match)
+        condvars, conds = {}, []
+        for idx, klass in enumerate(classes):
+            var = "c{}".format(idx)
+            condvars[var] = self._table.cols._f_col(klass)
+            cond = "({} >= {})".format(var, int(min_count))
+            if max_count is not None:
+                cond = "({} & ({} <= {}))".format(cond, var, int(max_count))
+            conds.append(cond)
+        op = " & " if match == "all" else " | "
+        return self._table.get_where_list(op.join(conds), condvars=condvars, sort=True).astype(np.int64)
 
     def append(self, label):
         super(LabelArray, self).append(label)
-        #self._add_records(label)
+        self._add_records([label])
+
+    def _truncate_records(self, n):
+        if self._table is not None and self._table.nrows > n:
+            self._table.truncate(n)
+
+    def truncate(self, n):
+        super(LabelArray, self).truncate(n)
+        self._truncate_records(n)
 
     def append_batch(self, labels):
-        return self.append(labels)
-        #self._add_records(labels)
+        super(LabelArray, self).append(labels)
+        self._add_records(labels)
 
 class ClassificationArray(LabelArray, ClassificationHandler):
     _default_dtype = np.uint8
 
+    @staticmethod
+    def _hits(labels, nclasses):
+        return np.asarray(labels).reshape(-1, nclasses)
+
     def _input_fn(self, item):
         dims = item.shape
         if len(dims) == 2:
@@ -118,23 +364,182 @@ class ClassificationArray(LabelArray, ClassificationHandler):
     def create_array(cls, trainer, group, dtype):
         trainer._fileh.create_earray(group, "labels",
                                      atom = tables.UInt8Atom(),
-                                     shape = (0, len(trainer.classes)))
+                                     shape = (0, len(trainer.classes)),
+                                     **trainer.layout.earray_kwargs(group._v_name, [len(trainer.classes)]))
 
 
 class SegmentationArray(LabelArray, SegmentationHandler):
     _default_dtype = np.float32
 
+    @staticmethod
+    def _hits(labels, nclasses):
+        # Masks hold class index + 1 per pixel, count pixels for every class
+        labels = np.asarray(labels)
+        flat = labels.reshape(len(labels), -1)
+        return np.stack([np.count_nonzero(flat == idx + 1, axis=1) for idx in range(nclasses)], axis=1)
+
     @classmethod
     def create_array(cls, trainer, group, dtype):
         if not dtype:
             dtype = cls._default_dtype
+        shape = [s if idx > 0 else 0 for idx, s in enumerate(trainer.image_shape)]
         trainer._fileh.create_earray(group, "labels",
                                      atom = _atom_from_dtype(dtype),
-                                     shape = tuple([s if idx > 0 else 0 for idx, s in enumerate(trainer.image_shape)]))
+                                     shape = tuple(shape),
+                                     **trainer.layout.earray_kwargs(group._v_name, shape[1:]))
+
+
+def _gather_boxes(boxes, klass_ids, counts, order, padded=False, starts=None):
+    """
+    Reorders columnar box rows, grouped by sample, into the sample order given by
+    `order` (indices into `counts`). With padded=True returns boxes as
+    (n, max_count, 4), class ids as (n, max_count) padded with -1, plus counts.
+    """
+    if starts is None:
+        starts = np.cumsum(counts) - counts
+    lengths = counts[order]
+    total = int(lengths.sum())
+    out_starts = np.cumsum(lengths) - lengths
+    rows = np.arange(total) + np.repeat(starts[order] - out_starts, lengths)
+    boxes, klass_ids = boxes[rows], klass_ids[rows]
+    if not padded:
+        return boxes, klass_ids, lengths
+    width = int(lengths.max()) if len(lengths) else 0
+    row = np.repeat(np.arange(len(order)), lengths)
+    col = np.arange(total) - np.repeat(out_starts, lengths)
+    out_boxes = np.zeros((len(order), width, 4), dtype=boxes.dtype)
+    out_klasses = np.full((len(order), width), -1, dtype=klass_ids.dtype)
+    out_boxes[row, col] = boxes
+    out_klasses[row, col] = klass_ids
+    return out_boxes, out_klasses, lengths
 
 
 class ObjDetectionArray(LabelArray, ObjDetectionHandler):
+    """
+    Object detection labels stored columnar in a group of three arrays: a float32
+    (n_boxes, 4) box table, an int32 class id per box and the cumulative box count
+    per sample, so a sample's boxes are rows offsets[i-1]:offsets[i].
+    """
+    _default_dtype = np.float32
+    _hits = staticmethod(_box_hits)
+
+    def __init__(self, *args, **kwargs):
+        super(ObjDetectionArray, self).__init__(*args, **kwargs)
+        self._boxes = self._arr.boxes
+        self._klass_ids = self._arr.classes
+        self._offsets = self._arr.offsets
+
+    @staticmethod
+    def _batch_transform(items):
+        return items
+
+    def __len__(self):
+        return len(self._offsets) + self._pending(self._offsets)
+
+    @property
+    def _leaves(self):
+        leaves = [self._boxes, self._klass_ids, self._offsets]
+        if self._table is not None:
+            leaves.append(self._table)
+        return leaves
+
+    def _read_runs(self, runs):
+        boxes, klass_ids, counts = [], [], []
+        for start, stop in runs:
+            ends = self._offsets[start:stop]
+            begin = int(self._offsets[start - 1]) if start > 0 else 0
+            boxes.append(self._boxes[begin:int(ends[-1])])
+            klass_ids.append(self._klass_ids[begin:int(ends[-1])])
+            counts.append(np.diff(np.concatenate([[begin], ends])))
+        return np.concatenate(boxes), np.concatenate(klass_ids), np.concatenate(counts)
+
+    def read_boxes(self, indices, padded=False):
+        """
+        Reads the boxes of a batch of samples as numpy arrays, without building
+        per-class lists.
+
+        Args:
+            indices (array-like): Sample indices, in any order
+            padded (bool): Return (n, max_boxes, 4) boxes and (n, max_boxes) class ids
+                padded with -1 instead of flat box rows
+        Returns:
+            boxes, class ids, per-sample box counts
+        """
+        self.flush()
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        n = len(self)
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("Batch indices out of range for array of length {}".format(n))
+        if not indices.size:
+            return _gather_boxes(np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int32),
+                                 np.zeros(0, dtype=np.int64), indices, padded=padded)
+        uniq, inverse, runs = self._coalesce(indices)
+        boxes, klass_ids, counts = self._read_runs(runs)
+        return _gather_boxes(boxes, klass_ids, counts, inverse, padded=padded)
+
+    def _read_batch(self, indices):
+        boxes, klass_ids, counts = self.read_boxes(indices)
+        ends = np.cumsum(counts)
+        nclasses = len(self._vset.classes)
+        return [_decode_boxes(boxes[end - count:end], klass_ids[end - count:end], nclasses)
+                for count, end in zip(counts, ends)]
+
+    def __iter__(self, spec=slice(None)):
+        if isinstance(spec, slice):
+            spec = range(*spec.indices(len(self)))
+        for label in self.read_batch(list(spec)):
+            yield self._read_transform(label)
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            return self._read_transform(self.read_batch([spec])[0])
+        return list(self.__iter__(spec))
+
+    def append(self, item):
+        self.append_batch([item])
+
+    def append_batch(self, items):
+        boxes, klass_ids, counts = _encode_boxes(items)
+        bufs = [self._buffered(leaf) for leaf in (self._boxes, self._klass_ids, self._offsets)]
+        if bufs[2] is None:
+            last = int(self._offsets[-1]) if len(self._offsets) else 0
+            bufs = [self._boxes, self._klass_ids, self._offsets]
+        else:
+            tail = bufs[2].tail()
+            last = int(tail) if tail is not None else 0
+        for buf, data in zip(bufs, (boxes, klass_ids, last + np.cumsum(counts))):
+            buf.append(data)
+        self._add_records(hits=_box_hits_from_columns(klass_ids, counts, len(self._vset.classes)))
+
+    def truncate(self, n):
+        self.flush()
+        end = int(self._offsets[n - 1]) if n else 0
+        self._boxes.truncate(end)
+        self._klass_ids.truncate(end)
+        self._offsets.truncate(n)
+        self._truncate_records(n)
+
+    @classmethod
+    def create_array(cls, trainer, group, dtype):
+        if not dtype:
+            dtype = cls._default_dtype
+        layout = trainer.layout
+        rows = layout.expected_rows(group._v_name)
+        kwargs = {"filters": layout.filters}
+        labels = trainer._fileh.create_group(group, "labels", "Columnar object detection labels")
+        trainer._fileh.create_earray(labels, "boxes", atom=_atom_from_dtype(dtype), shape=(0, 4),
+                                     expectedrows=rows * 8 if rows else 10000, **kwargs)
+        trainer._fileh.create_earray(labels, "classes", atom=tables.Int32Atom(), shape=(0,),
+                                     expectedrows=rows * 8 if rows else 10000, **kwargs)
+        trainer._fileh.create_earray(labels, "offsets", atom=tables.Int64Atom(), shape=(0,),
+                                     expectedrows=rows or 10000, **kwargs)
+
+
+class JSONObjDetectionArray(LabelArray, ObjDetectionHandler):
+    """ Object detection labels serialized as JSON in a VLArray, as written by older versions """
     _default_dtype = np.float32
+    _hits = staticmethod(_box_hits)
 
     @staticmethod
     def _batch_transform(items):
@@ -142,19 +547,96 @@ class ObjDetectionArray(LabelArray, ObjDetectionHandler):
 
     def _input_fn(self, item):
         assert isinstance(item, list)
-        return np.fromstring(json.dumps(item), dtype=np.uint8)
+        return np.frombuffer(json.dumps(item).encode(), dtype=np.uint8)
 
     def _output_fn(self, item):
-        return json.loads(item.tostring())
+        return json.loads(item.tobytes())
+
+    def _output_batch_fn(self, items):
+        return [self._output_fn(item) for item in items]
 
     def append_batch(self, items):
         for item in items:
             self.append(item)
 
-    @classmethod
-    def create_array(cls, trainer, group, dtype):
-        if not dtype:
-            dtype = cls._default_dtype
-        trainer._fileh.create_vlarray(group, "labels",
-                                      atom = tables.UInt8Atom(),
-                                      filters=tables.Filters(complevel=0))
+
+class IndexedArray(object):
+    """
+    A partition's view of a store-wide array. Positions within the partition
+    map to global rows through the partition index, so partitions can be
+    redefined without touching the data. Attributes not defined here are
+    looked up on the underlying array.
+    """
+    def __init__(self, base, partition, block_rows=256):
+        self._base = base
+        self._partition = partition
+        self._block_rows = block_rows
+
+    def __getattr__(self, name):
+        return getattr(self._base, name)
+
+    def __len__(self):
+        return len(self._partition.rows)
+
+    def _global(self, indices):
+        rows = self._partition.rows
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        n = len(rows)
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("Batch indices out of range for partition of length {}".format(n))
+        return rows[indices]
+
+    def read_batch(self, indices):
+        return self._base.read_batch(self._global(indices))
+
+    def read_boxes(self, indices, padded=False):
+        return self._base.read_boxes(self._global(indices), padded=padded)
+
+    def __iter__(self, spec=slice(None)):
+        if isinstance(spec, slice):
+            positions = np.arange(*spec.indices(len(self)))
+        else:
+            positions = np.asarray(spec, dtype=np.int64).ravel()
+        for start in range(0, len(positions), self._block_rows):
+            for item in self.read_batch(positions[start:start + self._block_rows]):
+                yield self._base._read_transform(item)
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            return self._base._read_transform(self.read_batch([spec])[0])
+        elif isinstance(spec, slice):
+            return list(self.__iter__(spec))
+        return self.read_batch(spec)
+
+    def __setitem__(self, key, value):
+        self._base[key] = value
+
+    def _extend(self, write):
+        # Rows past the store's current sample count are new samples of this
+        # partition; rows below it were registered by the sibling array
+        start = self._partition._vset._n_samples()
+        write()
+        stop = len(self._base)
+        if stop > start:
+            self._partition._add_rows(np.arange(start, stop, dtype=np.int64))
+
+    def append(self, item):
+        self._extend(lambda: self._base.append(item))
+
+    def append_batch(self, items):
+        self._extend(lambda: self._base.append_batch(items))
+
+    def hit_counts(self):
+        return self._base.hit_counts()[self._partition.rows]
+
+    def where(self, *args, **kwargs):
+        rows = self._base.where(*args, **kwargs)
+        return np.flatnonzero(np.isin(self._partition.rows, rows)).astype(np.int64)
+
+    def query_bbox(self, *args, **kwargs):
+        rows = self._base.query_bbox(*args, **kwargs)
+        return np.flatnonzero(np.isin(self._partition.rows, rows)).astype(np.int64)
+
+    def chunk_ids(self, indices=None):
+        return self._base.chunk_ids(self._global(np.arange(len(self)) if indices is None else indices))
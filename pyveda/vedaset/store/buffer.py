@@ -0,0 +1,57 @@
+import numpy as np
+import tables
+
+
+class AppendBuffer(object):
+    """
+    Accumulates appends to an extendable PyTables array or table in a
+    preallocated block and writes them out with one append once the block is
+    full, instead of one append per sample.
+
+    Args:
+        leaf (tables.EArray or tables.Table): Target, extendable along axis 0
+        rows (int): Rows held before flushing, derived from nbytes when None
+        nbytes (int): Size of the block when rows is None
+    """
+    def __init__(self, leaf, rows=None, nbytes=2**22):
+        self._arr = leaf
+        sample_shape = tuple(leaf.shape[1:])
+        dtype = np.dtype(leaf.dtype)
+        row_bytes = dtype.itemsize * int(np.prod(sample_shape))
+        self.rows = max(int(rows or nbytes // max(row_bytes, 1)), 1)
+        self._block = np.empty((self.rows,) + sample_shape, dtype=dtype)
+        self._n = 0
+
+    @staticmethod
+    def supports(leaf):
+        if isinstance(leaf, tables.Table):
+            return True
+        return isinstance(leaf, tables.EArray) and leaf.extdim == 0
+
+    def __len__(self):
+        return self._n
+
+    def tail(self):
+        """ Returns the last row appended so far, buffered or not """
+        if self._n:
+            return self._block[self._n - 1]
+        if self._arr.nrows:
+            return self._arr[-1]
+        return None
+
+    def append(self, rows):
+        k = len(rows)
+        if self._n + k > self.rows:
+            self.flush()
+        if k >= self.rows:
+            self._arr.append(rows)
+            return
+        self._block[self._n:self._n + k] = rows
+        self._n += k
+        if self._n == self.rows:
+            self.flush()
+
+    def flush(self):
+        if self._n:
+            self._arr.append(self._block[:self._n])
+            self._n = 0
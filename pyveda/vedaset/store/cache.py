@@ -0,0 +1,129 @@
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def _sizeof(item):
+    """ Approximate bytes held by a decoded sample: an array, or nested lists of boxes """
+    if isinstance(item, np.ndarray):
+        return item.nbytes
+    if isinstance(item, (list, tuple)):
+        return sys.getsizeof(item) + sum([_sizeof(sub) for sub in item])
+    return sys.getsizeof(item)
+
+
+class SampleCache(object):
+    """
+    Least recently used cache of decoded samples, bounded by bytes. Entries are keyed
+    by (store file, array, row), so the same cache can sit in front of any number of
+    stores and wrapper objects, and every partition view of a shared array hits the
+    same entries.
+
+    Args:
+        max_bytes (int): Memory budget of the cached samples
+
+    Attributes:
+        hits, misses, evictions (int): Lookup and eviction counters
+        nbytes (int): Bytes currently cached
+    """
+    def __init__(self, max_bytes=2**28):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        # Every process fills its own cache
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_bytes"])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "items": len(self), "nbytes": self.nbytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get(key, default)
+
+    def _get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, item):
+        size = _sizeof(item)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (item, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def read(self, array, indices):
+        """
+        Reads a batch through the cache, decoding only the samples not cached yet.
+
+        Args:
+            array (WrappedDataArray): Array read from on a miss, with a _cache_key and _read_batch
+            indices (array-like): Sample indices, in any order
+        Returns:
+            The samples in the requested order, stacked when they are arrays
+        """
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        n = len(array)
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("Batch indices out of range for array of length {}".format(n))
+        if not indices.size:
+            return array._read_batch(indices)
+        prefix = array._cache_key
+        found, missing = {}, []
+        with self._lock:
+            for idx in np.unique(indices).tolist():
+                item = self._get(prefix + (idx,), self)
+                if item is self:
+                    missing.append(idx)
+                else:
+                    found[idx] = item
+        if missing:
+            for idx, item in zip(missing, array._read_batch(missing)):
+                if isinstance(item, np.ndarray):
+                    # Rows are views of the whole batch, keep only the sample itself
+                    item = item.copy()
+                found[idx] = item
+                self.put(prefix + (idx,), item)
+        items = [found[idx] for idx in indices.tolist()]
+        if isinstance(items[0], np.ndarray):
+            return np.stack(items)
+        return items
+
+    def __repr__(self):
+        return "SampleCache({nbytes}/{max_bytes} bytes, {items} items, {hits} hits, {misses} misses, " \
+               "{evictions} evictions)".format(**self.info())
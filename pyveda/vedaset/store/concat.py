@@ -0,0 +1,268 @@
+import numpy as np
+from pyveda.vedaset.abstract import BaseDataSet
+from pyveda.vedaset.store.arrays import _gather_boxes
+from pyveda.vedaset.store.vedabase import WrappedDataNode, MLTYPE_MAP, PARTITIONS
+
+
+def _open_store(path):
+    """ Opens a store from a path read-only, detecting its backend """
+    from pyveda.vedaset.vedaset import VedaBase, store_backend
+    klass = store_backend(path)
+    if issubclass(klass, VedaBase):
+        return klass.from_path(path, mode="r")
+    return klass.from_path(path)
+
+
+def _scatter(n, groups):
+    """ Assembles per-part batch reads, given as (positions, data) pairs, in request order """
+    out = None
+    for sel, data in groups:
+        if isinstance(data, np.ndarray):
+            if out is None:
+                out = np.empty((n,) + data.shape[1:], dtype=data.dtype)
+            out[sel] = data
+        else:
+            if out is None:
+                out = [None] * n
+            for pos, item in zip(sel, data):
+                out[pos] = item
+    return out
+
+
+def _locate(bounds, indices):
+    """ Maps global indices to (part, local index) given cumulative part bounds """
+    n = int(bounds[-1])
+    indices = np.asarray(indices, dtype=np.int64).ravel()
+    indices = np.where(indices < 0, indices + n, indices)
+    if indices.size and (indices.min() < 0 or indices.max() >= n):
+        raise IndexError("Batch indices out of range for array of length {}".format(n))
+    parts = np.searchsorted(bounds, indices, side="right") - 1
+    return parts, indices - bounds[parts]
+
+
+def _groups(bounds, indices):
+    """ Yields (part, positions in the request, local indices) for every part touched """
+    parts, local = _locate(bounds, indices)
+    for part in np.unique(parts):
+        sel = np.flatnonzero(parts == part)
+        yield int(part), sel, local[sel]
+
+
+class ConcatArray(object):
+    """
+    Read-only view presenting the arrays of several partitions as one, with
+    global indexing. Batch reads are split per part and reassembled in the
+    requested order.
+    """
+    def __init__(self, parts, block_rows=256):
+        self._parts = parts
+        self._block_rows = block_rows
+
+    def __getattr__(self, name):
+        return getattr(self._parts[0], name)
+
+    @property
+    def _bounds(self):
+        return np.cumsum([0] + [len(part) for part in self._parts])
+
+    def __len__(self):
+        return int(self._bounds[-1])
+
+    def read_batch(self, indices):
+        n = len(np.asarray(indices).ravel())
+        out = _scatter(n, [(sel, self._parts[part].read_batch(local))
+                           for part, sel, local in _groups(self._bounds, indices)])
+        if out is None:
+            return self._parts[0].read_batch([])
+        return out
+
+    def read_boxes(self, indices, padded=False):
+        boxes, klass_ids, counts, order = [], [], [], []
+        for part, sel, local in _groups(self._bounds, indices):
+            b, k, c = self._parts[part].read_boxes(local)
+            boxes.append(b)
+            klass_ids.append(k)
+            counts.append(c)
+            order.append(sel)
+        if not order:
+            return self._parts[0].read_boxes([], padded=padded)
+        # Rows come back grouped by part; order maps each requested sample to its group position
+        order = np.argsort(np.concatenate(order), kind="stable")
+        return _gather_boxes(np.concatenate(boxes), np.concatenate(klass_ids), np.concatenate(counts),
+                             order, padded=padded)
+
+    def __iter__(self, spec=slice(None)):
+        if isinstance(spec, slice):
+            positions = np.arange(*spec.indices(len(self)))
+        else:
+            positions = np.asarray(spec, dtype=np.int64).ravel()
+        for start in range(0, len(positions), self._block_rows):
+            for item in self.read_batch(positions[start:start + self._block_rows]):
+                yield self._parts[0]._read_transform(item)
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            return self._parts[0]._read_transform(self.read_batch([spec])[0])
+        elif isinstance(spec, slice):
+            return list(self.__iter__(spec))
+        return self.read_batch(spec)
+
+    def append(self, item):
+        raise NotImplementedError("Concatenated VedaBases are read-only")
+
+    def append_batch(self, items):
+        raise NotImplementedError("Concatenated VedaBases are read-only")
+
+
+class ConcatDataNode(WrappedDataNode):
+    """ The same partition of every concatenated store, indexed as one """
+    def __init__(self, nodes, trainer):
+        super(ConcatDataNode, self).__init__(nodes, trainer)
+
+    @property
+    def _parts(self):
+        return self._node
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = ConcatArray([node.images for node in self._parts])
+        return self._images
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = ConcatArray([node.labels for node in self._parts])
+        return self._labels
+
+    @property
+    def metadata(self):
+        return ConcatArray([node.metadata for node in self._parts])
+
+    def append_batch(self, images, labels, metadata=None):
+        raise NotImplementedError("Concatenated VedaBases are read-only")
+
+    def hit_counts(self):
+        return np.concatenate([node.hit_counts() for node in self._parts])
+
+    def where(self, *args, **kwargs):
+        parts = self._parts
+        bounds = np.cumsum([0] + [len(node) for node in parts])
+        return np.concatenate([node.where(*args, **kwargs) + offset
+                               for node, offset in zip(parts, bounds[:-1])]).astype(np.int64)
+
+    def query_bbox(self, *args, **kwargs):
+        parts = self._parts
+        bounds = np.cumsum([0] + [len(node) for node in parts])
+        return np.concatenate([node.query_bbox(*args, **kwargs) + offset
+                               for node, offset in zip(parts, bounds[:-1])]).astype(np.int64)
+
+
+class ConcatDataBase(BaseDataSet):
+    """
+    Several stores with the same mltype, classes, image shape and dtype presented
+    as one read-only dataset. Each partition spans the files in the order given,
+    without copying any data.
+
+    Args:
+        stores (list): Open stores, or paths opened read-only with the detected backend
+    """
+    def __init__(self, stores):
+        if not stores:
+            raise ValueError("Concatenate at least one store")
+        self._owned = [isinstance(store, str) for store in stores]
+        self._stores = [_open_store(store) if isinstance(store, str) else store for store in stores]
+        self._fw_loader = lambda x: x
+        self._nodes = {}
+        try:
+            self._validate()
+        except ValueError:
+            self.close()
+            raise
+        self._label_klass = MLTYPE_MAP[self.mltype]
+
+    def _validate(self):
+        first = self._stores[0]
+        for store in self._stores[1:]:
+            for attr in ("mltype", "classes", "image_shape"):
+                if list(np.atleast_1d(getattr(store, attr))) != list(np.atleast_1d(getattr(first, attr))):
+                    raise ValueError("Cannot concatenate stores with different {}: {} and {}".format(
+                        attr, getattr(first, attr), getattr(store, attr)))
+            if np.dtype(store.image_dtype) != np.dtype(first.image_dtype):
+                raise ValueError("Cannot concatenate stores with different image dtypes: {} and {}".format(
+                    first.image_dtype, store.image_dtype))
+
+    @property
+    def stores(self):
+        return list(self._stores)
+
+    @property
+    def mltype(self):
+        return self._stores[0].mltype
+
+    @property
+    def classes(self):
+        return self._stores[0].classes
+
+    @property
+    def image_shape(self):
+        return self._stores[0].image_shape
+
+    @property
+    def image_dtype(self):
+        return self._stores[0].image_dtype
+
+    @property
+    def splits(self):
+        """ Partitions present in every store """
+        names = [set(getattr(store, "splits", PARTITIONS)) for store in self._stores]
+        return sorted(set.intersection(*names))
+
+    def split(self, name):
+        if name not in self._nodes:
+            self._nodes[name] = ConcatDataNode([store.split(name) if hasattr(store, "split")
+                                                else getattr(store, name) for store in self._stores], self)
+        return self._nodes[name]
+
+    @property
+    def train(self):
+        return self.split("train")
+
+    @property
+    def test(self):
+        return self.split("test")
+
+    @property
+    def validate(self):
+        return self.split("validate")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_nodes"] = {}
+        del state["_fw_loader"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fw_loader = lambda x: x
+
+    def flush(self):
+        pass
+
+    def close(self):
+        for store, owned in zip(self._stores, self._owned):
+            if owned:
+                store.close()
+        self._nodes = {}
+
+    def __len__(self):
+        return sum([len(store) for store in self._stores])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "ConcatDataBase({} stores, {} samples)".format(len(self._stores), len(self))
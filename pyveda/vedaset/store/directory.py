@@ -0,0 +1,399 @@
+import os
+import json
+import uuid
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+from pyveda.exceptions import LabelNotSupported
+from pyveda.vedaset.abstract import BaseDataSet
+from pyveda.vedaset.store.arrays import NDImageArray, LabelArray, _encode_boxes, _decode_boxes, _box_hits
+from pyveda.vedaset.store.vedabase import WrappedDataNode, MLTYPE_MAP
+from pyveda.fetch.handlers import ObjDetectionHandler
+
+META_FILE = "meta.json"
+PARTITIONS = ["train", "test", "validate"]
+
+
+def _chunk_name(chunk_id):
+    return "{:08d}".format(chunk_id)
+
+
+def commit_chunk(chunks_path, members, start_id=0):
+    """
+    Atomically publishes a new chunk holding one file per member array.
+
+    The member files are written into a private temporary directory which is
+    then renamed onto the first free chunk id. Renaming a directory onto an
+    existing chunk fails, so any number of threads or processes can commit
+    chunks into the same partition without further coordination.
+
+    Args:
+        chunks_path (str): Directory holding the chunk directories of a partition
+        members (dict): Mapping of member name ("images", "labels") to a callable
+            writing that member's data to a given file path
+        start_id (int): First chunk id to try
+    Returns:
+        int: The claimed chunk id
+    """
+    tmp = os.path.join(chunks_path, ".tmp-{}-{}".format(os.getpid(), uuid.uuid4().hex))
+    os.makedirs(tmp)
+    try:
+        for member, write in members.items():
+            write(os.path.join(tmp, member))
+        chunk_id = start_id
+        while True:
+            try:
+                os.rename(tmp, os.path.join(chunks_path, _chunk_name(chunk_id)))
+                return chunk_id
+            except OSError:
+                if not os.path.exists(os.path.join(chunks_path, _chunk_name(chunk_id))):
+                    raise
+                chunk_id += 1
+    finally:
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+
+
+class ChunkedArray(object):
+    """
+    EArray-like, appendable sequence of fixed-shape samples stored as one .npy
+    file per chunk directory. Chunks are memory-mapped on read, so reads from
+    many processes scale with the file system rather than a shared handle.
+    """
+    _fname = "{}.npy"
+
+    def __init__(self, chunks_path, member, sample_shape, dtype, max_open=64):
+        self._path = chunks_path
+        self._member = member
+        self._sample_shape = tuple(sample_shape)
+        self.dtype = np.dtype(dtype)
+        self._max_open = max_open
+        self._rows = {}
+        self._names = []
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._open = OrderedDict()
+        self._lock = threading.RLock()
+        self.refresh()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_open"] = OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def shape(self):
+        return (len(self),) + self._sample_shape
+
+    def _member_path(self, name):
+        return os.path.join(self._path, name, self._fname.format(self._member))
+
+    def refresh(self):
+        """ Picks up chunks committed since the last refresh, including by other processes """
+        with self._lock:
+            names = sorted([n for n in os.listdir(self._path) if not n.startswith(".")])
+            for name in names:
+                if name not in self._rows:
+                    path = self._member_path(name)
+                    self._rows[name] = self._count_rows(self._load(name)) if os.path.exists(path) else None
+            self._names = [n for n in names if self._rows[n] is not None]
+            self._offsets = np.concatenate([[0], np.cumsum([self._rows[n] for n in self._names])]).astype(np.int64)
+            self._next_id = int(names[-1]) + 1 if names else 0
+
+    def _read_chunk(self, path):
+        return np.load(path, mmap_mode="r")
+
+    def _count_rows(self, chunk):
+        return len(chunk)
+
+    def _take(self, chunk, local):
+        return chunk[local]
+
+    def _write_chunk(self, data):
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        if data.ndim == len(self._sample_shape):
+            data = data[np.newaxis]
+
+        def write(path):
+            with open(self._fname.format(path), "wb") as f:
+                np.save(f, data)
+        return write
+
+    def _load(self, name):
+        with self._lock:
+            if name in self._open:
+                self._open.move_to_end(name)
+                return self._open[name]
+            chunk = self._read_chunk(self._member_path(name))
+            self._open[name] = chunk
+            if len(self._open) > self._max_open:
+                self._open.popitem(last=False)
+            return chunk
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def _empty(self, n):
+        return np.empty((n,) + self._sample_shape, dtype=self.dtype)
+
+    def read(self, indices):
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        if indices.size and indices.max() >= len(self):
+            self.refresh()
+        names, offsets = self._names, self._offsets
+        n = int(offsets[-1])
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("Index out of range for array of length {}".format(n))
+        chunk_pos = np.searchsorted(offsets, indices, side="right") - 1
+        local = indices - offsets[chunk_pos]
+        out = self._empty(len(indices))
+        for pos in np.unique(chunk_pos):
+            where = np.flatnonzero(chunk_pos == pos)
+            data = self._take(self._load(names[pos]), local[where])
+            if isinstance(out, list):
+                for i, item in zip(where, data):
+                    out[i] = item
+            else:
+                out[where] = data
+        return out
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            return self.read([spec])[0]
+        if isinstance(spec, slice):
+            if spec.stop is None or spec.stop > len(self):
+                self.refresh()
+            return self.read(np.arange(*spec.indices(len(self))))
+        return self.read(spec)
+
+    def iterrows(self, start=None, stop=None, step=None):
+        for idx in range(*slice(start, stop, step).indices(len(self))):
+            yield self[idx]
+
+    def append(self, data):
+        chunk_id = commit_chunk(self._path, {self._member: self._write_chunk(data)}, self._next_id)
+        self.refresh()
+        return chunk_id
+
+
+class ChunkedBoxArray(ChunkedArray):
+    """ Object detection labels stored per chunk as box, class id and offset tables """
+    _fname = "{}.npz"
+
+    def __init__(self, chunks_path, member, nclasses, **kwargs):
+        self._nclasses = nclasses
+        super(ChunkedBoxArray, self).__init__(chunks_path, member, (), np.float32, **kwargs)
+
+    def _read_chunk(self, path):
+        with np.load(path) as data:
+            return data["boxes"], data["classes"], data["offsets"]
+
+    def _count_rows(self, chunk):
+        return len(chunk[2]) - 1
+
+    def _take(self, chunk, local):
+        boxes, klass_ids, offsets = chunk
+        return [_decode_boxes(boxes[offsets[i]:offsets[i + 1]], klass_ids[offsets[i]:offsets[i + 1]],
+                              self._nclasses) for i in local]
+
+    def _write_chunk(self, data):
+        boxes, klass_ids, counts = _encode_boxes(data)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        def write(path):
+            with open(self._fname.format(path), "wb") as f:
+                np.savez(f, boxes=boxes, classes=klass_ids, offsets=offsets)
+        return write
+
+    def _empty(self, n):
+        return [None] * n
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+
+class ChunkedObjDetectionArray(LabelArray, ObjDetectionHandler):
+    _default_dtype = np.float32
+    _hits = staticmethod(_box_hits)
+
+    @staticmethod
+    def _batch_transform(items):
+        return items
+
+    def append(self, item):
+        self._arr.append([item])
+
+    def append_batch(self, items):
+        self._arr.append(list(items))
+
+
+class DirectoryDataNode(WrappedDataNode):
+    """ A partition of a DirectoryDataBase, one chunk directory per appended batch """
+
+    def __init__(self, path, trainer):
+        super(DirectoryDataNode, self).__init__(path, trainer)
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def images(self):
+        if self._images is None:
+            arr = ChunkedArray(self._node, "images", self._vset.image_shape, self._vset.image_dtype)
+            self._images = self._vset._image_klass(arr, self._vset, output_transform=self._vset._fw_loader)
+        return self._images
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            vset = self._vset
+            if vset.mltype == "object_detection":
+                arr = ChunkedBoxArray(self._node, "labels", len(vset.classes))
+            elif vset.mltype == "classification":
+                arr = ChunkedArray(self._node, "labels", [len(vset.classes)], vset._label_klass._default_dtype)
+            else:
+                arr = ChunkedArray(self._node, "labels", vset.image_shape[1:], vset._label_klass._default_dtype)
+            self._labels = vset._label_array_factory(None, arr, vset)
+        return self._labels
+
+    def append_batch(self, images, labels):
+        """ Commits images and labels together as one chunk, safe to call from concurrent writers """
+        imgs, lbls = self.images._arr, self.labels._arr
+        if self._vset.mltype != "object_detection":
+            labels = self.labels._input_fn(np.asarray(labels))
+        commit_chunk(self._node, {"images": imgs._write_chunk(self.images._input_fn(np.asarray(images))),
+                                  "labels": lbls._write_chunk(labels)}, imgs._next_id)
+        imgs.refresh()
+        lbls.refresh()
+
+    def __len__(self):
+        return min(len(self.images), len(self.labels))
+
+
+class DirectoryDataBase(BaseDataSet):
+    """
+    A VedaBase stored as a directory of independent chunk files. Any number of
+    processes can read it without sharing a file handle, and concurrent writers
+    commit whole chunks without locking.
+
+    Args:
+        dirpath (str): Root directory of the store
+        mltype (str): One of "classification", "segmentation", "object_detection"
+        klasses (list): Class names
+        image_shape (list): Shape of a single image
+        image_dtype: Image data type
+        overwrite (bool): Remove an existing store at dirpath first
+    """
+    _concurrent_writes = True
+
+    def __init__(self, dirpath, mltype=None, klasses=None, image_shape=None,
+                 image_dtype=None, overwrite=False, **kwargs):
+        self._dirpath = dirpath
+        self._framework = None
+        self._fw_loader = lambda x: x
+        self._nodes = {}
+        meta_path = os.path.join(dirpath, META_FILE)
+        if os.path.exists(meta_path) and overwrite:
+            shutil.rmtree(dirpath)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self._meta = json.load(f)
+        else:
+            if mltype not in MLTYPE_MAP:
+                raise LabelNotSupported("Unsupported mltype: {}".format(mltype))
+            self._meta = {"mltype": mltype,
+                          "classes": [str(klass) for klass in klasses],
+                          "image_shape": [int(d) for d in image_shape],
+                          "image_dtype": np.dtype(image_dtype).str}
+            os.makedirs(dirpath, exist_ok=True)
+            with open(meta_path, "w") as f:
+                json.dump(self._meta, f)
+        self._image_klass = NDImageArray
+        self._label_klass = ChunkedObjDetectionArray if self.mltype == "object_detection" else MLTYPE_MAP[self.mltype]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_nodes"] = {}
+        state["_fw_loader"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fw_loader = lambda x: x
+
+    @staticmethod
+    def is_directory_store(path):
+        return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+    def _image_array_factory(self, *args, **kwargs):
+        return self._image_klass(*args, **kwargs)
+
+    def _label_array_factory(self, *args, **kwargs):
+        return self._label_klass(*args, **kwargs)
+
+    @property
+    def mltype(self):
+        return self._meta["mltype"]
+
+    @property
+    def classes(self):
+        return self._meta["classes"]
+
+    @property
+    def image_shape(self):
+        return self._meta["image_shape"]
+
+    @property
+    def image_dtype(self):
+        return np.dtype(self._meta["image_dtype"])
+
+    def _wrapped_node(self, name):
+        if name not in self._nodes:
+            self._nodes[name] = DirectoryDataNode(os.path.join(self._dirpath, name), self)
+        return self._nodes[name]
+
+    @property
+    def train(self):
+        return self._wrapped_node("train")
+
+    @property
+    def test(self):
+        return self._wrapped_node("test")
+
+    @property
+    def validate(self):
+        return self._wrapped_node("validate")
+
+    def refresh(self):
+        """ Picks up chunks written by other processes """
+        for name in PARTITIONS:
+            node = self._wrapped_node(name)
+            node.images._arr.refresh()
+            node.labels._arr.refresh()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._nodes = {}
+
+    def __len__(self):
+        return sum([len(self.train), len(self.test), len(self.validate)])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "DirectoryDataBase({})".format(self._dirpath)
+
+    @classmethod
+    def from_path(cls, dirpath, **kwargs):
+        return cls(dirpath, **kwargs)
@@ -0,0 +1,509 @@
+import io
+import functools
+import os
+import json
+import struct
+import logging
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from pyveda.vedaset.store.vedabase import PARTITIONS
+
+has_crc32c = False
+try:
+    import crc32c as _crc32c_ext
+    has_crc32c = True
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+FORMATS = ("tar", "tfrecord")
+IMAGE_FORMATS = ("raw", "png")
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _crc_table()
+_CRC_TABLE_NP = np.array(_CRC_TABLE, dtype=np.uint32)
+
+# Inputs at least this long are split into lanes checksummed together with numpy
+_CRC_LANE_MIN = 4096
+_CRC_MAX_LANES = 4096
+
+
+def _crc_apply(op, value):
+    out = 0
+    for bit in range(32):
+        if value >> bit & 1:
+            out ^= op[bit]
+    return out
+
+
+@functools.lru_cache(maxsize=64)
+def _crc_zero_op(nbytes):
+    """ The CRC register update of nbytes zero bytes, a linear map given by the image of every bit """
+    if nbytes == 1:
+        return tuple(_CRC_TABLE[(1 << bit) & 0xFF] ^ ((1 << bit) >> 8) for bit in range(32))
+    half = _crc_zero_op(nbytes // 2)
+    op = tuple(_crc_apply(half, col) for col in half)
+    if nbytes & 1:
+        op = tuple(_crc_apply(_crc_zero_op(1), col) for col in op)
+    return op
+
+
+@functools.lru_cache(maxsize=64)
+def _crc_shift_tables(nbytes):
+    """ Per-byte lookup tables of the zero-byte operator, so it applies in four lookups """
+    op = _crc_zero_op(nbytes)
+    tables = np.zeros((4, 256), dtype=np.uint32)
+    for k in range(4):
+        for i in range(1, 256):
+            low = (i & -i).bit_length() - 1
+            tables[k, i] = tables[k, i & (i - 1)] ^ op[8 * k + low]
+    return tables
+
+
+def _crc_shift(nbytes, values):
+    """ Advances an array of CRC registers over nbytes zero bytes """
+    tables = _crc_shift_tables(nbytes)
+    out = tables[0][values & np.uint32(0xFF)]
+    for k in range(1, 4):
+        out ^= tables[k][(values >> np.uint32(8 * k)) & np.uint32(0xFF)]
+    return out
+
+
+def _crc_lanes(data):
+    """ CRC-32C of long inputs: the register is linear in the data, so contiguous lanes are
+    checksummed side by side with numpy and their registers combined pairwise """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    n = len(buf)
+    lanes = min(_CRC_MAX_LANES, 1 << ((n // 16).bit_length() - 1))
+    width = -(-n // lanes)
+    # Leading zeros leave a zero register unchanged
+    padded = np.zeros(lanes * width, dtype=np.uint8)
+    padded[lanes * width - n:] = buf
+    # Inverting the first four bytes stands in for the all-ones initial register
+    padded[lanes * width - n:lanes * width - n + 4] ^= 0xFF
+    rows = padded.reshape(lanes, width).astype(np.uint32)
+    crc = np.zeros(lanes, dtype=np.uint32)
+    for col in range(width):
+        crc = _CRC_TABLE_NP[(crc ^ rows[:, col]) & np.uint32(0xFF)] ^ (crc >> np.uint32(8))
+    span = width
+    while len(crc) > 1:
+        crc = _crc_shift(span, crc[0::2]) ^ crc[1::2]
+        span *= 2
+    return int(crc[0]) ^ 0xFFFFFFFF
+
+
+_warned_crc = False
+
+
+def crc32c(data):
+    """ CRC-32C (Castagnoli) of a bytes object, using the crc32c package when installed """
+    global _warned_crc
+    if has_crc32c:
+        return _crc32c_ext.crc32c(data)
+    if len(data) >= _CRC_LANE_MIN:
+        if not _warned_crc:
+            logger.warning("crc32c is not installed, checksumming TFRecords with numpy, "
+                           "install pyveda[tfrecord] for native speed")
+            _warned_crc = True
+        return _crc_lanes(data)
+    crc, table = 0xFFFFFFFF, _CRC_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def _masked_crc(data):
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+def write_record(f, data):
+    """ Writes one record with TFRecord framing: length, masked CRC of the length, data, masked CRC of the data """
+    header = struct.pack("<Q", len(data))
+    f.write(header)
+    f.write(struct.pack("<I", _masked_crc(header)))
+    f.write(data)
+    f.write(struct.pack("<I", _masked_crc(data)))
+
+
+def read_records(f, verify=False):
+    """ Yields the records of a TFRecord file object, optionally checking their CRCs """
+    while True:
+        header = f.read(8)
+        if not header:
+            return
+        if len(header) < 8:
+            raise IOError("Truncated record header")
+        length_crc = f.read(4)
+        data = f.read(struct.unpack("<Q", header)[0])
+        data_crc = f.read(4)
+        if len(data_crc) < 4:
+            raise IOError("Truncated record")
+        if verify and (struct.unpack("<I", length_crc)[0] != _masked_crc(header) or
+                       struct.unpack("<I", data_crc)[0] != _masked_crc(data)):
+            raise IOError("Record failed its CRC check")
+        yield data
+
+
+def _varint(n):
+    out = bytearray()
+    n &= 0xFFFFFFFFFFFFFFFF
+    while True:
+        bits = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _len_field(num, data):
+    return _varint((num << 3) | 2) + _varint(len(data)) + data
+
+
+def _feature(value):
+    """ Encodes a tf.train.Feature holding bytes, floats or int64s """
+    if isinstance(value, bytes):
+        return _len_field(1, _len_field(1, value))
+    arr = np.asarray(value).ravel()
+    if np.issubdtype(arr.dtype, np.floating):
+        return _len_field(2, _len_field(1, arr.astype("<f4").tobytes()))
+    return _len_field(3, _len_field(1, b"".join([_varint(int(v)) for v in arr])))
+
+
+def encode_example(features):
+    """
+    Serializes a {name: bytes | float array | int array} mapping as a tf.train.Example
+    protocol buffer, readable with tf.io.parse_single_example, without TensorFlow.
+    """
+    entries = [_len_field(1, _len_field(1, key.encode()) + _len_field(2, _feature(value)))
+               for key, value in features.items()]
+    return _len_field(1, b"".join(entries))
+
+
+def _fields(buf):
+    """ Yields (field number, wire type, value) for the fields of a protocol buffer message """
+    pos, n = 0, len(buf)
+    while pos < n:
+        key, pos = _read_varint(buf, pos)
+        num, wire = key >> 3, key & 7
+        if wire == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire == 2:
+            size, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + size], pos + size
+        elif wire == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        elif wire == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        else:
+            raise ValueError("Unsupported wire type {}".format(wire))
+        yield num, wire, value
+
+
+def _read_varint(buf, pos):
+    result, shift = 0, 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _decode_feature(buf):
+    for kind, _, payload in _fields(buf):
+        values = [(wire, value) for _, wire, value in _fields(payload)]
+        if kind == 1:
+            return b"".join([value for _, value in values])
+        if kind == 2:
+            return np.frombuffer(b"".join([value for _, value in values]), dtype="<f4")
+        ints = []
+        for wire, value in values:
+            if wire == 2:
+                pos = 0
+                while pos < len(value):
+                    v, pos = _read_varint(value, pos)
+                    ints.append(v)
+            else:
+                ints.append(value)
+        arr = np.array(ints, dtype=np.uint64)
+        return arr.view(np.int64)
+    return b""
+
+
+def decode_example(data):
+    """ Parses a serialized tf.train.Example into {name: bytes | float32 array | int64 array} """
+    features = {}
+    for _, _, feats in _fields(data):
+        for _, _, entry in _fields(feats):
+            key, value = None, b""
+            for num, _, part in _fields(entry):
+                if num == 1:
+                    key = part.decode()
+                else:
+                    value = _decode_feature(part)
+            features[key] = value
+    return features
+
+
+def _encode_png(image):
+    import imageio.v2 as imageio
+    buf = io.BytesIO()
+    image = image[0] if image.shape[0] == 1 else np.moveaxis(image, 0, -1)
+    imageio.imwrite(buf, image, format="png")
+    return buf.getvalue()
+
+
+def _decode_png(data, shape, dtype):
+    import imageio.v2 as imageio
+    image = np.asarray(imageio.imread(io.BytesIO(data), format="png"))
+    if image.ndim == 2:
+        image = image[np.newaxis]
+    else:
+        image = np.moveaxis(image, -1, 0)
+    return image.astype(dtype, copy=False).reshape(shape)
+
+
+def _npy_bytes(arr):
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(arr), allow_pickle=False)
+    return buf.getvalue()
+
+
+def _sample_features(index, image, label, mltype, image_format):
+    feats = {"index": [index],
+             "image": _encode_png(image) if image_format == "png" else np.ascontiguousarray(image).tobytes(),
+             "image_format": image_format.encode()}
+    if mltype == "object_detection":
+        flat = [(box, klass_id) for klass_id, boxes in enumerate(label) for box in boxes]
+        feats["boxes"] = np.array([box for box, _ in flat], dtype=np.float32).reshape(-1)
+        feats["classes"] = np.array([klass_id for _, klass_id in flat], dtype=np.int64)
+    else:
+        label = np.asarray(label)
+        feats["label"] = np.ascontiguousarray(label).tobytes()
+        feats["label_shape"] = np.array(label.shape, dtype=np.int64)
+        feats["label_dtype"] = label.dtype.str.encode()
+    return feats
+
+
+def _sample_from_features(feats, meta):
+    shape, dtype = meta["image_shape"], np.dtype(meta["image_dtype"])
+    if feats["image_format"] == b"png":
+        image = _decode_png(feats["image"], shape, dtype)
+    else:
+        image = np.frombuffer(feats["image"], dtype=dtype).reshape(shape)
+    if meta["mltype"] == "object_detection":
+        label = [[] for _ in meta["classes"]]
+        for box, klass_id in zip(feats["boxes"].reshape(-1, 4).tolist(), feats["classes"].tolist()):
+            label[klass_id].append(box)
+    else:
+        label = np.frombuffer(feats["label"], dtype=np.dtype(feats["label_dtype"].decode()))
+        label = label.reshape([int(d) for d in feats["label_shape"]])
+    return image, label
+
+
+def _write_tar_sample(tar, index, image, label, mltype, image_format):
+    key = "{:09d}".format(index)
+    members = []
+    if image_format == "png":
+        members.append((key + ".png", _encode_png(image)))
+    else:
+        members.append((key + ".npy", _npy_bytes(image)))
+    if mltype == "segmentation":
+        members.append((key + ".label.npy", _npy_bytes(label)))
+    else:
+        label = label.tolist() if isinstance(label, np.ndarray) else label
+        members.append((key + ".json", json.dumps(label).encode()))
+    for name, data in members:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def _node(vb, name):
+    return vb.split(name) if hasattr(vb, "split") else getattr(vb, name)
+
+
+def _export_shard(vb, split, positions, path, fmt, image_format, block_rows=256):
+    """ Writes the samples at positions of a partition into one shard file, in order """
+    node = _node(vb, split)
+    mltype = vb.mltype
+    tmp = path + ".tmp"
+    with open(tmp, "wb", buffering=2**22) as f:
+        tar = tarfile.open(fileobj=f, mode="w|") if fmt == "tar" else None
+        for start in range(0, len(positions), block_rows):
+            block = positions[start:start + block_rows]
+            images, labels = node.read_batch(block)
+            for index, image, label in zip(block.tolist(), images, labels):
+                if tar is not None:
+                    _write_tar_sample(tar, index, image, label, mltype, image_format)
+                else:
+                    write_record(f, encode_example(_sample_features(index, image, label, mltype, image_format)))
+        if tar is not None:
+            tar.close()
+    os.replace(tmp, path)
+    return {"path": os.path.basename(path), "count": int(len(positions)), "bytes": os.path.getsize(path)}
+
+
+def export_vedabase(vb, dirpath, format="tar", splits=None, shard_samples=None, shard_bytes=2**28,
+                    image_format="raw", shuffle=False, seed=None, workers=None, block_rows=256):
+    """
+    Writes the partitions of a store into size-bounded shard files for sequential
+    consumption, with an index.json describing every shard. Shards are written by a
+    pool of processes which each open the store read-only by name. HDF5 locks files
+    open for writing, so a writable store is flushed and closed while the pool runs and
+    reopened in its mode afterwards; stores that cannot be reopened that way are
+    exported from this process.
+
+    Args:
+        vb: Source store (VedaBase, sharded, concatenated, directory or frozen store)
+        dirpath (str): Output directory
+        format (str): "tar" (webdataset-style members, NNNNNNNNN.npy/.png + .json or
+            .label.npy) or "tfrecord" (tf.train.Example records, written without TensorFlow)
+        splits (list): Partitions to export, defaults to train, test and validate
+        shard_samples (int): Samples per shard, derived from shard_bytes when None
+        shard_bytes (int): Approximate uncompressed bytes of images per shard
+        image_format (str): "raw" arrays or "png" (uint8/uint16 images with 1, 3 or 4 bands)
+        shuffle (bool): Shuffle every partition before writing
+        seed (int): Shuffle seed
+        workers (int): Writer processes, defaults to the cpu count. 0 writes from this process.
+            A store open for writing is closed until they finish, see above.
+        block_rows (int): Samples read from the store at a time
+    Returns:
+        dict: The shard index
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown export format {}, expected one of {}".format(format, FORMATS))
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError("Unknown image format {}, expected one of {}".format(image_format, IMAGE_FORMATS))
+    vb.flush()
+    splits = splits or [name for name in PARTITIONS if name in getattr(vb, "splits", PARTITIONS)]
+    if not shard_samples:
+        sample_bytes = np.dtype(vb.image_dtype).itemsize * int(np.prod(vb.image_shape))
+        shard_samples = max(1, int(shard_bytes // max(sample_bytes, 1)))
+    os.makedirs(dirpath, exist_ok=True)
+    rng = np.random.RandomState(seed)
+    ext = ".tar" if format == "tar" else ".tfrecord"
+    tasks = []
+    for name in splits:
+        n = len(_node(vb, name))
+        positions = rng.permutation(n) if shuffle else np.arange(n)
+        for shard, start in enumerate(range(0, n, shard_samples)):
+            path = os.path.join(dirpath, "{}-{:05d}{}".format(name, shard, ext))
+            tasks.append((name, positions[start:start + shard_samples].astype(np.int64), path))
+
+    writable = not getattr(vb, "read_only", True)
+    if workers != 0 and writable and not hasattr(vb, "reopen"):
+        logger.warning("{} is open for writing and cannot be reopened, exporting without workers; "
+                       "open it with mode='r' to export in parallel".format(type(vb).__name__))
+        workers = 0
+    if workers == 0:
+        results = [_export_shard(vb, name, positions, path, format, image_format, block_rows)
+                   for name, positions, path in tasks]
+    else:
+        if writable:
+            vb.close()
+        try:
+            with ProcessPoolExecutor(workers or os.cpu_count() or 1) as executor:
+                futures = [executor.submit(_export_shard, vb, name, positions, path, format, image_format,
+                                           block_rows) for name, positions, path in tasks]
+                results = [future.result() for future in futures]
+        finally:
+            if writable:
+                vb.reopen()
+
+    index = {"format": format, "image_format": image_format, "mltype": vb.mltype,
+             "classes": [str(klass) for klass in vb.classes],
+             "image_shape": [int(d) for d in vb.image_shape],
+             "image_dtype": np.dtype(vb.image_dtype).str,
+             "shuffled": bool(shuffle), "splits": {name: [] for name in splits}}
+    for (name, _, _), result in zip(tasks, results):
+        index["splits"][name].append(result)
+    with open(os.path.join(dirpath, INDEX_FILE), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+class ExportReader(object):
+    """
+    Streams samples back out of exported shards, in shard order, reading each
+    file sequentially with large buffered reads.
+
+    Args:
+        dirpath (str): Directory written by export_vedabase
+    """
+    def __init__(self, dirpath):
+        self._dirpath = dirpath
+        with open(os.path.join(dirpath, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+    @property
+    def splits(self):
+        return list(self.index["splits"])
+
+    def shards(self, split):
+        """ Paths of a partition's shards, e.g. to hand a subset to each worker """
+        return [os.path.join(self._dirpath, shard["path"]) for shard in self.index["splits"][split]]
+
+    def count(self, split):
+        return sum([shard["count"] for shard in self.index["splits"][split]])
+
+    def read_shard(self, path, verify=False):
+        """ Yields (image, label) pairs from one shard """
+        with open(path, "rb", buffering=2**22) as f:
+            if self.index["format"] == "tfrecord":
+                for record in read_records(f, verify=verify):
+                    yield _sample_from_features(decode_example(record), self.index)
+            else:
+                for sample in self._tar_samples(f):
+                    yield sample
+
+    def _tar_samples(self, f):
+        meta = self.index
+        shape, dtype = meta["image_shape"], np.dtype(meta["image_dtype"])
+        image = None
+        with tarfile.open(fileobj=f, mode="r|") as tar:
+            for member in tar:
+                data = tar.extractfile(member).read()
+                name = member.name
+                if name.endswith(".label.npy"):
+                    label = np.load(io.BytesIO(data), allow_pickle=False)
+                elif name.endswith(".json"):
+                    label = json.loads(data.decode())
+                    if meta["mltype"] != "object_detection":
+                        label = np.asarray(label)
+                elif name.endswith(".png"):
+                    image = _decode_png(data, shape, dtype)
+                    continue
+                else:
+                    image = np.load(io.BytesIO(data), allow_pickle=False)
+                    continue
+                yield image, label
+
+    def __call__(self, split, shards=None, verify=False):
+        """
+        Yields every (image, label) pair of a partition.
+
+        Args:
+            split (str): Partition name
+            shards (list): Shard paths to read, defaults to all of the partition's shards
+            verify (bool): Check record CRCs of TFRecord shards
+        """
+        for path in shards or self.shards(split):
+            for sample in self.read_shard(path, verify=verify):
+                yield sample
@@ -0,0 +1,119 @@
+import tables
+
+COMPLIB_ALIASES = {"zstd": "blosc:zstd",
+                   "lz4": "blosc:lz4",
+                   "lz4hc": "blosc:lz4hc",
+                   "blosclz": "blosc:blosclz"}
+
+LAYOUT_PRESETS = {"default": {},
+                  "random": {"complib": "blosc:zstd", "complevel": 5,
+                             "shuffle": True, "chunk_samples": 1},
+                  "sequential": {"complib": "blosc:lz4", "complevel": 5,
+                                 "shuffle": True, "chunk_samples": 64}}
+
+
+class StorageLayout(object):
+    """
+    Compression and chunking options applied to the arrays of a VedaBase.
+    Layouts are persisted in the root attributes of the file so readers know
+    how the data was written.
+
+    Args:
+        complib (str): Compression library, any PyTables complib or one of
+            "zstd", "lz4", "lz4hc", "blosclz" (Blosc codecs). None disables compression.
+        complevel (int): Compression level, 0-9. Defaults to 5 with a complib, 0 stores
+            the data uncompressed
+        shuffle (bool): Apply the byte shuffle filter
+        bitshuffle (bool): Apply the bit shuffle filter (Blosc only)
+        chunk_samples (int): Number of samples per chunk. 1 gives one chunk read per
+            random sample access, larger values favor sequential scans. None lets
+            PyTables pick the chunkshape.
+        expectedrows (int or dict): Expected number of samples, either for every
+            partition or as a mapping of partition name to count
+    """
+    def __init__(self, complib=None, complevel=None, shuffle=True, bitshuffle=False,
+                 chunk_samples=None, expectedrows=None):
+        complib = COMPLIB_ALIASES.get(complib, complib)
+        if complib is not None and complib not in tables.filters.all_complibs:
+            raise ValueError("Unsupported compression library: {}".format(complib))
+        if complevel is not None and not 0 <= int(complevel) <= 9:
+            raise ValueError("complevel must be between 0 and 9")
+        if complib is None:
+            complevel = 0
+        elif complevel is None:
+            complevel = 5
+        if chunk_samples is not None and int(chunk_samples) < 1:
+            raise ValueError("chunk_samples must be a positive integer")
+        self.complib = complib
+        self.complevel = int(complevel)
+        self.shuffle = bool(shuffle)
+        self.bitshuffle = bool(bitshuffle)
+        self.chunk_samples = int(chunk_samples) if chunk_samples else None
+        self.expectedrows = expectedrows
+
+    @property
+    def filters(self):
+        if not self.complevel:
+            return tables.Filters(0)
+        return tables.Filters(complevel=self.complevel, complib=self.complib,
+                              shuffle=self.shuffle and not self.bitshuffle,
+                              bitshuffle=self.bitshuffle)
+
+    def chunkshape(self, sample_shape=()):
+        if not self.chunk_samples:
+            return None
+        return tuple([self.chunk_samples] + list(sample_shape))
+
+    def expected_rows(self, name=None):
+        if isinstance(self.expectedrows, dict):
+            # Arrays shared by every partition expect the total
+            rows = self.expectedrows.get(name, sum([int(v or 0) for v in self.expectedrows.values()]))
+        else:
+            rows = self.expectedrows
+        if not rows:
+            return None
+        return max(int(rows), 1)
+
+    def earray_kwargs(self, name=None, sample_shape=()):
+        """ Keyword arguments for creating a sample-major array in partition `name` """
+        kwargs = {"filters": self.filters}
+        chunkshape = self.chunkshape(sample_shape)
+        if chunkshape:
+            kwargs["chunkshape"] = chunkshape
+        rows = self.expected_rows(name)
+        if rows:
+            kwargs["expectedrows"] = rows
+        return kwargs
+
+    def to_dict(self):
+        return {"complib": self.complib,
+                "complevel": self.complevel,
+                "shuffle": self.shuffle,
+                "bitshuffle": self.bitshuffle,
+                "chunk_samples": self.chunk_samples,
+                "expectedrows": self.expectedrows}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+    @classmethod
+    def from_spec(cls, spec=None, **kwargs):
+        """ Build a layout from a preset name, a dict of options or an existing layout """
+        if isinstance(spec, cls):
+            return spec
+        if spec is None:
+            spec = "default"
+        if isinstance(spec, str):
+            if spec not in LAYOUT_PRESETS:
+                raise ValueError("Unknown layout preset: {}".format(spec))
+            spec = LAYOUT_PRESETS[spec]
+        opts = dict(spec)
+        opts.update(kwargs)
+        return cls(**opts)
+
+    def __eq__(self, other):
+        return isinstance(other, StorageLayout) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "StorageLayout({})".format(", ".join(["{}={!r}".format(k, v) for k, v in self.to_dict().items()]))
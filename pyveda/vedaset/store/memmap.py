@@ -0,0 +1,283 @@
+import os
+import json
+import numpy as np
+from pyveda.vedaset.abstract import BaseDataSet
+from pyveda.vedaset.store.arrays import WrappedDataArray, _encode_boxes, _decode_boxes, _gather_boxes
+from pyveda.vedaset.store.vedabase import WrappedDataNode, MLTYPE_MAP
+
+INDEX_FILE = "index.json"
+PARTITIONS = ["train", "test", "validate"]
+
+
+def _block_rows(sample_nbytes, block_bytes=2**26):
+    return max(1, int(block_bytes // max(int(sample_nbytes), 1)))
+
+
+def _freeze_array(arr, path, block_bytes=2**26):
+    """ Copies a fixed-shape wrapped array, or a partition's view of one, into a raw
+    .npy file block by block """
+    sample_shape = tuple([int(d) for d in arr._arr.shape[1:]])
+    if not len(arr):
+        np.save(path, np.zeros((0,) + sample_shape, dtype=arr._arr.dtype))
+        return {"path": os.path.basename(path), "dtype": np.dtype(arr._arr.dtype).str,
+                "shape": [0] + list(sample_shape)}
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=arr._arr.dtype,
+                                    shape=(len(arr),) + sample_shape)
+    step = _block_rows(out.itemsize * int(np.prod(sample_shape)), block_bytes)
+    for start in range(0, len(arr), step):
+        stop = min(start + step, len(arr))
+        out[start:stop] = arr.read_batch(np.arange(start, stop))
+    out.flush()
+    del out
+    return {"path": os.path.basename(path), "dtype": np.dtype(arr._arr.dtype).str,
+            "shape": [int(len(arr))] + list(sample_shape)}
+
+
+def _freeze_boxes(arr, dirpath, block_rows=4096):
+    """ Writes object detection labels as box, class id and offset tables """
+    boxes, klass_ids, counts = [], [], []
+    for start in range(0, len(arr), block_rows):
+        b, k, c = _encode_boxes(arr.read_batch(np.arange(start, min(start + block_rows, len(arr)))))
+        boxes.append(b)
+        klass_ids.append(k)
+        counts.append(c)
+    boxes = np.concatenate(boxes) if boxes else np.zeros((0, 4), dtype=np.float32)
+    klass_ids = np.concatenate(klass_ids) if klass_ids else np.zeros(0, dtype=np.int32)
+    counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    paths = {}
+    for name, data in [("boxes", boxes), ("classes", klass_ids), ("offsets", offsets)]:
+        path = os.path.join(dirpath, "labels_{}.npy".format(name))
+        np.save(path, data)
+        paths[name] = os.path.basename(path)
+    return paths
+
+
+def freeze_vedabase(vb, dirpath, overwrite=False, block_bytes=2**26):
+    """
+    Writes every partition of a finished VedaBase, including named splits and
+    folds, into raw .npy files plus a JSON index that can be opened with
+    MemmapDataBase. Samples in several partitions are written once per partition.
+
+    Args:
+        vb (H5DataBase): Source store
+        dirpath (str): Output directory
+        overwrite (bool): Allow writing into an existing index
+        block_bytes (int): Size of the blocks copied out of the source file
+    Returns:
+        str: Path of the written index file
+    """
+    index_path = os.path.join(dirpath, INDEX_FILE)
+    if os.path.exists(index_path) and not overwrite:
+        raise ValueError("A frozen VedaBase already exists at {}".format(dirpath))
+    index = {"mltype": vb.mltype,
+             "classes": [str(klass) for klass in vb.classes],
+             "image_shape": [int(d) for d in vb.image_shape],
+             "image_dtype": np.dtype(vb.image_dtype).str,
+             "partitions": {}}
+    for name in getattr(vb, "splits", PARTITIONS):
+        node = vb.split(name) if hasattr(vb, "split") else getattr(vb, name)
+        pdir = os.path.join(dirpath, name)
+        os.makedirs(pdir, exist_ok=True)
+        entry = {"count": int(len(node)),
+                 "images": _freeze_array(node.images, os.path.join(pdir, "images.npy"), block_bytes)}
+        if vb.mltype == "object_detection":
+            entry["labels"] = _freeze_boxes(node.labels, pdir)
+        else:
+            entry["labels"] = _freeze_array(node.labels, os.path.join(pdir, "labels.npy"), block_bytes)
+        index["partitions"][name] = entry
+    with open(index_path, "w") as f:
+        json.dump(index, f)
+    return index_path
+
+
+class MemmapArray(WrappedDataArray):
+    """ Read-only array backed by a memory-mapped .npy file. Integer indexing
+    returns views into the page cache without copying. """
+
+    def __iter__(self, spec=slice(None)):
+        for rec in self._arr[spec]:
+            yield self._read_transform(self._output_fn(rec))
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            return self._read_transform(self._output_fn(self._arr[spec]))
+        return super(MemmapArray, self).__getitem__(spec)
+
+    def read_batch(self, indices):
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        return self._arr[indices]
+
+    def append(self, item):
+        raise NotImplementedError("Frozen VedaBase partitions are read-only")
+
+
+class MemmapBoxArray(MemmapArray):
+    """ Object detection labels stored as memory-mapped box, class id and offset tables """
+
+    def __init__(self, boxes, klass_ids, offsets, trainer, output_transform=lambda x: x):
+        super(MemmapBoxArray, self).__init__(offsets, trainer, output_transform=output_transform)
+        self._boxes = boxes
+        self._klass_ids = klass_ids
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _read_sample(self, idx):
+        start, stop = self._offsets[idx], self._offsets[idx + 1]
+        return _decode_boxes(self._boxes[start:stop], self._klass_ids[start:stop],
+                             len(self._vset.classes))
+
+    def __iter__(self, spec=slice(None)):
+        if isinstance(spec, slice):
+            spec = range(*spec.indices(len(self)))
+        for idx in spec:
+            yield self._read_transform(self._read_sample(int(idx)))
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            if spec < 0:
+                spec += len(self)
+            return self._read_transform(self._read_sample(int(spec)))
+        return list(self.__iter__(spec))
+
+    def read_batch(self, indices):
+        return [self._read_sample(int(idx)) for idx in np.asarray(indices, dtype=np.int64).ravel()]
+
+    def read_boxes(self, indices, padded=False):
+        """ Reads boxes, class ids and counts for a batch, see ObjDetectionArray.read_boxes """
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        indices = np.where(indices < 0, indices + len(self), indices)
+        return _gather_boxes(self._boxes, self._klass_ids, np.diff(self._offsets), indices,
+                             padded=padded, starts=self._offsets[:-1])
+
+
+class MemmapDataNode(WrappedDataNode):
+    def __init__(self, entry, dirpath, trainer):
+        super(MemmapDataNode, self).__init__(entry, trainer)
+        self._dirpath = dirpath
+
+    def _load(self, path):
+        return np.load(os.path.join(self._dirpath, path), mmap_mode="r")
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = MemmapArray(self._load(self._node["images"]["path"]), self._vset,
+                                       output_transform=self._vset._fw_loader)
+        return self._images
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            entry = self._node["labels"]
+            if self._vset.mltype == "object_detection":
+                self._labels = MemmapBoxArray(self._load(entry["boxes"]), self._load(entry["classes"]),
+                                              self._load(entry["offsets"]), self._vset)
+            else:
+                self._labels = MemmapArray(self._load(entry["path"]), self._vset)
+        return self._labels
+
+
+class MemmapDataBase(BaseDataSet):
+    """
+    Read-only VedaBase opened from the raw files written by H5DataBase.freeze.
+    Partitions are memory-mapped, so many training processes on one node share
+    the page cache instead of each decoding HDF5 chunks.
+
+    Args:
+        dirpath (str): Directory written by freeze_vedabase
+        mode (str): Only "r", frozen stores cannot be written
+    """
+    def __init__(self, dirpath, mode="r"):
+        if mode != "r":
+            raise ValueError("Frozen VedaBases are read-only, open them with mode='r'")
+        with open(os.path.join(dirpath, INDEX_FILE)) as f:
+            self._index = json.load(f)
+        self._dirpath = dirpath
+        self._fw_loader = lambda x: x
+        self._nodes = {}
+        self._label_klass = MLTYPE_MAP[self.mltype]
+
+    def __getstate__(self):
+        # Workers map the files themselves rather than receiving copies of the arrays
+        state = self.__dict__.copy()
+        state["_nodes"] = {}
+        del state["_fw_loader"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fw_loader = lambda x: x
+
+    @staticmethod
+    def is_frozen(path):
+        return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+    @property
+    def mltype(self):
+        return self._index["mltype"]
+
+    @property
+    def classes(self):
+        return self._index["classes"]
+
+    @property
+    def image_shape(self):
+        return self._index["image_shape"]
+
+    @property
+    def image_dtype(self):
+        return np.dtype(self._index["image_dtype"])
+
+    def _wrapped_node(self, name):
+        if name not in self._nodes:
+            self._nodes[name] = MemmapDataNode(self._index["partitions"][name],
+                                               os.path.join(self._dirpath, name), self)
+        return self._nodes[name]
+
+    @property
+    def splits(self):
+        """ Names of the frozen partitions """
+        return sorted(self._index["partitions"])
+
+    def split(self, name):
+        """ Returns the partition called name """
+        if name not in self._index["partitions"]:
+            raise KeyError("No partition named {}".format(name))
+        return self._wrapped_node(name)
+
+    @property
+    def train(self):
+        return self._wrapped_node("train")
+
+    @property
+    def test(self):
+        return self._wrapped_node("test")
+
+    @property
+    def validate(self):
+        return self._wrapped_node("validate")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._nodes = {}
+
+    def __len__(self):
+        return sum([len(self.train), len(self.test), len(self.validate)])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "MemmapDataBase({})".format(self._dirpath)
+
+    @classmethod
+    def from_path(cls, dirpath, **kwargs):
+        return cls(dirpath, **kwargs)
@@ -0,0 +1,237 @@
+import zlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pyveda.vedaset.store.vedabase import WrappedDataNode
+
+has_lz4 = False
+try:
+    import lz4.frame
+    has_lz4 = True
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("lz4", "zlib")
+
+
+def _codec(name):
+    """ Returns (name, compress, decompress) for a codec, lz4 falling back to zlib when not installed """
+    if name == "lz4" and not has_lz4:
+        logger.warning("lz4 is not installed, compressing samples with zlib")
+        name = "zlib"
+    if name == "lz4":
+        return name, lz4.frame.compress, lz4.frame.decompress
+    if name == "zlib":
+        return name, lambda buf: zlib.compress(buf, 1), zlib.decompress
+    raise ValueError("Unknown codec {}, expected one of {}".format(name, CODECS))
+
+
+def _map_chunks(pool, fn, n):
+    """ Calls fn on contiguous chunks of range(n), one chunk per pool thread. zlib and
+    lz4 release the GIL, so samples are encoded and decoded in parallel. """
+    if pool is None or n < 2:
+        fn(range(n))
+        return
+    chunks = np.array_split(np.arange(n), min(n, pool._max_workers))
+    list(pool.map(fn, chunks))
+
+
+class InMemoryArray(object):
+    """
+    A partition array held in RAM, either as one ndarray (or list, for object detection
+    labels) or as per-sample compressed buffers decoded on access by a thread pool.
+    Read with the same read_batch/__getitem__/__iter__ calls as the file-backed arrays.
+
+    Args:
+        data (ndarray or list): Samples, or compressed sample buffers when codec is given
+        read_transform (callable): Per-sample output transform of the source array
+        codec (str): Codec of compressed samples
+        sample_shape (tuple): Shape of a decoded sample
+        dtype: Dtype of a decoded sample
+        pool (ThreadPoolExecutor): Decoding threads
+    """
+    def __init__(self, data, read_transform=lambda x: x, codec=None, sample_shape=None, dtype=None,
+                 pool=None):
+        self._data = data
+        self._read_transform = read_transform
+        self._sample_shape = tuple(sample_shape) if sample_shape is not None else None
+        self._dtype = np.dtype(dtype) if dtype is not None else None
+        self._pool = pool
+        self.codec = None
+        if codec is not None:
+            self.codec, _, self._decompress = _codec(codec)
+
+    @property
+    def nbytes(self):
+        """ Bytes of memory held by the samples """
+        if self.codec is not None:
+            return sum([len(buf) for buf in self._data])
+        if isinstance(self._data, np.ndarray):
+            return self._data.nbytes
+        return sum([np.asarray(item).nbytes for item in self._data])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_read_transform"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._read_transform = lambda x: x
+
+    def _decode(self, bufs):
+        out = np.empty((len(bufs),) + self._sample_shape, dtype=self._dtype)
+
+        def _decode_into(positions):
+            for pos in positions:
+                out[pos] = np.frombuffer(self._decompress(bufs[pos]), dtype=self._dtype).reshape(self._sample_shape)
+        _map_chunks(self._pool, _decode_into, len(bufs))
+        return out
+
+    def read_batch(self, indices):
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        n = len(self)
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("Batch indices out of range for array of length {}".format(n))
+        if self.codec is not None:
+            return self._decode([self._data[i] for i in indices])
+        if isinstance(self._data, np.ndarray):
+            return self._data[indices]
+        return [self._data[i] for i in indices]
+
+    def __iter__(self, spec=slice(None)):
+        if isinstance(spec, slice):
+            positions = np.arange(*spec.indices(len(self)))
+        else:
+            positions = np.asarray(spec, dtype=np.int64).ravel()
+        for start in range(0, len(positions), 256):
+            for item in self.read_batch(positions[start:start + 256]):
+                yield self._read_transform(item)
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            return self._read_transform(self.read_batch([spec])[0])
+        elif isinstance(spec, slice):
+            return list(self.__iter__(spec))
+        return self.read_batch(spec)
+
+    def append(self, item):
+        raise NotImplementedError("In-memory partitions are read-only")
+
+    def append_batch(self, items):
+        raise NotImplementedError("In-memory partitions are read-only")
+
+
+class InMemoryDataNode(WrappedDataNode):
+    """ A partition loaded into RAM, see `WrappedDataNode.load` """
+    def __init__(self, node, images, labels, hits, pool=None):
+        super(InMemoryDataNode, self).__init__(node, node._vset)
+        self._images = images
+        self._labels = labels
+        self._hits = hits
+        self._pool = pool
+
+    def _resolve(self):
+        pass
+
+    @property
+    def images(self):
+        return self._images
+
+    @property
+    def labels(self):
+        return self._labels
+
+    @property
+    def nbytes(self):
+        return self._images.nbytes + self._labels.nbytes
+
+    @property
+    def metadata(self):
+        # Metadata is small, it stays with the source partition
+        return self._node.metadata
+
+    def hit_counts(self):
+        return self._hits
+
+    def append_batch(self, images, labels, metadata=None):
+        raise NotImplementedError("In-memory partitions are read-only")
+
+    def close(self):
+        """ Stops the decoding threads and releases the samples """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._images = InMemoryArray([])
+        self._labels = InMemoryArray([])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        return state
+
+    def __len__(self):
+        return len(self._images)
+
+    def __repr__(self):
+        return "InMemoryDataNode({} samples, {} bytes)".format(len(self), self.nbytes)
+
+
+def load_node(node, memory_budget=None, compress=None, workers=4, block_rows=256):
+    """
+    Reads a whole partition into memory. See `WrappedDataNode.load`.
+    """
+    vset = node._vset
+    n = len(node)
+    sample_shape = tuple(vset.image_shape)
+    dtype = np.dtype(vset.image_dtype)
+    raw_bytes = n * dtype.itemsize * int(np.prod(sample_shape))
+    if compress is None and memory_budget is not None and raw_bytes > memory_budget:
+        raise MemoryError("Partition needs {} bytes of images, over the budget of {}".format(raw_bytes, memory_budget))
+    pool = ThreadPoolExecutor(workers) if workers else None
+    codec, encode = None, None
+    if compress is not None:
+        codec, encode, _ = _codec(compress)
+        images = []
+    else:
+        images = np.empty((n,) + sample_shape, dtype=dtype)
+    labels, held = [], 0
+    try:
+        for start in range(0, n, block_rows):
+            stop = min(start + block_rows, n)
+            x, y = node.read_batch(np.arange(start, stop))
+            if codec is None:
+                images[start:stop] = x
+            else:
+                x = np.ascontiguousarray(x)
+                bufs = [None] * len(x)
+
+                def _encode(positions):
+                    for pos in positions:
+                        bufs[pos] = encode(x[pos])
+                _map_chunks(pool, _encode, len(x))
+                held += sum([len(buf) for buf in bufs])
+                if memory_budget is not None and held > memory_budget:
+                    raise MemoryError("Compressed partition exceeds the budget of {} bytes after {} of {} "
+                                      "samples".format(memory_budget, stop, n))
+                images.extend(bufs)
+            labels.append(y)
+    except Exception:
+        if pool is not None:
+            pool.shutdown()
+        raise
+    if labels and isinstance(labels[0], np.ndarray):
+        labels = np.concatenate(labels)
+    else:
+        labels = [item for block in labels for item in block]
+    img_arr = InMemoryArray(images, read_transform=node.images._read_transform, codec=codec,
+                            sample_shape=sample_shape, dtype=dtype, pool=pool)
+    lbl_arr = InMemoryArray(labels, read_transform=node.labels._read_transform)
+    return InMemoryDataNode(node, img_arr, lbl_arr, node.hit_counts(), pool=pool)
@@ -0,0 +1,262 @@
+import numpy as np
+
+METADATA_DTYPE = np.dtype([("id", "S64"), ("minx", np.float64), ("miny", np.float64), ("maxx", np.float64),
+                           ("maxy", np.float64), ("tile_x", np.int64), ("tile_y", np.int64)])
+
+# Ids are stored as ascii bytes and read back as str
+_READ_DTYPE = np.dtype([(name, "U64" if name == "id" else METADATA_DTYPE[name]) for name in METADATA_DTYPE.names])
+
+BOUNDS = ["minx", "miny", "maxx", "maxy"]
+
+PREDICATES = ("intersects", "within", "contains")
+
+
+def _empty_records(n):
+    records = np.zeros(n, dtype=METADATA_DTYPE)
+    for name in BOUNDS:
+        records[name] = np.nan
+    records["tile_x"] = -1
+    records["tile_y"] = -1
+    return records
+
+
+def sample_metadata(item):
+    """
+    Extracts the datapoint id, bounds and tile coords of one sample.
+
+    Args:
+        item (dict): A Veda datapoint feature, whose properties carry id, bounds and
+            tile_coords, a plain mapping with those keys, or None
+    Returns:
+        tuple: One record of METADATA_DTYPE, missing values are "", NaN and -1
+    """
+    props = item or {}
+    if "properties" in props:
+        props = props["properties"] or {}
+    bounds = props.get("bounds") or [np.nan] * 4
+    tile_coords = props.get("tile_coords") or [-1, -1]
+    _id = props.get("id") or ""
+    return (str(_id).encode("ascii"),) + tuple(float(v) for v in bounds) + tuple(int(v) for v in tile_coords)
+
+
+def to_records(items):
+    """ Converts a batch of metadata, as sample_metadata inputs or outputs or a structured array, into records """
+    if isinstance(items, np.ndarray) and items.dtype.names:
+        return items.astype(METADATA_DTYPE)
+    records = _empty_records(len(items))
+    for idx, item in enumerate(items):
+        records[idx] = item if isinstance(item, tuple) else sample_metadata(item)
+    return records
+
+
+class GridIndex(object):
+    """
+    Spatial index over sample bounds: a uniform grid where every sample is listed
+    in each cell its bounds overlap. Cells default to the median sample extent, so
+    a tile lands in about four cells, and a query only tests the samples listed in
+    the cells it covers.
+
+    Args:
+        bounds (ndarray): (n, 4) minx, miny, maxx, maxy per sample, rows with NaNs are skipped
+        cell_size (float or tuple): Cell width and height
+        max_entries (int): Cells grow until the grid holds at most this many entries per sample
+    """
+    def __init__(self, bounds, cell_size=None, max_entries=8):
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        valid = np.isfinite(bounds).all(axis=1) & (bounds[:, 2] >= bounds[:, 0]) & (bounds[:, 3] >= bounds[:, 1])
+        self._rows = np.flatnonzero(valid).astype(np.int64)
+        self._bounds = bounds[valid]
+        self._cells = np.zeros(0, dtype=np.int64)
+        self._entries = np.zeros(0, dtype=np.int64)
+        self.origin = np.zeros(2)
+        self.cell_size = np.ones(2)
+        self.shape = (0, 0)
+        if not len(self._rows):
+            return
+        b = self._bounds
+        self.origin = b[:, :2].min(axis=0)
+        if cell_size is None:
+            extent = np.median(b[:, 2:] - b[:, :2], axis=0)
+            span = b[:, 2:].max(axis=0) - self.origin
+            cell_size = np.where(extent > 0, extent, np.where(span > 0, span, 1.0))
+        cell = np.array(np.broadcast_to(np.asarray(cell_size, dtype=np.float64), (2,)))
+        while True:
+            lo = np.floor((b[:, :2] - self.origin) / cell).astype(np.int64)
+            hi = np.floor((b[:, 2:] - self.origin) / cell).astype(np.int64)
+            spans = hi - lo + 1
+            counts = spans[:, 0] * spans[:, 1]
+            if counts.sum() <= max_entries * len(b):
+                break
+            cell *= 2
+        self.cell_size = cell
+        self.shape = tuple(int(v) for v in hi.max(axis=0) + 1)
+        # One entry per (sample, covered cell), cells numbered column by column
+        sample = np.repeat(np.arange(len(b), dtype=np.int64), counts)
+        k = np.arange(len(sample), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        height = np.repeat(spans[:, 1], counts)
+        cx = np.repeat(lo[:, 0], counts) + k // height
+        cy = np.repeat(lo[:, 1], counts) + k % height
+        cells = cx * self.shape[1] + cy
+        order = np.argsort(cells, kind="stable")
+        self._cells = cells[order]
+        self._entries = sample[order]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def query(self, bbox, predicate="intersects"):
+        """
+        Finds the samples whose bounds relate to bbox.
+
+        Args:
+            bbox (list): minx, miny, maxx, maxy, in the coordinates of the indexed bounds
+            predicate (str): "intersects", "within" (sample inside bbox) or "contains" (bbox inside sample)
+        Returns:
+            ndarray: Sorted rows of the matching samples
+        """
+        if predicate not in PREDICATES:
+            raise ValueError("predicate must be one of {}".format(", ".join(PREDICATES)))
+        minx, miny, maxx, maxy = [float(v) for v in bbox]
+        empty = np.zeros(0, dtype=np.int64)
+        if not len(self._rows) or maxx < minx or maxy < miny:
+            return empty
+        lo = np.floor((np.array([minx, miny]) - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((np.array([maxx, maxy]) - self.origin) / self.cell_size).astype(np.int64)
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, np.array(self.shape) - 1)
+        if (hi < lo).any():
+            return empty
+        if np.prod(hi - lo + 1) >= len(self._cells):
+            # Covers most of the grid, testing every sample is cheaper
+            candidates = np.arange(len(self._rows))
+        else:
+            columns = np.arange(lo[0], hi[0] + 1) * self.shape[1]
+            starts = np.searchsorted(self._cells, columns + lo[1], side="left")
+            stops = np.searchsorted(self._cells, columns + hi[1], side="right")
+            candidates = np.unique(np.concatenate([self._entries[start:stop]
+                                                   for start, stop in zip(starts, stops)]))
+        b = self._bounds[candidates]
+        if predicate == "intersects":
+            ok = (b[:, 0] <= maxx) & (b[:, 2] >= minx) & (b[:, 1] <= maxy) & (b[:, 3] >= miny)
+        elif predicate == "within":
+            ok = (b[:, 0] >= minx) & (b[:, 2] <= maxx) & (b[:, 1] >= miny) & (b[:, 3] <= maxy)
+        else:
+            ok = (b[:, 0] <= minx) & (b[:, 2] >= maxx) & (b[:, 1] <= miny) & (b[:, 3] >= maxy)
+        return np.sort(self._rows[candidates[ok]])
+
+
+class MetadataArray(object):
+    """
+    Per-sample datapoint ids, bounds and tile coords, kept in a "metadata" table
+    beside the sample arrays of a group with one row per sample. Samples appended
+    without metadata get empty rows, and files written before metadata was
+    recorded read as all empty. Bounds queries use a GridIndex built from the
+    table on first use and rebuilt after appends.
+
+    Args:
+        group (tables.Group): Group holding the sample arrays
+        trainer (H5DataBase): The store
+        count (callable): Returns the number of samples in the group
+    """
+    def __init__(self, group, trainer, count):
+        self._group = group
+        self._vset = trainer
+        self._count = count
+        self._index = None
+        self._index_rows = -1
+
+    @property
+    def _table(self):
+        if "metadata" in self._group:
+            return self._group._f_get_child("metadata")
+        return None
+
+    def _read_transform(self, item):
+        return item
+
+    def flush(self):
+        table = self._table
+        if table is not None:
+            buf = self._vset._append_buffer(table)
+            if buf is not None:
+                buf.flush()
+
+    def __len__(self):
+        return self._count()
+
+    def read_batch(self, indices):
+        """
+        Args:
+            indices (array-like): Sample indices, in any order
+        Returns:
+            ndarray: Structured array with id, minx, miny, maxx, maxy, tile_x and tile_y fields
+        """
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        n = len(self)
+        indices = np.where(indices < 0, indices + n, indices)
+        if indices.size and (indices.min() < 0 or indices.max() >= n):
+            raise IndexError("Batch indices out of range for array of length {}".format(n))
+        records = _empty_records(len(indices))
+        table = self._table
+        if table is not None:
+            self.flush()
+            stored = np.flatnonzero(indices < table.nrows)
+            if stored.size:
+                uniq, inverse = np.unique(indices[stored], return_inverse=True)
+                records[stored] = table.read_coordinates(uniq)[inverse]
+        return records.astype(_READ_DTYPE)
+
+    def __getitem__(self, spec):
+        if isinstance(spec, (int, np.integer)):
+            return self.read_batch([spec])[0]
+        elif isinstance(spec, slice):
+            return self.read_batch(np.arange(*spec.indices(len(self))))
+        return self.read_batch(spec)
+
+    def append(self, item):
+        self.append_batch([item])
+
+    def truncate(self, n):
+        """ Drops the metadata of every sample from index n on """
+        table = self._table
+        self.flush()
+        if table is not None and table.nrows > n:
+            table.truncate(n)
+
+    def append_batch(self, items):
+        """ Appends metadata for the samples about to be appended to the group """
+        records = to_records(items)
+        table = self._table
+        if table is None:
+            table = self.create_table(self._vset, self._group)
+        buf = self._vset._append_buffer(table)
+        missing = self._count() - table.nrows - (len(buf) if buf is not None else 0)
+        if missing > 0:
+            records = np.concatenate([_empty_records(missing), records])
+        if buf is None:
+            table.append(records)
+        else:
+            buf.append(records)
+
+    @staticmethod
+    def create_table(trainer, group):
+        layout = trainer.layout
+        return trainer._fileh.create_table(group, "metadata", METADATA_DTYPE, "Sample metadata",
+                                           filters=layout.filters,
+                                           expectedrows=layout.expected_rows(group._v_name) or 10000)
+
+    @property
+    def index(self):
+        """ The GridIndex over the sample bounds """
+        table = self._table
+        self.flush()
+        nrows = 0 if table is None else table.nrows
+        if self._index is None or self._index_rows != nrows:
+            rows = table.read() if nrows else _empty_records(0)
+            self._index = GridIndex(np.stack([rows[name] for name in BOUNDS], axis=1))
+            self._index_rows = nrows
+        return self._index
+
+    def query_bbox(self, bounds, predicate="intersects"):
+        """ Indexed bounds query, see WrappedDataNode.query_bbox """
+        return self.index.query(getattr(bounds, "bounds", bounds), predicate=predicate)
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+import tables
+from pyveda.vedaset.store.layout import StorageLayout
+
+
+def _block_rows(vb, layout, block_bytes=2**26):
+    """ Rows per copied block: a multiple of the target chunk length close to block_bytes """
+    sample_bytes = np.dtype(vb.image_dtype).itemsize * int(np.prod(vb.image_shape))
+    rows = max(1, int(block_bytes // max(sample_bytes, 1)))
+    chunk = layout.chunk_samples or 1
+    return max(chunk, rows // chunk * chunk)
+
+
+def _exclusions(vb, exclude):
+    """ Normalizes exclude into {segment: sorted positions}, where segments are the
+    arrays samples are copied from: "/data" or, in older files, each partition """
+    if exclude is None:
+        exclude = []
+    segments = {}
+    if isinstance(exclude, dict):
+        for name, positions in exclude.items():
+            positions = np.asarray(positions, dtype=np.int64)
+            if vb._indexed:
+                segments.setdefault("/data", []).append(vb.split(name).rows[positions])
+            else:
+                segments.setdefault(name, []).append(positions)
+    else:
+        if not vb._indexed:
+            raise ValueError("Exclude samples of a file with per-partition groups as {partition: positions}")
+        segments["/data"] = [np.asarray(exclude, dtype=np.int64)]
+    return {key: np.unique(np.concatenate(value)) for key, value in segments.items()}
+
+
+def _copy(src, dest, keep, block_rows):
+    # Metadata goes first, it is padded up to the samples already in dest
+    metadata = src.metadata if src.metadata._table is not None else None
+    for start in range(0, len(keep), block_rows):
+        idx = keep[start:start + block_rows]
+        if metadata is not None:
+            dest._data.metadata.append_batch(metadata.read_batch(idx))
+        dest._data.images.append_batch(src.images.read_batch(idx))
+        dest._data.labels.append_batch(src.labels.read_batch(idx))
+
+
+def repack_vedabase(vb, fname, layout=None, exclude=None, overwrite=False, threads=None,
+                    block_bytes=2**26):
+    """
+    Streams a VedaBase into a new file, dropping excluded samples and writing
+    with a new storage layout. Samples are copied in large blocks aligned to the
+    target chunks, with Blosc compressing on several threads, along with their
+    recorded metadata.
+
+    Args:
+        vb (H5DataBase): Source store
+        fname (str): Path of the new file
+        layout (StorageLayout, dict or str): Layout of the new file, defaults to the source layout
+        exclude (array-like or dict): Global sample rows to drop, or a mapping of partition
+            name to positions within that partition, e.g. from Labelizer.removed_indices
+        overwrite (bool): Replace an existing file at fname
+        threads (int): Blosc compression threads, defaults to the cpu count
+        block_bytes (int): Approximate size of each copied block of images
+    Returns:
+        H5DataBase: The repacked store, partitioned like the source
+    """
+    from pyveda.vedaset.store.vedabase import H5DataBase, PARTITIONS
+    if os.path.abspath(fname) == os.path.abspath(vb._fname):
+        raise ValueError("Repack into a new file, then replace the source")
+    if os.path.exists(fname) and not overwrite:
+        raise ValueError("{} already exists, pass overwrite=True to replace it".format(fname))
+    vb.flush()
+    layout = StorageLayout.from_dict(StorageLayout.from_spec(layout or vb.layout).to_dict())
+    excluded = _exclusions(vb, exclude)
+
+    # Work out the rows kept from every source segment and where each partition lands
+    if vb._indexed:
+        n = vb._n_samples()
+        keep = np.setdiff1d(np.arange(n, dtype=np.int64), excluded.get("/data", []))
+        new_rows = np.full(n, -1, dtype=np.int64)
+        new_rows[keep] = np.arange(len(keep))
+        segments = [(vb._data, keep)]
+        splits = {}
+        for name in vb.splits:
+            rows = new_rows[vb.split(name).rows]
+            splits[name] = rows[rows >= 0]
+    else:
+        segments, splits, offset = [], {}, 0
+        names = [name for name in PARTITIONS if name in vb.splits]
+        for name in names + [name for name in vb.splits if name not in names]:
+            node = vb.split(name)
+            keep = np.setdiff1d(np.arange(len(node), dtype=np.int64), excluded.get(name, []))
+            segments.append((node, keep))
+            splits[name] = np.arange(offset, offset + len(keep), dtype=np.int64)
+            offset += len(keep)
+    if layout.expectedrows is None:
+        layout.expectedrows = {name: len(rows) for name, rows in splits.items() if name in PARTITIONS}
+
+    dest = H5DataBase(fname, mltype=vb.mltype, klasses=vb.classes, image_shape=vb.image_shape,
+                      image_dtype=vb.image_dtype, layout=layout, overwrite=overwrite)
+    block_rows = _block_rows(vb, layout, block_bytes)
+    nthreads = tables.set_blosc_max_threads(threads or os.cpu_count() or 1)
+    try:
+        for node, keep in segments:
+            _copy(node, dest, keep, block_rows)
+    finally:
+        tables.set_blosc_max_threads(nthreads)
+    for name, rows in splits.items():
+        dest.set_split(name, rows)
+    dest.flush()
+    return dest
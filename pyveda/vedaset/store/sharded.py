@@ -0,0 +1,436 @@
+import os
+import json
+import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from pyveda.exceptions import LabelNotSupported
+from pyveda.vedaset.abstract import BaseDataSet
+from pyveda.vedaset.store.concat import ConcatDataNode, _groups, _scatter
+from pyveda.vedaset.store.layout import StorageLayout
+from pyveda.vedaset.store.stats import BandStats
+from pyveda.vedaset.store.vedabase import H5DataBase, MLTYPE_MAP, PARTITIONS
+from pyveda.vedaset.store.arrays import NDImageArray
+
+MANIFEST_FILE = "manifest.json"
+
+# Shards opened by each reader process, keyed by path
+_worker_shards = {}
+
+
+def _shard_name(idx):
+    return "shard-{:05d}.h5".format(idx)
+
+
+def _read_shard(path, name, indices):
+    """ Reads a batch from one shard inside a pool worker, which keeps its own read-only handle """
+    vb = _worker_shards.get(path)
+    if vb is None:
+        vb = _worker_shards[path] = H5DataBase(path, mode="r")
+    return vb.split(name).read_batch(indices)
+
+
+class ShardedDataNode(ConcatDataNode):
+    """ A partition spanning every shard. Appends go to the shard being written,
+    batch reads fan out over the store's reader pool. """
+    def __init__(self, name, trainer):
+        super(ShardedDataNode, self).__init__(name, trainer)
+        self._nshards = None
+
+    @property
+    def _parts(self):
+        return [shard.split(self._node) for shard in self._vset.shards]
+
+    def _refresh(self):
+        # Rebuild the concatenated arrays once a shard has been added
+        if self._nshards != len(self._vset._manifest["shards"]):
+            self._nshards = len(self._vset._manifest["shards"])
+            self._images = None
+            self._labels = None
+
+    @property
+    def images(self):
+        self._refresh()
+        return super(ShardedDataNode, self).images
+
+    @property
+    def labels(self):
+        self._refresh()
+        return super(ShardedDataNode, self).labels
+
+    def append_batch(self, images, labels, metadata=None):
+        """ Appends a batch, splitting it across shards when the current shard fills up """
+        self._vset._append(self._node, images, labels, metadata=metadata)
+        self._refresh()
+
+    def read_batch(self, indices):
+        return self._vset._read(self._node, indices)
+
+    def __len__(self):
+        return sum([len(node) for node in self._parts])
+
+
+class ShardedDataBase(BaseDataSet):
+    """
+    A VedaBase split over many HDF5 files (shards) listed in a JSON manifest.
+    Appends fill one shard at a time and roll over to a new file once it holds
+    shard_samples samples or shard_bytes bytes of images; batch reads are split
+    per shard and run on a pool of readers, so shards spread over several disks
+    are read in parallel.
+
+    Every shard is a complete VedaBase with its own partitions, so a shard that
+    failed to write can be discarded with `reset_shard` and rebuilt on its own
+    without touching the others.
+
+    Args:
+        dirpath (str): Directory holding the manifest, and the shards unless shard_dirs is given
+        mltype (str): One of "classification", "segmentation", "object_detection"
+        klasses (list): Class names
+        image_shape (list): Shape of a single image
+        image_dtype: Image data type
+        shard_samples (int): Samples per shard
+        shard_bytes (int): Image bytes per shard, the smaller limit applies when both are set
+        shard_dirs (list): Directories the shards are assigned to in turn, e.g. one per disk
+        layout (StorageLayout, dict or str): Layout of every shard
+        overwrite (bool): Remove an existing store at dirpath first
+        mode (str): "a" to append, "r" to open read-only
+        workers (int): Concurrent shard readers, 0 or 1 reads in this process
+        pool (str): "process" or "thread". Worker processes each open their own read-only
+            handles; threads share this process and need a thread-safe HDF5 build.
+
+    Reads only fan out to the pool when the store is opened read-only (mode="r"),
+    since HDF5 locks the shards while they are open for writing.
+    """
+    _records_metadata = True
+
+    def __init__(self, dirpath, mltype=None, klasses=None, image_shape=None,
+                 image_dtype=None, shard_samples=None, shard_bytes=None, shard_dirs=None,
+                 layout=None, overwrite=False, mode="a", workers=4, pool="process", **kwargs):
+        if pool not in ("process", "thread"):
+            raise ValueError("pool must be 'process' or 'thread', got {}".format(pool))
+        self._dirpath = dirpath
+        self._mode = mode
+        self._workers = workers
+        self._pool_kind = pool
+        self._pool = None
+        self._framework = None
+        self._fw_loader = lambda x: x
+        self._nodes = {}
+        self._shards = None
+        self._kwargs = kwargs
+        manifest_path = os.path.join(dirpath, MANIFEST_FILE)
+        if os.path.exists(manifest_path) and overwrite:
+            self._remove_shards(manifest_path)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self._manifest = json.load(f)
+            if mode != "r":
+                # Appends after the manifest was last written, e.g. before a crash, still count
+                self.refresh()
+        else:
+            if mode == "r":
+                raise ValueError("No sharded store at {}".format(dirpath))
+            if mltype not in MLTYPE_MAP:
+                raise LabelNotSupported("Unsupported mltype: {}".format(mltype))
+            layout = StorageLayout.from_spec(layout)
+            if shard_samples and layout.expectedrows is None:
+                layout.expectedrows = int(shard_samples)
+            self._manifest = {"mltype": mltype,
+                              "classes": [str(klass) for klass in klasses],
+                              "image_shape": [int(d) for d in image_shape],
+                              "image_dtype": np.dtype(image_dtype).str,
+                              "shard_samples": int(shard_samples) if shard_samples else None,
+                              "shard_bytes": int(shard_bytes) if shard_bytes else None,
+                              "shard_dirs": list(shard_dirs or []),
+                              "layout": layout.to_dict(),
+                              "shards": []}
+            os.makedirs(dirpath, exist_ok=True)
+            self._write_manifest()
+        self._image_klass = NDImageArray
+        self._label_klass = MLTYPE_MAP[self.mltype]
+
+    def _remove_shards(self, manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        for shard in manifest["shards"]:
+            path = self._shard_path(shard)
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(self._dirpath)
+
+    def __getstate__(self):
+        if self._shards is not None and not self.read_only:
+            self.flush()
+        state = self.__dict__.copy()
+        state["_nodes"] = {}
+        state["_shards"] = None
+        state["_pool"] = None
+        state["_mode"] = "r"
+        del state["_fw_loader"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fw_loader = lambda x: x
+
+    @staticmethod
+    def is_sharded(path):
+        return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    @property
+    def read_only(self):
+        return self._mode == "r"
+
+    @property
+    def mltype(self):
+        return self._manifest["mltype"]
+
+    @property
+    def classes(self):
+        return self._manifest["classes"]
+
+    @property
+    def image_shape(self):
+        return self._manifest["image_shape"]
+
+    @property
+    def image_dtype(self):
+        return np.dtype(self._manifest["image_dtype"])
+
+    @property
+    def layout(self):
+        return StorageLayout.from_dict(self._manifest["layout"])
+
+    @property
+    def stats(self):
+        """ Per-band image statistics merged over every shard, None if any shard has none.
+        Shards whose histogram ranges were inferred from their own samples are
+        rebinned to the range covering all of them first. """
+        shard_stats = [vb.stats for vb in self.shards]
+        if any(stats is None for stats in shard_stats):
+            return None
+        ranges = [stats.range for stats in shard_stats if stats.range is not None and stats.count.any()]
+        union = [min(r[0] for r in ranges), max(r[1] for r in ranges)] if ranges else None
+        merged = BandStats.for_store(self)
+        for stats in shard_stats:
+            if union is not None and stats.range is not None and stats.range != union:
+                stats = BandStats.from_dict(stats.to_dict()).rebin(union)
+            merged.merge(stats)
+        return merged
+
+    @property
+    def manifest(self):
+        return dict(self._manifest)
+
+    def _write_manifest(self):
+        path = os.path.join(self._dirpath, MANIFEST_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._manifest, f, indent=2)
+        os.replace(tmp, path)
+
+    def _shard_path(self, shard):
+        return os.path.join(self._dirpath, shard["path"])
+
+    def _open_shard(self, shard, overwrite=False):
+        path = self._shard_path(shard)
+        if self.read_only:
+            return H5DataBase(path, mode="r")
+        return H5DataBase(path, mltype=self.mltype, klasses=self.classes,
+                          image_shape=self.image_shape, image_dtype=self.image_dtype,
+                          layout=self._manifest["layout"], overwrite=overwrite, **self._kwargs)
+
+    @property
+    def shards(self):
+        """ The shard stores, in sample order """
+        if self._shards is None:
+            self._shards = [self._open_shard(shard) for shard in self._manifest["shards"]]
+        return self._shards
+
+    def _shard_capacity(self):
+        limits = []
+        if self._manifest["shard_samples"]:
+            limits.append(self._manifest["shard_samples"])
+        if self._manifest["shard_bytes"]:
+            sample_bytes = self.image_dtype.itemsize * int(np.prod(self.image_shape))
+            limits.append(max(1, self._manifest["shard_bytes"] // sample_bytes))
+        return min(limits) if limits else None
+
+    def _new_shard(self):
+        idx = len(self._manifest["shards"])
+        dirs = self._manifest["shard_dirs"]
+        if dirs:
+            root = dirs[idx % len(dirs)]
+            os.makedirs(root, exist_ok=True)
+            path = os.path.abspath(os.path.join(root, _shard_name(idx)))
+        else:
+            path = _shard_name(idx)
+        shard = {"path": path, "count": 0, "complete": False}
+        self.shards.append(self._open_shard(shard, overwrite=True))
+        self._manifest["shards"].append(shard)
+        self._write_manifest()
+        return idx
+
+    def _writable_shard(self):
+        """ Index of the shard taking appends, starting a new one when the last is full """
+        if self.read_only:
+            raise ValueError("Sharded store is open read-only")
+        shards = self._manifest["shards"]
+        capacity = self._shard_capacity()
+        if shards and not shards[-1]["complete"]:
+            if capacity is None or shards[-1]["count"] < capacity:
+                return len(shards) - 1
+            self._complete(len(shards) - 1)
+        return self._new_shard()
+
+    def _complete(self, idx):
+        shard = self._manifest["shards"][idx]
+        self.shards[idx].flush()
+        shard["count"] = len(self.shards[idx])
+        shard["complete"] = True
+        self._write_manifest()
+
+    def _append(self, name, images, labels, metadata=None):
+        capacity = self._shard_capacity()
+        start, n = 0, len(images)
+        while start < n:
+            idx = self._writable_shard()
+            shard = self._manifest["shards"][idx]
+            stop = n if capacity is None else min(n, start + capacity - shard["count"])
+            self.shards[idx].split(name).append_batch(images[start:stop], labels[start:stop],
+                                                      metadata=None if metadata is None else metadata[start:stop])
+            shard["count"] += stop - start
+            start = stop
+        self._write_manifest()
+
+    def _executor(self):
+        if self._pool is None:
+            klass = ProcessPoolExecutor if self._pool_kind == "process" else ThreadPoolExecutor
+            self._pool = klass(self._workers)
+        return self._pool
+
+    def _read(self, name, indices):
+        """ Reads a batch across shards, one task per shard touched """
+        node = self._wrapped_node(name)
+        parts = node._parts
+        bounds = np.cumsum([0] + [len(part) for part in parts])
+        groups = list(_groups(bounds, indices))
+        if not groups:
+            return parts[0].read_batch([]) if parts else (np.empty((0,) + tuple(self.image_shape),
+                                                                   dtype=self.image_dtype), [])
+        if not self.read_only or not self._workers or self._workers < 2 or len(groups) < 2:
+            results = [parts[part].read_batch(local) for part, sel, local in groups]
+        elif self._pool_kind == "process":
+            futures = [self._executor().submit(_read_shard, self._shard_path(self._manifest["shards"][part]),
+                                               name, local) for part, sel, local in groups]
+            results = [future.result() for future in futures]
+        else:
+            futures = [self._executor().submit(parts[part].read_batch, local) for part, sel, local in groups]
+            results = [future.result() for future in futures]
+        n = len(np.asarray(indices).ravel())
+        images = _scatter(n, [(sel, result[0]) for (part, sel, local), result in zip(groups, results)])
+        labels = _scatter(n, [(sel, result[1]) for (part, sel, local), result in zip(groups, results)])
+        return images, labels
+
+    def reset_shard(self, idx):
+        """
+        Discards the samples of one shard and recreates it empty, e.g. after a failed
+        write. The returned store can be refilled independently of the other shards.
+
+        Args:
+            idx (int): Shard index in the manifest
+        Returns:
+            H5DataBase: The empty shard, open for appends
+        """
+        if self.read_only:
+            raise ValueError("Sharded store is open read-only")
+        shard = self._manifest["shards"][idx]
+        self.shards[idx].close()
+        self.shards[idx] = self._open_shard(shard, overwrite=True)
+        shard["count"] = 0
+        shard["complete"] = False
+        self._nodes = {}
+        self._write_manifest()
+        return self.shards[idx]
+
+    def refresh(self):
+        """ Records the current sample count of every shard in the manifest,
+        e.g. after a shard was rebuilt on its own """
+        for shard, vb in zip(self._manifest["shards"], self.shards):
+            vb.flush()
+            shard["count"] = len(vb)
+        if not self.read_only:
+            self._write_manifest()
+        self._nodes = {}
+
+    def recover(self):
+        """ Drops partially written samples from every shard, see H5DataBase.recover """
+        dropped = sum([vb.recover() for vb in self.shards])
+        self.refresh()
+        return dropped
+
+    def stored_ids(self):
+        return set().union(*[vb.stored_ids() for vb in self.shards])
+
+    def _wrapped_node(self, name):
+        if name not in self._nodes:
+            self._nodes[name] = ShardedDataNode(name, self)
+        return self._nodes[name]
+
+    @property
+    def splits(self):
+        names = [set(shard.splits) for shard in self.shards]
+        return sorted(set.intersection(*names)) if names else list(PARTITIONS)
+
+    def split(self, name):
+        return self._wrapped_node(name)
+
+    @property
+    def train(self):
+        return self._wrapped_node("train")
+
+    @property
+    def test(self):
+        return self._wrapped_node("test")
+
+    @property
+    def validate(self):
+        return self._wrapped_node("validate")
+
+    def flush(self):
+        if not self.read_only:
+            for shard, vb in zip(self._manifest["shards"], self.shards):
+                vb.flush()
+                shard["count"] = len(vb)
+            self._write_manifest()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._shards is not None:
+            self.flush()
+            for vb in self._shards:
+                vb.close()
+            self._shards = None
+        self._nodes = {}
+
+    def reopen(self):
+        """ Shards closed by close() are reopened, in the store's mode, on first use """
+        self._nodes = {}
+
+    def __len__(self):
+        return sum([shard["count"] for shard in self._manifest["shards"]])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return "ShardedDataBase({}, {} shards, {} samples)".format(self._dirpath, len(self._manifest["shards"]),
+                                                                   len(self))
+
+    @classmethod
+    def from_path(cls, dirpath, **kwargs):
+        return cls(dirpath, **kwargs)
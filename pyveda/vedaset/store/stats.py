@@ -0,0 +1,251 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+def _default_range(dtype):
+    """ Histogram range covering every value of an integer dtype, None for floats """
+    dtype = np.dtype(dtype)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        return [float(info.min), float(info.max) + 1]
+    if dtype == np.bool_:
+        return [0., 2.]
+    return None
+
+
+class BandStats(object):
+    """
+    Running per-band image statistics: pixel count, mean, sum of squared deviations
+    (M2), min, max and a fixed-bin histogram. Batches are folded in with the parallel
+    form of Welford's update, vectorized over every pixel of the batch, so stats of
+    any number of batches or of separately computed blocks can be merged exactly.
+
+    Args:
+        nbands (int): Number of bands, the leading axis of every image
+        bins (int): Histogram bins per band
+        range (list): [low, high) histogram range shared by every band. Taken from the
+            first batch when None and doubled, merging pairs of bins, whenever later
+            values fall outside it, which needs an even number of bins.
+    """
+    def __init__(self, nbands, bins=256, range=None):
+        self.nbands = int(nbands)
+        self.bins = int(bins)
+        self.range = [float(v) for v in range] if range is not None else None
+        self.range_inferred = range is None
+        if self.range_inferred and self.bins % 2:
+            raise ValueError("Histograms without a given range need an even number of bins")
+        self.count = np.zeros(self.nbands, dtype=np.int64)
+        self.mean = np.zeros(self.nbands, dtype=np.float64)
+        self.m2 = np.zeros(self.nbands, dtype=np.float64)
+        self.min = np.full(self.nbands, np.inf)
+        self.max = np.full(self.nbands, -np.inf)
+        self.hist = np.zeros((self.nbands, self.bins), dtype=np.int64)
+
+    @classmethod
+    def for_store(cls, vb, bins=256, range=None):
+        shape = list(vb.image_shape)
+        nbands = shape[0] if len(shape) == 3 else 1
+        return cls(nbands, bins=bins, range=range if range is not None else _default_range(vb.image_dtype))
+
+    @property
+    def var(self):
+        return self.m2 / np.maximum(self.count, 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def edges(self):
+        if self.range is None:
+            return None
+        return np.linspace(self.range[0], self.range[1], self.bins + 1)
+
+    def _bands(self, images):
+        images = np.asarray(images)
+        if images.ndim == 0 or not images.size:
+            return images.reshape(self.nbands, 0)
+        return np.moveaxis(images.reshape(len(images), self.nbands, -1), 1, 0).reshape(self.nbands, -1)
+
+    def _widen(self, lo, hi):
+        """ Doubles the range towards [lo, hi] until it covers it, merging pairs of bins,
+        so counts already binned stay exact """
+        while lo < self.range[0] or hi > self.range[1]:
+            rlo, rhi = self.range
+            span = rhi - rlo
+            merged = self.hist.reshape(self.nbands, self.bins // 2, 2).sum(axis=2)
+            empty = np.zeros_like(merged)
+            if lo < rlo:
+                self.hist = np.concatenate([empty, merged], axis=1)
+                self.range = [rlo - span, rhi]
+            else:
+                self.hist = np.concatenate([merged, empty], axis=1)
+                self.range = [rlo, rhi + span]
+
+    def rebin(self, range):
+        """
+        Redistributes the histogram over another range, in place, spreading the
+        counts of every bin uniformly over it. Totals stay exact, the bins are
+        approximate unless the new edges line up with the old ones.
+        """
+        range = [float(v) for v in range]
+        if self.range is not None and range != self.range:
+            edges = np.linspace(range[0], range[1], self.bins + 1)
+            cum = np.concatenate([np.zeros((self.nbands, 1), dtype=np.int64), np.cumsum(self.hist, axis=1)], axis=1)
+            cum = np.array([np.interp(edges, self.edges, band) for band in cum])
+            # Values outside the new range land in the outermost bins, as in update
+            cum[:, 0], cum[:, -1] = 0, self.hist.sum(axis=1)
+            self.hist = np.diff(np.rint(cum).astype(np.int64), axis=1)
+        self.range = range
+        return self
+
+    def update(self, images):
+        """ Folds a batch of band-first images, shaped (n, bands, ...), into the stats """
+        x = self._bands(images)
+        if not x.shape[1]:
+            return self
+        xmin, xmax = x.min(axis=1), x.max(axis=1)
+        lo, hi = _finite_bounds(x, xmin, xmax)
+        if self.range is None:
+            if lo > hi:
+                lo, hi = 0., 1.
+            self.range = [lo, hi if hi > lo else lo + 1]
+        elif self.range_inferred and lo <= hi:
+            self._widen(lo, hi)
+        other = BandStats(self.nbands, bins=self.bins, range=self.range)
+        other.count[:] = x.shape[1]
+        other.mean = x.mean(axis=1, dtype=np.float64)
+        other.m2 = ((x - other.mean[:, np.newaxis]) ** 2).sum(axis=1)
+        other.min, other.max = xmin.astype(np.float64), xmax.astype(np.float64)
+        lo, hi = self.range
+        idx = ((x - lo) * (self.bins / (hi - lo))).astype(np.int64)
+        np.clip(idx, 0, self.bins - 1, out=idx)
+        idx += np.arange(self.nbands)[:, np.newaxis] * self.bins
+        other.hist = np.bincount(idx.ravel(), minlength=self.nbands * self.bins).reshape(self.nbands, self.bins)
+        return self.merge(other)
+
+    def merge(self, other):
+        """ Combines the stats of another set of samples into these, in place """
+        if other.nbands != self.nbands or other.bins != self.bins:
+            raise ValueError("Cannot merge stats with different bands or bins")
+        if self.range is None:
+            self.range = other.range
+        elif other.range is not None and other.range != self.range and other.count.any():
+            raise ValueError("Cannot merge histograms over different ranges: {} and {}".format(
+                self.range, other.range))
+        n = self.count + other.count
+        safe = np.maximum(n, 1)
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / safe
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / safe
+        self.count = n
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.hist = self.hist + other.hist
+        return self
+
+    def normalizer(self, method="minmax"):
+        """
+        Per-band constants that normalize images with a single multiply-add,
+        `images * scale + offset`.
+
+        Args:
+            method (str): "minmax" maps every band to [0, 1], "standard" to zero mean and unit variance
+        Returns:
+            scale (ndarray), offset (ndarray): One value per band
+        """
+        if method == "minmax":
+            span = self.max - self.min
+            scale = 1. / np.where(span > 0, span, 1.)
+            return scale, -self.min * scale
+        elif method == "standard":
+            std = self.std
+            scale = 1. / np.where(std > 0, std, 1.)
+            return scale, -self.mean * scale
+        raise ValueError("Unknown normalization {}, expected 'minmax' or 'standard'".format(method))
+
+    def to_dict(self):
+        return {"nbands": self.nbands, "bins": self.bins, "range": self.range,
+                "range_inferred": self.range_inferred,
+                "count": self.count.tolist(), "mean": self.mean.tolist(), "m2": self.m2.tolist(),
+                "min": self.min.tolist(), "max": self.max.tolist(), "hist": self.hist.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        inst = cls(d["nbands"], bins=d["bins"], range=d["range"])
+        inst.range_inferred = d.get("range_inferred", d["range"] is None)
+        inst.count = np.array(d["count"], dtype=np.int64)
+        inst.mean = np.array(d["mean"], dtype=np.float64)
+        inst.m2 = np.array(d["m2"], dtype=np.float64)
+        inst.min = np.array(d["min"], dtype=np.float64)
+        inst.max = np.array(d["max"], dtype=np.float64)
+        inst.hist = np.array(d["hist"], dtype=np.int64).reshape(inst.nbands, inst.bins)
+        return inst
+
+    def __repr__(self):
+        return "BandStats(bands={}, count={}, mean={}, std={})".format(self.nbands, self.count.tolist(),
+                                                                       self.mean.tolist(), self.std.tolist())
+
+
+def _finite_bounds(x, xmin=None, xmax=None):
+    """ Smallest and largest finite value of an array, (inf, -inf) when there is none """
+    lo = float(np.min(x) if xmin is None else xmin.min())
+    hi = float(np.max(x) if xmax is None else xmax.max())
+    if not (np.isfinite(lo) and np.isfinite(hi)):
+        finite = x[np.isfinite(x)]
+        if not finite.size:
+            return np.inf, -np.inf
+        lo, hi = float(finite.min()), float(finite.max())
+    return lo, hi
+
+
+def scan_range(arrays, stats, block_rows=256):
+    """ Cheap first pass setting the histogram range of stats to the value range of every array """
+    lo, hi = np.inf, -np.inf
+    for images in arrays:
+        n = len(images)
+        for start in range(0, n, block_rows):
+            block = stats._bands(images.read_batch(np.arange(start, min(start + block_rows, n))))
+            if block.size:
+                blo, bhi = _finite_bounds(block)
+                lo, hi = min(lo, blo), max(hi, bhi)
+    if lo <= hi:
+        stats.range = [lo, hi if hi > lo else lo + 1]
+    return stats
+
+
+def compute_stats(images, stats, block_rows=256, workers=None):
+    """
+    Computes stats over an image array. Blocks are read here and reduced on a pool
+    of threads (numpy releases the GIL), and the partial stats are merged. Without a
+    histogram range a first min/max pass over the array sets it.
+
+    Args:
+        images: Image array with len() and read_batch(indices)
+        stats (BandStats): Empty stats fixing the bands, bins and range
+        block_rows (int): Samples per block
+        workers (int): Reducing threads, defaults to 4
+    Returns:
+        BandStats: stats, updated in place
+    """
+    n = len(images)
+    if stats.range is None and n:
+        # Blocks reduced in parallel must share one histogram range
+        scan_range([images], stats, block_rows=block_rows)
+
+    def _reduce(block):
+        return BandStats(stats.nbands, bins=stats.bins, range=stats.range).update(block)
+
+    workers = workers or 4
+    with ThreadPoolExecutor(workers) as executor:
+        # Bound the blocks held in memory while reads run ahead of the reductions
+        pending = deque()
+        for start in range(0, n, block_rows):
+            block = images.read_batch(np.arange(start, min(start + block_rows, n)))
+            pending.append(executor.submit(_reduce, block))
+            if len(pending) >= 2 * workers:
+                stats.merge(pending.popleft().result())
+        while pending:
+            stats.merge(pending.popleft().result())
+    return stats
@@ -1,12 +1,21 @@
 import os
+import atexit
+import logging
+import weakref
 from functools import partial, wraps
 from collections import OrderedDict, defaultdict
 import numpy as np
 import tables
 from pyveda.utils import mktempfilename, _atom_from_dtype, ignore_warnings
 from pyveda.exceptions import LabelNotSupported, FrameworkNotSupported
-from pyveda.vedaset.store.arrays import ClassificationArray, SegmentationArray, ObjDetectionArray, NDImageArray
+from pyveda.vedaset.store.arrays import ClassificationArray, SegmentationArray, ObjDetectionArray, NDImageArray, JSONObjDetectionArray, IndexedArray, match_hits
+from pyveda.vedaset.store.layout import StorageLayout
+from pyveda.vedaset.store.buffer import AppendBuffer
+from pyveda.vedaset.store.stats import BandStats, compute_stats, scan_range
+from pyveda.vedaset.store.cache import SampleCache
+from pyveda.vedaset.store.metadata import MetadataArray
 from pyveda.vedaset.abstract import BaseSampleArray, BaseDataSet
+from pyveda.frameworks import framework_loader
 from pyveda.frameworks.batch_generator import VedaStoreGenerator
 from pyveda.vv.labelizer import Labelizer
 
@@ -20,21 +29,195 @@ DATA_GROUPS = {"TRAIN": "Data designated for model training",
                "TEST": "Data designated for model testing",
                "VALIDATE": "Data designated for model validation"}
 
+PARTITIONS = ["train", "test", "validate"]
+
+logger = logging.getLogger(__name__)
+
 ignore_NaturalNameWarning = partial(ignore_warnings, _warning=tables.NaturalNameWarning)
 
+_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_writers():
+    # Registered after PyTables' own exit hook, so this runs before it closes the files
+    for vb in list(_writers):
+        if vb._handle is not None and vb._pid == os.getpid() and vb._handle.isopen:
+            vb._flush_buffers()
+
+
+def _file_registry():
+    """
+    PyTables' private registry of open files, checked against PyTables 3.x (see
+    VedaBaseWorkerTest.test_file_registry). None when a release no longer provides it.
+    """
+    registry = getattr(tables.file, "_open_files", None)
+    if registry is None or not hasattr(registry, "handlers") or not hasattr(registry, "remove"):
+        return None
+    return registry
+
+
+def _open_file(fname, mode="r", **kwargs):
+    """
+    Opens fname with PyTables. Handles of the same file inherited from a parent
+    process through fork are first dropped from the PyTables registry without
+    being closed, since the HDF5 library state they point to belongs to the parent.
+    Without the registry the file is opened as is, which PyTables refuses when the
+    inherited handle is open in an incompatible mode.
+    """
+    path = os.path.abspath(fname)
+    registry = _file_registry()
+    if registry is None:
+        logger.debug("PyTables file registry unavailable, inherited handles of {} are kept".format(fname))
+    else:
+        for handle in list(registry.handlers):
+            pid = getattr(handle, "_pyveda_pid", None)
+            if pid is not None and pid != os.getpid() and os.path.abspath(handle.filename) == path:
+                registry.remove(handle)
+    fileh = tables.open_file(fname, mode=mode, **kwargs)
+    fileh._pyveda_pid = os.getpid()
+    return fileh
+
 
 class WrappedDataNode(object):
     def __init__(self, node, trainer):
         self._node = node
         self._vset = trainer
+        self._images = None
+        self._labels = None
+        self._metadata = None
+        self._hits = None
+
+    def _resolve(self):
+        """ Rebinds the node to the store's current file handle, which changes
+        after the store is unpickled or used from a forked worker """
+        fileh = self._vset._fileh
+        if isinstance(self._node, str) or self._node._v_file is not fileh:
+            path = self._node if isinstance(self._node, str) else self._node._v_pathname
+            self._node = fileh.get_node(path)
+            self._images = None
+            self._labels = None
+            self._metadata = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self._node, tables.Node):
+            state["_node"] = self._node._v_pathname
+        state["_images"] = None
+        state["_labels"] = None
+        state["_metadata"] = None
+        return state
 
     @property
     def images(self):
-        return self._vset._image_array_factory(self._node.images, self._vset, output_transform = self._vset._fw_loader)
+        self._resolve()
+        if self._images is None:
+            self._images = self._vset._image_array_factory(self._node.images, self._vset, output_transform = self._vset._fw_loader)
+        return self._images
 
     @property
     def labels(self):
-        return self._vset._label_array_factory(self._node.hit_table, self._node.labels,  self._vset)
+        self._resolve()
+        if self._labels is None:
+            self._labels = self._vset._label_array_factory(self._node.hit_table, self._node.labels,  self._vset)
+        return self._labels
+
+    @property
+    def metadata(self):
+        """ Per-sample datapoint ids, bounds and tile coords (MetadataArray) """
+        factory = getattr(self._vset, "_metadata_array_factory", None)
+        if factory is None:
+            raise NotImplementedError("{} does not record sample metadata".format(type(self._vset).__name__))
+        self._resolve()
+        if self._metadata is None:
+            self._metadata = factory(self._node, lambda: max(len(self.images), len(self.labels)))
+        return self._metadata
+
+    def append_batch(self, images, labels, metadata=None):
+        """
+        Appends a batch of images and their labels to the partition
+
+        Args:
+            metadata (list): Optional per-sample Veda datapoint features, or mappings with
+                id, bounds and tile_coords, recorded in the metadata table
+        """
+        if metadata is not None:
+            if len(metadata) != len(images):
+                raise ValueError("Provide metadata for every sample of the batch")
+            self.metadata.append_batch(metadata)
+        self.images.append_batch(images)
+        self.labels.append_batch(labels)
+
+    def hit_counts(self):
+        """
+        Per-sample class occurrence counts: 0/1 for classification, boxes per class for
+        object detection and pixels per class for segmentation.
+
+        Returns:
+            ndarray: (n_samples, n_classes) counts, columns in the order of vset.classes
+        """
+        if getattr(self.labels, "_table", None) is not None:
+            return self.labels.hit_counts()
+        if self._hits is None or len(self._hits) != len(self):
+            hits, step = [], 4096
+            for start in range(0, len(self), step):
+                labels = self.labels.read_batch(np.arange(start, min(start + step, len(self))))
+                hits.append(self._vset._label_klass._hits(labels, len(self._vset.classes)))
+            self._hits = np.concatenate(hits) if hits else np.zeros((0, len(self._vset.classes)), dtype=np.int64)
+        return self._hits
+
+    def where(self, classes=None, min_count=1, max_count=None, match="all"):
+        """
+        Finds the samples containing the given classes, e.g.
+        `vb.train.where(classes=["building"], min_count=1)`.
+
+        Args:
+            classes (list): Class names to test, defaults to all classes
+            min_count (int): Minimum count of each class
+            max_count (int): Optional maximum count of each class. min_count=0, max_count=0
+                selects samples without the classes
+            match (str): "all" requires every class to match, "any" at least one
+        Returns:
+            ndarray: Sorted sample indices within the partition
+        """
+        if match not in ("all", "any"):
+            raise ValueError("match must be 'all' or 'any'")
+        if classes is None:
+            classes = self._vset.classes
+        for klass in classes:
+            if klass not in self._vset.classes:
+                raise ValueError("Unknown class: {}".format(klass))
+        if getattr(self.labels, "_table", None) is not None:
+            return self.labels.where(classes=classes, min_count=min_count, max_count=max_count, match=match)
+        hits = self.hit_counts()[:, [list(self._vset.classes).index(klass) for klass in classes]]
+        return match_hits(hits, min_count=min_count, max_count=max_count, match=match)
+
+    def query_bbox(self, bounds, predicate="intersects"):
+        """
+        Finds the samples by location, e.g. `vb.train.query_bbox([minx, miny, maxx, maxy])`,
+        with a grid index over the recorded sample bounds instead of reading labels.
+        Samples without recorded bounds never match.
+
+        Args:
+            bounds (list or geometry): minx, miny, maxx, maxy in the coordinates of the sample
+                bounds (lon/lat for Veda datapoints), or a shapely geometry
+            predicate (str): "intersects", "within" (sample inside bounds) or "contains"
+                (bounds inside sample)
+        Returns:
+            ndarray: Sorted sample indices within the partition
+        """
+        return self.metadata.query_bbox(bounds, predicate=predicate)
+
+    def read_batch(self, indices):
+        """
+        Reads the images and labels for a batch of sample indices
+
+        Args:
+            indices (array-like): Sample indices, in any order
+        Returns:
+            images (ndarray), labels (ndarray or list for object detection)
+        """
+        return self.images.read_batch(indices), self.labels.read_batch(indices)
 
     def batch_generator(self, batch_size, steps=None, loop=True, shuffle=True, channels_last=False, expand_dims=False, rescale=False,
                         flip_horizontal=False, flip_vertical=False, label_transform=None,
@@ -47,12 +230,17 @@ class WrappedDataNode(object):
             batch_size (int): Number of samples in batch
             steps (int): Number of steps of batches to run in one epoch. If not provided, will calculate maximum possible number of complete batches
             loop (Boolean): Loop batcher indefinitely. If false, StopIteration is thrown after one epoch.
-            shuffle (Boolean): Shuffle data between epochs.
+            shuffle (Boolean or str): Shuffle data between epochs, "block" to keep batches within few storage chunks.
             channels_last (Boolean): To return image data as Height-Width-Depth, instead of the default Depth-Height-Width
-            rescale (Boolean): Return images rescaled to values between 0 and 1
+            rescale (Boolean or str): Return images rescaled to values between 0 and 1, using the stored
+                per-band stats when present. "standard" normalizes to zero mean and unit variance.
             flip_horizontal (Boolean): Horizontally flip image and labels (50% probability)
             flip_vertical (Boolean): Vertically flip image and labels (50% probability)
             pad (int): Pad image with zeros to this dimension.
+            sampler (str or array): "balanced", "inverse_frequency" or per-sample weights to draw
+                batches with replacement favoring rare classes, see ClassSampler
+            shuffle_window (int): Samples mixed by shuffle="block", which keeps batches within
+                few storage chunks, see BlockShuffler
         """
         return VedaStoreGenerator(self, batch_size=batch_size, steps=steps, loop=loop, shuffle=shuffle,
                                 channels_last=channels_last, expand_dims = expand_dims, rescale=rescale,
@@ -77,28 +265,163 @@ class WrappedDataNode(object):
             yield (gimg.__next__(), glbl.__next__())
 
     def __len__(self):
-        return len(self._node.images)
+        return len(self.images)
+
+    def load(self, memory_budget=None, compress=None, workers=4, block_rows=256):
+        """
+        Loads the partition into RAM, so repeated epochs skip the file. The returned node
+        has the same images/labels/read_batch/batch_generator API and is read-only.
+
+        Args:
+            memory_budget (int): Maximum bytes of images to hold, MemoryError when exceeded
+            compress (str): None keeps raw samples, "lz4" (if installed, else zlib) or "zlib"
+                keep every sample compressed and decode it on access
+            workers (int): Threads compressing and decoding samples
+            block_rows (int): Samples read from the file at a time
+        Returns:
+            InMemoryDataNode
+        """
+        from pyveda.vedaset.store.memory import load_node
+        return load_node(self, memory_budget=memory_budget, compress=compress, workers=workers,
+                         block_rows=block_rows)
 
-    def clean(self, count=None):
+    def clean(self, count=None, include_background_tiles=True):
         """
         Page through VedaStream data and flag bad data.
         Params:
             count: the number of tiles to clean
+        Returns:
+            Labelizer: its removed_indices can be passed to repack to drop the tiles
         """
         classes = self._vset.classes
         mltype = self._vset.mltype
-        Labelizer(self, mltype, count, classes).clean()
+        labelizer = Labelizer(self, mltype, count, classes, include_background_tiles)
+        labelizer.clean()
+        return labelizer
+
+
+class PartitionNode(WrappedDataNode):
+    """
+    A named split of a store whose samples live in one set of arrays under
+    /data. The split is an index of global sample rows persisted under
+    /partitions, or an in-memory index for derived splits such as k-fold
+    training sets, which are read-only.
+    """
+    def __init__(self, name, trainer, index=None):
+        super(PartitionNode, self).__init__(name, trainer)
+        self._index = None if index is None else np.asarray(index, dtype=np.int64)
+        self._rows = None
+        self._leaf = None
+
+    def _resolve(self):
+        pass
+
+    def __getstate__(self):
+        state = super(PartitionNode, self).__getstate__()
+        state["_rows"] = None
+        state["_leaf"] = None
+        return state
+
+    @property
+    def rows(self):
+        """ Global sample rows of the partition, in partition order """
+        if self._index is not None:
+            return self._index
+        leaf = self._vset._fileh.get_node("/partitions", self._node)
+        buf = self._vset._append_buffer(leaf)
+        if buf is not None:
+            buf.flush()
+        if self._rows is None or self._leaf is not leaf or len(self._rows) != len(leaf):
+            self._rows = leaf[:].astype(np.int64)
+            self._leaf = leaf
+        return self._rows
+
+    def _add_rows(self, rows):
+        if self._index is not None:
+            raise ValueError("Derived partitions are read-only")
+        leaf = self._vset._fileh.get_node("/partitions", self._node)
+        buf = self._vset._append_buffer(leaf)
+        if buf is None:
+            leaf.append(rows)
+        else:
+            buf.append(rows)
+
+    @property
+    def images(self):
+        base = self._vset._data.images
+        if self._images is None or self._images._base is not base:
+            self._images = IndexedArray(base, self)
+        return self._images
+
+    @property
+    def labels(self):
+        base = self._vset._data.labels
+        if self._labels is None or self._labels._base is not base:
+            self._labels = IndexedArray(base, self)
+        return self._labels
+
+    @property
+    def metadata(self):
+        base = self._vset._data.metadata
+        if self._metadata is None or self._metadata._base is not base:
+            self._metadata = IndexedArray(base, self)
+        return self._metadata
+
+    def __repr__(self):
+        return "PartitionNode({}, {} samples)".format(self._node, len(self))
+
+
+def split_rows(n, fractions, shuffle=True, seed=None):
+    """ Splits range(n) into consecutive groups sized by fractions, optionally shuffled """
+    rows = np.random.RandomState(seed).permutation(n) if shuffle else np.arange(n)
+    bounds = np.round(np.cumsum(fractions) / float(np.sum(fractions)) * n).astype(np.int64)
+    return np.split(rows.astype(np.int64), bounds[:-1])
 
 
 class H5DataBase(BaseDataSet):
     """
     An interface for consuming and reading local data intended to be used with machine learning training
+
+    Args:
+        layout (StorageLayout, dict or str): Compression and chunking options for newly created
+            files, either a StorageLayout, a dict of its options or a preset name ("random",
+            "sequential"). Ignored when opening an existing file, which keeps its stored layout.
+        buffer_rows (int): Rows each array accumulates before writing appends through to the file
+        buffer_bytes (int): Size of each append buffer when buffer_rows is None, 0 disables buffering.
+            Buffers are written on threshold, flush(), close() and before any read of the array.
+        cache (int or SampleCache): Byte budget of an LRU cache of decoded samples, or a
+            SampleCache to share with other stores. Off by default.
+
+    Samples are stored once under /data and train, test and validate are views
+    over persisted row indexes, so a store can be repartitioned (`partition`,
+    `set_split`, `kfold`) without rewriting data. Files written by older versions,
+    with a full set of arrays per partition group, are read as before.
+
+    Instances can be handed to multiprocessing workers (PyTorch DataLoader, Keras
+    workers > 1). A pickled store only carries its path and layout, and a worker
+    lazily opens its own read-only handle the first time it touches the data.
+    Forked workers likewise reopen the file instead of sharing the parent's handle.
+    HDF5 locks files open for writing, so close the writer (or open the store with
+    mode="r") before starting the workers.
     """
+    _records_metadata = True
+
     def __init__(self, fname, mltype=None, klasses=None, image_shape=None,
                  image_dtype=None, title="NoTitle", framework=None,
-                 overwrite=False, mode="a"):
-        self._framework = framework
-        self._fw_loader = lambda x: x
+                 overwrite=False, mode="a", layout=None, buffer_rows=None, buffer_bytes=2**22, cache=None):
+        self._nodes = {}
+        self._fname = fname
+        self._mode = mode
+        self._pid = os.getpid()
+        self._handle = None
+        self._buffers = {}
+        self._buffer_rows = buffer_rows
+        self._buffer_bytes = buffer_bytes
+        self._stats = None
+        self._stats_dirty = False
+        self.cache = cache
+        # Through the setter, so the loader matches the one applied after unpickling
+        self.framework = framework
 
         if os.path.exists(fname):
             # TODO need to figure how to deal with existing files.
@@ -108,11 +431,13 @@ class H5DataBase(BaseDataSet):
                 self._load_existing(fname, mode)
                 return
 
-        self._fileh = tables.open_file(fname, mode="a", title=title)
+        self._handle = _open_file(fname, mode="a", title=title)
         self._fileh.root._v_attrs.mltype = mltype
         self._fileh.root._v_attrs.klasses = klasses
         self._fileh.root._v_attrs.image_shape = image_shape
         self._fileh.root._v_attrs.image_dtype = image_dtype
+        self._fileh.root._v_attrs.layout = StorageLayout.from_spec(layout).to_dict()
+        self._fileh.root._v_attrs.image_stats = BandStats.for_store(self).to_dict()
 
         self._configure_instance()
         self._build_filetree()
@@ -120,28 +445,82 @@ class H5DataBase(BaseDataSet):
     def _load_existing(self, fname, mode="a"):
         if mode == "w":
             raise ValueError("Opening the file in write mode will overwrite the file")
-        self._fileh = tables.open_file(fname, mode=mode)
+        self._handle = _open_file(fname, mode=mode)
         self._configure_instance()
 
+    @property
+    def _fileh(self):
+        if self._handle is None or self._pid != os.getpid() or not self._handle.isopen:
+            self._handle = _open_file(self._fname, mode="r")
+            self._mode = "r"
+            self._pid = os.getpid()
+            self._nodes = {}
+        return self._handle
+
+    @property
+    def read_only(self):
+        return self._mode == "r"
+
+    def __getstate__(self):
+        if self._handle is not None and self._pid == os.getpid() and self._handle.isopen \
+                and not self.read_only:
+            self.flush()
+        state = self.__dict__.copy()
+        state["_handle"] = None
+        state["_nodes"] = {}
+        state["_buffers"] = {}
+        state["_stats"] = None
+        state["_mode"] = "r"
+        del state["_fw_loader"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fw_loader = framework_loader(self._framework)
+
     def _configure_instance(self, *args, **kwargs):
         self._image_klass = NDImageArray
         self._label_klass = MLTYPE_MAP[self.mltype]
-        self._classifications = dict([(klass, tables.UInt8Col(pos=idx + 1)) for idx, klass in enumerate(self.classes)])
+
+    @property
+    def _classifications(self):
+        return dict([(klass, tables.UInt32Col(pos=idx + 1)) for idx, klass in enumerate(self.classes)])
 
     def _build_filetree(self, dg=DATA_GROUPS):
         # Build group nodes
+        self._fileh.create_group("/", "data", "Samples of every partition")
+        self._fileh.create_group("/", "partitions", "Sample rows of every partition")
         for name, desc in dg.items():
-            self._fileh.create_group("/", name.lower(), desc)
+            self._create_split(name.lower(), np.zeros(0, dtype=np.int64), desc)
         # Build table, array leaves
-        self._create_tables(self._classifications, filters=tables.Filters(0))
+        self._create_tables(self._classifications, filters=self.layout.filters)
         self._create_arrays(self._image_klass, self.image_dtype)
         self._create_arrays(self._label_klass)
+        for group in self._groups.values():
+            MetadataArray.create_table(self, group)
+
+    @property
+    def _indexed(self):
+        return "/data" in self._fileh
+
+    @ignore_NaturalNameWarning
+    def _create_split(self, name, rows, title=""):
+        layout = self.layout
+        self._fileh.create_earray("/partitions", name, atom=tables.Int64Atom(), shape=(0,), title=title,
+                                  filters=layout.filters, expectedrows=layout.expected_rows(name) or 10000)
+        if len(rows):
+            self._fileh.get_node("/partitions", name).append(rows)
 
     def _image_array_factory(self, *args, **kwargs):
         return self._image_klass(*args, **kwargs)
 
-    def _label_array_factory(self, *args, **kwargs):
-        return self._label_klass(*args, **kwargs)
+    def _metadata_array_factory(self, group, count):
+        return MetadataArray(group, self, count)
+
+    def _label_array_factory(self, hit_table, array, *args, **kwargs):
+        if self._label_klass is ObjDetectionArray and isinstance(array, tables.VLArray):
+            return JSONObjDetectionArray(hit_table, array, *args, **kwargs)
+        return self._label_klass(hit_table, array, *args, **kwargs)
 
     @ignore_NaturalNameWarning
     def _create_arrays(self, data_klass, data_dtype=None):
@@ -151,11 +530,18 @@ class H5DataBase(BaseDataSet):
     @ignore_NaturalNameWarning
     def _create_tables(self, classifications, filters=tables.Filters(0)):
         for name, group in self._groups.items():
-            self._fileh.create_table(group, "hit_table", classifications,
-                                     "Label Hit Record", filters)
+            table = self._fileh.create_table(group, "hit_table", classifications,
+                                             "Label Hit Record", filters,
+                                             expectedrows=self.layout.expected_rows(name) or 10000)
+            for klass in classifications:
+                table.cols._f_col(klass).create_index()
 
     def _build_label_tables(self, rebuild=True):
-        pass
+        if self._indexed:
+            self._data.labels._sync_records(rebuild=rebuild)
+            return
+        for name in self._groups:
+            self._wrapped_node(name).labels._sync_records(rebuild=rebuild)
 
     @property
     def mltype(self):
@@ -173,8 +559,18 @@ class H5DataBase(BaseDataSet):
     def image_dtype(self):
         return self._fileh.root._v_attrs.image_dtype
 
+    @property
+    def layout(self):
+        try:
+            return StorageLayout.from_dict(self._fileh.root._v_attrs.layout)
+        except AttributeError:
+            return StorageLayout()
+
     @property
     def _groups(self):
+        """ Groups holding sample arrays: /data, or every partition group in older files """
+        if self._indexed:
+            return {"data": self._fileh.root.data}
         return {group._v_name: group for group in self._fileh.root._f_iter_nodes("Group")}
 
     @property
@@ -186,30 +582,344 @@ class H5DataBase(BaseDataSet):
         if fw and fw not in FRAMEWORKS:
             raise FrameworkNotSupported("Image adaptor not supported for {}".format(fw))
         self._framework = fw
-        self._fw_loader = lambda x: x # TODO: Custom loaders here
+        self._fw_loader = framework_loader(fw)
+        self._nodes = {}
+
+    def _append_buffer(self, leaf):
+        """ Returns the append buffer for a PyTables leaf, None when appends are not buffered """
+        if not (self._buffer_rows or self._buffer_bytes) or self.read_only or not AppendBuffer.supports(leaf):
+            return None
+        key = leaf._v_pathname
+        buf = self._buffers.get(key)
+        if buf is None or buf._arr is not leaf:
+            if buf is not None:
+                buf.flush()
+            buf = self._buffers[key] = AppendBuffer(leaf, rows=self._buffer_rows, nbytes=self._buffer_bytes)
+            _writers.add(self)
+        return buf
+
+    def _flush_buffers(self):
+        for buf in self._buffers.values():
+            if buf._arr._v_isopen:
+                buf.flush()
+        if self._stats_dirty:
+            self._fileh.root._v_attrs.image_stats = self._stats.to_dict()
+            self._stats_dirty = False
+
+    @property
+    def cache(self):
+        """ The SampleCache in front of sample reads, None when reads are not cached """
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache):
+        if cache is not None and not isinstance(cache, SampleCache):
+            cache = SampleCache(cache)
+        self._cache = cache
+
+    @property
+    def stats(self):
+        """
+        Per-band image statistics (BandStats) kept up to date as images are appended
+        and saved in the file attributes. None for files written before stats were
+        recorded, see compute_stats.
+        """
+        if self._stats is None:
+            d = getattr(self._fileh.root._v_attrs, "image_stats", None)
+            if d is not None:
+                self._stats = BandStats.from_dict(d)
+        return self._stats
+
+    def _update_stats(self, images):
+        stats = self.stats
+        if stats is not None and not self.read_only:
+            stats.update(images)
+            self._stats_dirty = True
+
+    def compute_stats(self, split=None, bins=256, range=None, block_rows=256, workers=None):
+        """
+        Computes per-band image statistics in one pass over existing samples, e.g. for
+        files written before stats were recorded. Stats of the whole store are saved
+        in the file attributes when it is writable.
+
+        Args:
+            split (str): Only use the samples of this partition
+            bins (int): Histogram bins per band
+            range (list): Histogram range, defaults to the full range of integer dtypes or
+                the value range of float images, found in a first min/max pass
+            block_rows (int): Samples read per block
+            workers (int): Threads reducing blocks
+        Returns:
+            BandStats
+        """
+        self.flush()
+        stats = BandStats.for_store(self, bins=bins, range=range)
+        if split is not None:
+            arrays = [self.split(split).images]
+        elif self._indexed:
+            arrays = [self._data.images]
+        else:
+            arrays = [self.split(name).images for name in self.splits]
+        if stats.range is None:
+            scan_range(arrays, stats, block_rows=block_rows)
+        for images in arrays:
+            compute_stats(images, stats, block_rows=block_rows, workers=workers)
+        if split is None and not self.read_only:
+            self._stats = stats
+            self._stats_dirty = True
+            self.flush()
+        return stats
+
+    @property
+    def _segments(self):
+        """ Nodes over the arrays samples are written to: /data, or every partition in older files """
+        if self._indexed:
+            return [self._data]
+        return [self.split(name) for name in self.splits]
+
+    def recover(self):
+        """
+        Drops samples left partially written by a writer that died between appending
+        images, labels and metadata, so appends line up again. Called when a store is
+        resumed, see pyveda.store.
+
+        Returns:
+            int: Number of partial samples dropped
+        """
+        if self.read_only:
+            raise ValueError("Open the store with mode='a' to recover it")
+        dropped = 0
+        self.flush()
+        for node in self._segments:
+            n = min(len(node.images), len(node.labels))
+            dropped += max(len(node.images), len(node.labels)) - n
+            node.images.truncate(n)
+            node.labels.truncate(n)
+            node.metadata.truncate(n)
+        if self._indexed:
+            n = self._n_samples()
+            for name in self.splits:
+                rows = self.split(name).rows
+                if rows.size and rows.max() >= n:
+                    self.set_split(name, rows[rows < n])
+        if self._cache is not None:
+            self._cache.clear()
+        self._nodes = {}
+        self.flush()
+        return dropped
+
+    def stored_ids(self):
+        """ Datapoint ids of every sample with recorded metadata, e.g. to skip them when resuming """
+        self.flush()
+        ids = set()
+        for node in self._segments:
+            n = min(len(node.images), len(node.labels))
+            ids.update(node.metadata.read_batch(np.arange(n))["id"].tolist())
+        ids.discard("")
+        return ids
+
+    def _wrapped_node(self, name):
+        if name not in self._nodes:
+            if self._indexed:
+                if name not in self.splits:
+                    raise KeyError("No partition named {}".format(name))
+                self._nodes[name] = PartitionNode(name, self)
+            else:
+                self._nodes[name] = WrappedDataNode(self._fileh.get_node("/", name), self)
+        return self._nodes[name]
+
+    @property
+    def _data(self):
+        """ Node over the store-wide sample arrays """
+        if "/data" not in self._nodes:
+            self._nodes["/data"] = WrappedDataNode(self._fileh.root.data, self)
+        return self._nodes["/data"]
+
+    def _n_samples(self):
+        data = self._data
+        return max(len(data.images), len(data.labels))
+
+    @property
+    def splits(self):
+        """ Names of the partitions of the store """
+        if self._indexed:
+            return sorted(self._fileh.root.partitions._v_children)
+        return sorted(self._groups)
+
+    def split(self, name):
+        """ Returns the partition called name """
+        return self._wrapped_node(name)
+
+    def _require_indexed(self):
+        if not self._indexed:
+            raise NotImplementedError("Repartitioning needs a store with index partitions, "
+                                      "this file keeps a copy of the data per partition")
+
+    def set_split(self, name, rows):
+        """
+        Creates or replaces a named partition
+
+        Args:
+            name (str): Partition name
+            rows (array-like): Global sample rows of the partition, in partition order
+        """
+        self._require_indexed()
+        rows = np.asarray(rows, dtype=np.int64).ravel()
+        n = self._n_samples()
+        if rows.size and (rows.min() < 0 or rows.max() >= n):
+            raise IndexError("Sample rows out of range for a store of {} samples".format(n))
+        if "/partitions/{}".format(name) in self._fileh:
+            self._buffers.pop("/partitions/{}".format(name), None)
+            self._fileh.remove_node("/partitions", name)
+        self._create_split(name, rows)
+        self._nodes.pop(name, None)
+        return self._wrapped_node(name)
+
+    def remove_split(self, name):
+        self._require_indexed()
+        if name in PARTITIONS:
+            raise ValueError("{} cannot be removed, assign it an empty set of rows instead".format(name))
+        self._buffers.pop("/partitions/{}".format(name), None)
+        self._fileh.remove_node("/partitions", name)
+        self._nodes.pop(name, None)
+
+    def partition(self, fractions=[70, 20, 10], names=None, shuffle=True, seed=None):
+        """
+        Reassigns every sample to new partitions without rewriting any data. Splits
+        not named are removed, train, test and validate are kept empty.
+
+        Args:
+            fractions (list): Relative partition sizes, e.g. [70, 20, 10]
+            names (list): Partition names, defaults to train, test, validate
+            shuffle (bool): Assign samples randomly instead of in storage order
+            seed (int): Random seed for the assignment
+        """
+        self._require_indexed()
+        names = names or PARTITIONS[:len(fractions)]
+        if len(names) != len(fractions):
+            raise ValueError("Provide one name per partition fraction")
+        self.flush()
+        groups = split_rows(self._n_samples(), fractions, shuffle=shuffle, seed=seed)
+        for name in self.splits:
+            if name not in names:
+                if name in PARTITIONS:
+                    self.set_split(name, [])
+                else:
+                    self.remove_split(name)
+        for name, rows in zip(names, groups):
+            self.set_split(name, rows)
+
+    def kfold(self, k, shuffle=True, seed=None):
+        """
+        Splits the store into k persisted folds named fold0 ... fold{k-1}
+
+        Returns:
+            list: (train, test) partitions per fold, where train is a read-only view
+                over the other k-1 folds
+        """
+        self._require_indexed()
+        self.flush()
+        folds = split_rows(self._n_samples(), [1] * k, shuffle=shuffle, seed=seed)
+        for name in self.splits:
+            if name.startswith("fold") and name[4:].isdigit():
+                self.remove_split(name)
+        for idx, rows in enumerate(folds):
+            self.set_split("fold{}".format(idx), rows)
+        return [(PartitionNode("fold{}-train".format(idx), self,
+                               index=np.concatenate([rows for j, rows in enumerate(folds) if j != idx])),
+                 self.split("fold{}".format(idx))) for idx in range(k)]
 
     @property
     def train(self):
-        return WrappedDataNode(self._fileh.root.train, self)
+        return self._wrapped_node("train")
 
     @property
     def test(self):
-        return WrappedDataNode(self._fileh.root.test, self)
+        return self._wrapped_node("test")
 
     @property
     def validate(self):
-        return WrappedDataNode(self._fileh.root.validate, self)
+        return self._wrapped_node("validate")
 
     def flush(self):
-        self._fileh.flush()
+        if not self.read_only:
+            self._flush_buffers()
+            self._fileh.flush()
 
     def close(self):
-        self._fileh.close()
+        if self._handle is not None and self._pid == os.getpid() and self._handle.isopen:
+            if not self.read_only:
+                self._flush_buffers()
+            self._handle.close()
+        self._handle = None
+        self._nodes = {}
+        self._buffers = {}
+
+    def reopen(self):
+        """ Reopens the file after close() in the mode it was open in, e.g. once worker
+        processes that read it by name are done """
+        if self._handle is None or not self._handle.isopen:
+            self._handle = _open_file(self._fname, mode="r" if self.read_only else "a")
+            self._pid = os.getpid()
+            self._nodes = {}
 
     def remove(self):
         raise NotImplementedError
 
+    def freeze(self, dirpath, overwrite=False):
+        """
+        Writes the finished store into raw .npy files and a JSON index for
+        zero-copy, memory-mapped reads via MemmapDataBase.
+
+        Args:
+            dirpath (str): Output directory
+            overwrite (bool): Replace an existing frozen copy in dirpath
+        Returns:
+            MemmapDataBase
+        """
+        from pyveda.vedaset.store.memmap import MemmapDataBase, freeze_vedabase
+        self.flush()
+        freeze_vedabase(self, dirpath, overwrite=overwrite)
+        return MemmapDataBase(dirpath)
+
+    def repack(self, fname, layout=None, exclude=None, **kwargs):
+        """
+        Copies the store into a new file with a new layout, dropping excluded samples,
+        e.g. `vb.repack("clean.h5", layout="random", exclude={"train": labelizer.removed_indices})`.
+        See pyveda.vedaset.store.repack.repack_vedabase for all options.
+
+        Args:
+            fname (str): Path of the new file
+            layout (StorageLayout, dict or str): Layout of the new file, defaults to this store's
+            exclude (array-like or dict): Global sample rows, or {partition: positions}, to drop
+        Returns:
+            H5DataBase
+        """
+        from pyveda.vedaset.store.repack import repack_vedabase
+        return repack_vedabase(self, fname, layout=layout, exclude=exclude, **kwargs)
+
+    def export(self, dirpath, format="tar", **kwargs):
+        """
+        Writes the partitions into size-bounded tar or TFRecord shards for sequential
+        readers, e.g. `vb.export("shards", format="tfrecord", shuffle=True)`. See
+        pyveda.vedaset.store.export.export_vedabase for all options and ExportReader
+        to stream the shards back.
+
+        Writer processes open the file read-only by name, so a store open for writing
+        is closed while they run and reopened afterwards.
+
+        Args:
+            dirpath (str): Output directory
+            format (str): "tar" or "tfrecord"
+        Returns:
+            dict: The shard index
+        """
+        from pyveda.vedaset.store.export import export_vedabase
+        return export_vedabase(self, dirpath, format=format, **kwargs)
+
     def __len__(self):
+        if self._indexed:
+            return self._n_samples()
         return sum([len(self.train), len(self.test), len(self.validate)])
 
     def __enter__(self):
@@ -229,6 +939,21 @@ class H5DataBase(BaseDataSet):
         inst = cls(fname, **kwargs)
         return inst
 
+    @staticmethod
+    def concat(stores):
+        """
+        Presents several stores with matching mltype, classes and image shape as one
+        read-only dataset, e.g. `VedaBase.concat(["aoi1.h5", "aoi2.h5"]).train`, without
+        copying data.
+
+        Args:
+            stores (list): Open stores or paths
+        Returns:
+            ConcatDataBase
+        """
+        from pyveda.vedaset.store.concat import ConcatDataBase
+        return ConcatDataBase(stores)
+
     #@classmethod
     #def from_vc(cls, vc, **kwargs):
     #    # Load an empty H5DataBase from a VC
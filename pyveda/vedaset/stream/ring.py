@@ -0,0 +1,169 @@
+import copy
+import threading
+
+import numpy as np
+
+
+class SampleRing(object):
+    """
+    Fixed capacity ring of fetched stream samples. Images and labels are copied
+    into arrays allocated once, from the shape and dtype of the first sample, so
+    fetching allocates nothing per sample. Object detection labels, whose box
+    lists are ragged, are kept in an object array instead.
+
+    The ring is a queue: the fetcher puts samples in fetch order and the
+    partitions get them in the same order, as copies independent of the ring. It
+    is also a window over the last capacity samples fetched, consumed or not,
+    indexed oldest first, whose reads may be views into the ring.
+
+    Samples that failed to fetch, or do not match the shape of the first sample,
+    are read back as None.
+
+    Args:
+        capacity (int): Samples held
+        ragged_labels (bool): Keep labels as python objects
+        max_bytes (int): Shrinks the capacity on allocation so the arrays fit in max_bytes
+        on_get (callable): Called after every sample consumed, outside the ring's lock
+    """
+    def __init__(self, capacity, ragged_labels=False, max_bytes=None, on_get=None):
+        if capacity < 1:
+            raise ValueError("The ring must hold at least one sample")
+        self.capacity = int(capacity)
+        self.ragged_labels = ragged_labels
+        self.max_bytes = max_bytes
+        self.on_get = on_get
+        self.images = None
+        self.labels = np.empty(self.capacity, dtype=object) if ragged_labels else None
+        self._valid = np.zeros(self.capacity, dtype=bool)
+        self._written = 0
+        self._read = 0
+        self._error = None
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        """ Samples in the window """
+        return min(self._written, self.capacity)
+
+    @property
+    def pending(self):
+        """ Samples put and not yet consumed """
+        return self._written - self._read
+
+    def full(self):
+        return self.pending >= self.capacity
+
+    @property
+    def sample_nbytes(self):
+        """ Bytes held per sample, 0 until the first sample arrives. Ragged labels are not counted """
+        if self.images is None:
+            return 0
+        nbytes = self.images[0].nbytes
+        if not self.ragged_labels:
+            nbytes += self.labels[0].nbytes
+        return nbytes
+
+    @property
+    def nbytes(self):
+        return self.capacity * self.sample_nbytes
+
+    def _allocate(self, label, image):
+        image = np.asarray(image)
+        label = None if self.ragged_labels else np.asarray(label)
+        if self.max_bytes:
+            nbytes = image.nbytes + (0 if label is None else label.nbytes)
+            # Every sample so far failed and holds no data, so pending ones read back as
+            # missing from whichever slot they land in
+            self.capacity = max(min(self.capacity, self.max_bytes // max(nbytes, 1)), 1)
+            self._valid = np.zeros(self.capacity, dtype=bool)
+            if self.ragged_labels:
+                self.labels = np.empty(self.capacity, dtype=object)
+        self.images = np.zeros((self.capacity,) + image.shape, dtype=image.dtype)
+        if label is not None:
+            self.labels = np.zeros((self.capacity,) + label.shape, dtype=label.dtype)
+
+    def _write(self, slot, label, image):
+        if image is None or label is None:
+            return False
+        try:
+            self.images[slot] = image
+            self.labels[slot] = label
+        except (TypeError, ValueError):
+            return False
+        return True
+
+    def put(self, label, image, timeout=None):
+        """
+        Copies a sample into the ring, waiting while every slot holds a sample not
+        yet consumed.
+
+        Returns:
+            bool: False when the sample was stored as missing
+        """
+        with self._cond:
+            if self.images is None and image is not None and label is not None:
+                self._allocate(label, image)
+            if not self._cond.wait_for(lambda: not self.full(), timeout):
+                raise TimeoutError("No free slot in the ring after {}s".format(timeout))
+            slot = self._written % self.capacity
+            valid = self._write(slot, label, image)
+            self._valid[slot] = valid
+            self._written += 1
+            self._cond.notify_all()
+        return valid
+
+    def fail(self, error):
+        """ Makes consumers raise error once the samples already put are consumed """
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def _sample(self, slot):
+        if not self._valid[slot]:
+            return None, None
+        return self.labels[slot], self.images[slot]
+
+    def get(self, timeout=None):
+        """ Waits for the next sample in fetch order and returns a copy of it as [label, image] """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.pending > 0 or self._error is not None, timeout):
+                raise TimeoutError("No sample fetched after {}s".format(timeout))
+            if not self.pending:
+                raise self._error
+            slot = self._read % self.capacity
+            # Copied before the slot is freed, the next put overwrites it
+            sample = [copy.deepcopy(item) for item in self._sample(slot)]
+            self._read += 1
+            self._cond.notify_all()
+        if self.on_get is not None:
+            self.on_get()
+        return sample
+
+    def _slots(self, positions):
+        return (self._written - len(self) + positions) % self.capacity
+
+    def window(self, field, spec):
+        """
+        Reads images or labels from the window, oldest first. Integers return the
+        sample itself, slices a batch: a view of the ring when the slots are
+        contiguous, otherwise one gathered copy.
+        """
+        n = len(self)
+        if isinstance(spec, (int, np.integer)):
+            if spec < -n or spec >= n:
+                raise IndexError("Index {} out of range for buffer of length {}".format(spec, n))
+            slot = int(self._slots(np.int64(spec % n)))
+            return self._sample(slot)[0 if field == "labels" else 1]
+        arr = getattr(self, field)
+        if arr is None:
+            return np.zeros(0)
+        if isinstance(spec, slice):
+            start, stop, step = spec.indices(n)
+            slots = self._slots(np.arange(start, stop, step))
+            if step == 1 and len(slots) and slots[-1] - slots[0] == len(slots) - 1:
+                return arr[slots[0]:slots[-1] + 1]
+        else:
+            positions = np.asarray(spec, dtype=np.int64).ravel()
+            if positions.size and (positions.min() < -n or positions.max() >= n):
+                raise IndexError("Batch indices out of range for buffer of length {}".format(n))
+            slots = self._slots(np.where(positions < 0, positions + n, positions))
+        return arr[slots]
@@ -1,6 +1,5 @@
 import asyncio
-import collections
-import queue
+import logging
 import threading
 import time
 from functools import partial
@@ -11,9 +10,12 @@ import numpy as np
 from pyveda.fetch.aiohttp.client import VedaStreamFetcher
 from pyveda.fetch.handlers import NDImageHandler, ClassificationHandler, SegmentationHandler, ObjDetectionHandler
 from pyveda.vedaset.abstract import BaseVariableArray, BaseSampleArray, BaseDataSet
+from pyveda.vedaset.stream.ring import SampleRing
 from pyveda.frameworks.batch_generator import VedaStreamGenerator
 from pyveda.vv.labelizer import Labelizer
 
+logger = logging.getLogger(__name__)
+
 class VSGenWrapper(object):
     def __init__(self, vs, _iter):
         self.vs = vs
@@ -44,17 +46,20 @@ class VSGenWrapper(object):
 
 
 class BufferedVariableArray(BaseVariableArray):
-    def __init__(self, buf):
-        self.buf = buf
+    """ Images or labels of the samples in a stream's ring buffer, oldest first """
+    def __init__(self, ring, field):
+        self.ring = ring
+        self.field = field
 
     def __len__(self):
-        return len(self.buf)
+        return len(self.ring)
 
     def __iter__(self):
-        return self.buf.__iter__()
+        for idx in range(len(self.ring)):
+            yield self.ring.window(self.field, idx)
 
     def __getitem__(self, idx):
-        return self.buf[idx]
+        return self.ring.window(self.field, idx)
 
 
 class BufferedSampleArray(BaseSampleArray):
@@ -83,13 +88,14 @@ class BufferedSampleArray(BaseSampleArray):
             except StopIteration:
                 pass
             else:
-                asyncio.run_coroutine_threadsafe(self._vset._fetcher.produce_reqs(reqs=[nreqs]),
-                                                 loop=self._vset._loop)
+                f = asyncio.run_coroutine_threadsafe(self._vset._fetcher.produce_reqs(reqs=[nreqs]),
+                                                     loop=self._vset._loop)
+                f.add_done_callback(self._vset._on_produced)
 
             # The following get() blocks, as it should, when we're waiting for
             # the thread running the asyncio loop to fetch more data while the
             # source generator is not yet exhausted
-            dps = self._vset._q.get()
+            dps = self._vset._buf.get()
             label, image = dps
             self._n_consumed += 1
             return [image, label]
@@ -141,19 +147,11 @@ class BufferedSampleArray(BaseSampleArray):
 
     @property
     def images(self):
-        try:
-            _, imgs = zip(*self._vset._buf)
-        except ValueError:
-            imgs = []
-        return BufferedVariableArray(imgs)
+        return BufferedVariableArray(self._vset._buf, "images")
 
     @property
     def labels(self):
-        try:
-            lbls, _ = zip(*self._vset._buf)
-        except ValueError:
-            lbls = []
-        return BufferedVariableArray(np.array(lbls))
+        return BufferedVariableArray(self._vset._buf, "labels")
 
     def clean(self, count=None):
         """
@@ -167,12 +165,33 @@ class BufferedSampleArray(BaseSampleArray):
 
 
 class BufferedDataStream(BaseDataSet):
+    """
+    Streams the samples of a Veda collection, fetched in the background into a
+    fixed-size ring buffer.
+
+    Prefetching is bounded by watermarks: requests stop being produced once the
+    samples fetched or in flight and not yet consumed reach the high watermark,
+    or their bytes reach max_bytes, and resume once consumption brings them back
+    to the low watermark and low_bytes. The ring is sized to fit bufsize samples
+    within max_bytes, so a stream holds a fixed amount of memory however slow
+    its consumer is. See `occupancy`.
+
+    Args:
+        bufsize (int): Ring buffer capacity in samples
+        high_watermark (int): Samples at which production pauses, defaults to bufsize
+        low_watermark (int): Samples at which production resumes, defaults to half the high watermark
+        max_bytes (int): Bytes of buffered and in-flight samples at which production pauses,
+            and the most the ring may allocate. Sample sizes are only known once the first
+            sample is fetched, until then a single request is in flight.
+        low_bytes (int): Bytes at which production resumes, defaults to half of max_bytes
+    """
     _lbl_handler_map = {"classification": ClassificationHandler,
                        "segmentation": SegmentationHandler,
                        "object_detection": ObjDetectionHandler}
 
     def __init__(self, mltype, classes, _count, gen, image_shape,
-                 partition=[70, 20, 10], bufsize=100, cachetype=collections.deque,
+                 partition=[70, 20, 10], bufsize=100, high_watermark=None, low_watermark=None,
+                 max_bytes=None, low_bytes=None,
                  auto_startup=False, auto_shutdown=False, fetcher=None, loop=None, **kwargs):
         self.partition = partition
         self.count = _count
@@ -190,8 +209,19 @@ class BufferedDataStream(BaseDataSet):
 
         self._fetcher = fetcher
         self._loop = loop
-        self._q = queue.Queue()
-        self._buf = cachetype(maxlen=bufsize)
+        self._high_watermark = max(min(high_watermark or self._bufsize, self._bufsize), 1)
+        self._low_watermark = self._high_watermark // 2 if low_watermark is None else low_watermark
+        if self._low_watermark >= self._high_watermark:
+            raise ValueError("The low watermark must be below the high watermark")
+        self._max_bytes = max_bytes
+        self._low_bytes = max_bytes // 2 if max_bytes and low_bytes is None else low_bytes
+        if max_bytes and self._low_bytes >= max_bytes:
+            raise ValueError("low_bytes must be below max_bytes")
+        # Production pauses at the high watermark, at most the ring's capacity,
+        # so the fetcher never waits on a full ring
+        self._buf = SampleRing(max(self._bufsize, 1), ragged_labels=mltype == "object_detection",
+                               max_bytes=max_bytes, on_get=self._on_consumed)
+        self._in_flight = 0
         self._thread = None
 
         self._img_handler_class = NDImageHandler
@@ -241,6 +271,49 @@ class BufferedDataStream(BaseDataSet):
             self._on_exhausted()
         self._exhausted = val
 
+    @property
+    def occupancy(self):
+        """ Samples and bytes buffered or in flight, against the watermarks """
+        samples = self._buf.pending + self._in_flight
+        return {"samples": samples,
+                "bytes": samples * self._buf.sample_nbytes,
+                "buffered": self._buf.pending,
+                "in_flight": self._in_flight,
+                "capacity": self._buf.capacity,
+                "allocated_bytes": self._buf.nbytes,
+                "high_watermark": self._high,
+                "low_watermark": self._low_watermark,
+                "max_bytes": self._max_bytes,
+                "low_bytes": self._low_bytes,
+                "paused": bool(self._fetcher and self._fetcher.paused)}
+
+    @property
+    def _high(self):
+        return min(self._high_watermark, self._buf.capacity)
+
+    def _sizing(self):
+        """ Whether the byte budget waits on the first sample to learn the size of a sample """
+        return bool(self._max_bytes) and not self._buf.sample_nbytes
+
+    def _above_high(self):
+        samples = self._buf.pending + self._in_flight
+        if samples >= self._high or (self._sizing() and samples):
+            return True
+        return bool(self._max_bytes) and samples * self._buf.sample_nbytes >= self._max_bytes
+
+    def _below_low(self):
+        samples = self._buf.pending + self._in_flight
+        if self._sizing():
+            return not samples
+        if samples > self._low_watermark:
+            return False
+        return not self._max_bytes or samples * self._buf.sample_nbytes <= self._low_bytes
+
+    def _on_consumed(self):
+        fetcher = self._fetcher
+        if fetcher is not None and fetcher.paused and self._below_low():
+            self._loop.call_soon_threadsafe(fetcher.resume)
+
     def _on_group_exhausted(self):
         if all([self.train.exhausted, self.test.exhausted, self.validate.exhausted]):
             self.exhausted = True
@@ -251,14 +324,24 @@ class BufferedDataStream(BaseDataSet):
 
     def _initialize_buffer(self):
         reqs = []
-        while len(reqs) < self._bufsize:
+        while len(reqs) < self._high_watermark:
             try:
                 reqs.append(next(self._gen))
             except StopIteration:
                 break
 
-        f = asyncio.run_coroutine_threadsafe(self._fetcher.produce_reqs(reqs=reqs), loop=self._loop)
-        f.result()
+        # Not waited on: past max_bytes production pauses until samples are consumed
+        self._fill_fut = asyncio.run_coroutine_threadsafe(self._fetcher.produce_reqs(reqs=reqs), loop=self._loop)
+        self._fill_fut.add_done_callback(self._on_produced)
+
+    def _on_produced(self, fut):
+        """ Fails the stream when producing requests raised, so consumers get the error instead of waiting forever """
+        if fut.cancelled():
+            return
+        exc = fut.exception()
+        if exc is not None:
+            logger.error("Producing stream requests failed: {!r}".format(exc))
+            self._buf.fail(exc)
 
     def _configure_fetcher(self, **kwargs):
         img_py_h = self._img_handler_class._payload_handler
@@ -290,7 +373,7 @@ class BufferedDataStream(BaseDataSet):
         self._consumer_fut = asyncio.run_coroutine_threadsafe(self._fetcher.start_fetch(self._loop),
                                                               loop=self._loop)
         if init_buff:
-            self._initialize_buffer() # Fill the buffer and block until full
+            self._initialize_buffer() # Start filling the buffer, up to the high watermark
 
     def _stop_consumer(self):
         self._consumer_fut.cancel()
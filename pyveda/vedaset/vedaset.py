@@ -1,4 +1,7 @@
 from pyveda.vedaset.store.vedabase import H5DataBase
+from pyveda.vedaset.store.directory import DirectoryDataBase
+from pyveda.vedaset.store.memmap import MemmapDataBase
+from pyveda.vedaset.store.sharded import ShardedDataBase
 from pyveda.vedaset.stream.vedastream import BufferedDataStream
 from pyveda.veda.api import VedaCollectionProxy
 from contextlib import ContextDecorator
@@ -9,3 +12,25 @@ class VedaBase(H5DataBase):
 
 class VedaStream(BufferedDataStream):
     pass
+
+
+STORE_BACKENDS = {"hdf5": VedaBase,
+                  "directory": DirectoryDataBase,
+                  "memmap": MemmapDataBase,
+                  "sharded": ShardedDataBase}
+
+
+def store_backend(path, backend=None):
+    """ Returns the store class for a backend name, detecting it from path when None """
+    if backend is None:
+        if ShardedDataBase.is_sharded(path):
+            backend = "sharded"
+        elif DirectoryDataBase.is_directory_store(path):
+            backend = "directory"
+        elif MemmapDataBase.is_frozen(path):
+            backend = "memmap"
+        else:
+            backend = "hdf5"
+    if backend not in STORE_BACKENDS:
+        raise ValueError("Unknown store backend {}, expected one of {}".format(backend, list(STORE_BACKENDS)))
+    return STORE_BACKENDS[backend]
@@ -54,6 +54,10 @@ class Labelizer():
         self.classes = classes
         self.flagged_tiles = []
         self.iflagged_tiles = []
+        self.flagged_indices = []
+        self.removed_indices = []
+        self.flagged_index = None
+        self.iflagged_indices = []
         self.include_background_tiles = include_background_tiles
         self._get_next()  #create images, labels, and datapoint
 
@@ -156,6 +160,7 @@ class Labelizer():
         elif b.description == 'No':
             self.index += 1
             self.flagged_tiles.append(self.datapoint)
+            self.flagged_indices.append(self.index - 1)
             self._get_next()
         elif b.description == 'Exit':
             self.index = self.count
@@ -175,11 +180,17 @@ class Labelizer():
         try:
             if b.description == 'Keep':
                 self.datapoint = next(self.iflagged_tiles)
+                self.flagged_index = next(self.iflagged_indices)
                 self.image = self._create_images()
                 self.labels = self._create_labels()
             elif b.description == 'Remove':
-                self.datapoint.remove() ##only works for VCP, currently
+                if hasattr(self.datapoint, 'remove'):
+                    self.datapoint.remove()
+                else:
+                    # VedaBase samples are dropped when the store is repacked
+                    self.removed_indices.append(self.flagged_index)
                 self.datapoint = next(self.iflagged_tiles)
+                self.flagged_index = next(self.iflagged_indices)
                 self.image = self._create_images()
                 self.labels = self._create_labels()
             self.clean_flags()
@@ -321,7 +332,9 @@ class Labelizer():
             try:
                 print("You've flagged %0.f bad tiles. Review them now" %len(self.flagged_tiles))
                 self.iflagged_tiles = iter(self.flagged_tiles)
+                self.iflagged_indices = iter(self.flagged_indices)
                 self.datapoint = next(self.iflagged_tiles)
+                self.flagged_index = next(self.iflagged_indices)
                 self.image = self._create_images()
                 self.labels = self._create_labels()
                 self.clean_flags()
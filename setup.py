@@ -19,5 +19,6 @@ setup(name='pyveda',
      # packages=['pyveda', "pyveda.vedaset", "pyveda.veda", "pyveda.fetch", "pyveda.fetch.compat", "pyveda.fetch.aiohttp", "pyveda.fetch.diagnostics"],
       packages=find_packages(exclude=['docs','tests']),
       zip_safe=False,
-      install_requires=reqs
+      install_requires=reqs,
+      extras_require={"tfrecord": ["crc32c"]}
       )
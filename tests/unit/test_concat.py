@@ -0,0 +1,72 @@
+''' Tests for concatenated VedaBases '''
+
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from pyveda.vedaset import VedaBase
+from pyveda.vedaset.store.concat import ConcatDataBase
+from pyveda.vedaset.store.directory import DirectoryDataBase
+
+import unittest
+
+
+class ConcatDataBaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.images = np.arange(12 * 4, dtype=np.uint8).reshape(12, 1, 2, 2)
+        self.labels = np.array([[i % 2, 1] for i in range(12)], dtype=np.uint8)
+        self.paths = []
+        for i, (start, stop) in enumerate([(0, 5), (5, 12)]):
+            path = os.path.join(self.tmpdir, "part{}.h5".format(i))
+            vb = VedaBase.from_path(path, mltype="classification", klasses=["a", "b"],
+                                    image_shape=[1, 2, 2], image_dtype=np.uint8)
+            vb.train.append_batch(self.images[start:stop], self.labels[start:stop])
+            vb.close()
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_concat(self):
+        cb = VedaBase.concat(self.paths)
+        self.assertEqual(len(cb), 12)
+        self.assertEqual(len(cb.train), 12)
+        self.assertEqual(len(cb.test), 0)
+        idx = [11, 0, 4, 5, -1]
+        x, y = cb.train.read_batch(idx)
+        np.testing.assert_array_equal(x, self.images[idx])
+        np.testing.assert_array_equal(y, self.labels[idx])
+        np.testing.assert_array_equal(cb.train.images[6], self.images[6])
+        np.testing.assert_array_equal(cb.train.where(classes=["a"]), np.arange(1, 12, 2))
+        self.assertEqual(cb.train.hit_counts().shape, (12, 2))
+        x, y = next(cb.train.batch_generator(8, shuffle=False))
+        np.testing.assert_array_equal(y, self.labels[:8])
+        with self.assertRaises(NotImplementedError):
+            cb.train.append_batch(self.images[:1], self.labels[:1])
+
+        restored = pickle.loads(pickle.dumps(cb))
+        np.testing.assert_array_equal(restored.train.images.read_batch([7]), self.images[[7]])
+        restored.close()
+        cb.close()
+
+    def test_boxes_across_files(self):
+        stores = []
+        labels = [[[[i, i, i + 1, i + 1]] * (i % 3)] for i in range(6)]
+        for i, (start, stop) in enumerate([(0, 2), (2, 6)]):
+            db = DirectoryDataBase(os.path.join(self.tmpdir, "boxes{}".format(i)), mltype="object_detection",
+                                   klasses=["a"], image_shape=[1, 2, 2], image_dtype=np.uint8)
+            db.train.append_batch(self.images[start:stop], labels[start:stop])
+            stores.append(db)
+        cb = ConcatDataBase(stores)
+        self.assertEqual(cb.train.labels.read_batch([4, 1]), [labels[4], labels[1]])
+
+    def test_mismatch(self):
+        path = os.path.join(self.tmpdir, "other.h5")
+        vb = VedaBase.from_path(path, mltype="classification", klasses=["a", "c"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8)
+        vb.close()
+        with self.assertRaises(ValueError):
+            VedaBase.concat(self.paths + [path])
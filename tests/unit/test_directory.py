@@ -0,0 +1,66 @@
+''' Tests for the chunk directory store backend '''
+
+import os
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pyveda.vedaset.vedaset import store_backend
+from pyveda.vedaset.store.directory import DirectoryDataBase
+
+import unittest
+
+
+class DirectoryDataBaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "store")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_append_and_read(self):
+        db = DirectoryDataBase(self.path, mltype="classification", klasses=["a", "b"],
+                               image_shape=[3, 4, 4], image_dtype=np.uint8)
+        images = np.arange(8 * 3 * 4 * 4, dtype=np.uint8).reshape(8, 3, 4, 4)
+        labels = np.array([[1, 0], [0, 1]] * 4, dtype=np.uint8)
+        db.train.append_batch(images[:5], labels[:5])
+        db.train.append_batch(images[5:], labels[5:])
+        self.assertEqual(len(db.train), 8)
+        np.testing.assert_array_equal(db.train.images[6], images[6])
+        x, y = db.train.read_batch([7, 1, 4, 5])
+        np.testing.assert_array_equal(x, images[[7, 1, 4, 5]])
+        np.testing.assert_array_equal(y, labels[[7, 1, 4, 5]])
+
+        reopened = pickle.loads(pickle.dumps(db))
+        self.assertEqual(len(reopened.train), 8)
+        self.assertTrue(store_backend(self.path) is DirectoryDataBase)
+        x, y = next(reopened.train.batch_generator(4, shuffle=False))
+        np.testing.assert_array_equal(x, images[:4])
+
+    def test_concurrent_writers(self):
+        db = DirectoryDataBase(self.path, mltype="classification", klasses=["a"],
+                               image_shape=[1, 2, 2], image_dtype=np.uint8)
+
+        def write(i):
+            db.train.append_batch(np.full((3, 1, 2, 2), i, dtype=np.uint8),
+                                  np.full((3, 1), i, dtype=np.uint8))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(write, range(20)))
+        db.train.images._arr.refresh()
+        db.train.labels._arr.refresh()
+        self.assertEqual(len(db.train), 60)
+        x, y = db.train.read_batch(np.arange(60))
+        np.testing.assert_array_equal(x[:, 0, 0, 0], y[:, 0])
+
+    def test_object_detection(self):
+        db = DirectoryDataBase(self.path, mltype="object_detection", klasses=["a", "b"],
+                               image_shape=[1, 4, 4], image_dtype=np.uint8)
+        labels = [[[[1, 2, 3, 4]], []], [[], [[0, 0, 1, 1]]]]
+        db.validate.append_batch(np.zeros((2, 1, 4, 4), dtype=np.uint8), labels)
+        self.assertEqual(db.validate.labels[1], labels[1])
+        self.assertEqual(db.validate.labels.read_batch([1, 0]), [labels[1], labels[0]])
+        np.testing.assert_array_equal(db.validate.where(classes=["b"]), [1])
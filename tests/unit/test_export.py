@@ -0,0 +1,91 @@
+''' Tests for exporting VedaBases to record shards '''
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from pyveda.vedaset import VedaBase
+from pyveda.vedaset.store import export
+from pyveda.vedaset.store.export import ExportReader, crc32c, encode_example, decode_example
+
+import unittest
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5 = os.path.join(self.tmpdir, "source.h5")
+        self.images = np.arange(9 * 12, dtype=np.uint8).reshape(9, 3, 2, 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _build(self, mltype, labels):
+        vb = VedaBase.from_path(self.h5, mltype=mltype, klasses=["a", "b"],
+                                image_shape=[3, 2, 2], image_dtype=np.uint8, overwrite=True)
+        vb.train.append_batch(self.images[:7], labels[:7])
+        vb.test.append_batch(self.images[7:], labels[7:])
+        vb.close()
+        return VedaBase.from_path(self.h5, mode="r")
+
+    def test_crc32c(self):
+        self.assertEqual(crc32c(b"123456789"), 0xE3069283)
+        data = np.random.RandomState(0).bytes(70001)
+        crc = 0xFFFFFFFF
+        for byte in data:
+            crc = export._CRC_TABLE[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+        self.assertEqual(export._crc_lanes(data), crc ^ 0xFFFFFFFF)
+
+    def test_example_roundtrip(self):
+        feats = decode_example(encode_example({"a": b"xyz", "b": np.array([1.5, -2], dtype=np.float32),
+                                               "c": np.array([3, -1, 2**40], dtype=np.int64), "d": []}))
+        self.assertEqual(feats["a"], b"xyz")
+        np.testing.assert_array_equal(feats["b"], [1.5, -2])
+        np.testing.assert_array_equal(feats["c"], [3, -1, 2**40])
+        self.assertEqual(len(feats["d"]), 0)
+
+    def test_tfrecord(self):
+        labels = np.array([[i % 2, 1] for i in range(9)], dtype=np.uint8)
+        vb = self._build("classification", labels)
+        out = os.path.join(self.tmpdir, "records")
+        index = vb.export(out, format="tfrecord", shard_samples=3, shuffle=True, seed=0, workers=2)
+        vb.close()
+        self.assertEqual([shard["count"] for shard in index["splits"]["train"]], [3, 3, 1])
+        self.assertEqual(index["splits"]["validate"], [])
+        reader = ExportReader(out)
+        self.assertEqual(reader.count("train"), 7)
+        samples = list(reader("train", verify=True))
+        order = np.argsort([int(image.ravel()[0]) for image, label in samples])
+        np.testing.assert_array_equal([samples[i][0] for i in order], self.images[:7])
+        np.testing.assert_array_equal([samples[i][1] for i in order], labels[:7])
+
+    def test_writable_store_workers(self):
+        labels = np.array([[i % 2, 1] for i in range(9)], dtype=np.uint8)
+        self._build("classification", labels).close()
+        vb = VedaBase.from_path(self.h5)
+        out = os.path.join(self.tmpdir, "records")
+        index = vb.export(out, format="tar", shard_samples=4, workers=2)
+        self.assertEqual([shard["count"] for shard in index["splits"]["train"]], [4, 3])
+        self.assertFalse(vb.read_only)
+        vb.train.append_batch(self.images[:1], labels[:1])
+        self.assertEqual(len(vb.train), 8)
+        vb.close()
+        samples = list(ExportReader(out)("train"))
+        np.testing.assert_array_equal([image for image, label in samples], self.images[:7])
+
+    def test_tar_png(self):
+        labels = [[[[0, 0, 1, 1]] * (i % 2), [[1, 1, 2, 2]]] for i in range(9)]
+        vb = self._build("object_detection", labels)
+        out = os.path.join(self.tmpdir, "tars")
+        vb.export(out, format="tar", image_format="png", shard_bytes=12 * 4, workers=0)
+        vb.close()
+        reader = ExportReader(out)
+        self.assertEqual(len(reader.shards("test")), 1)
+        samples = list(reader("test"))
+        np.testing.assert_array_equal([image for image, label in samples], self.images[7:])
+        self.assertEqual([label for image, label in samples], labels[7:])
+
+
+if __name__ == '__main__':
+    unittest.main()
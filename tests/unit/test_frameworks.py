@@ -0,0 +1,81 @@
+''' Tests for the PyTorch and tf.data adapters '''
+
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from pyveda.vedaset import VedaBase
+from pyveda.frameworks import framework_loader
+from pyveda.frameworks.pytorch import has_torch
+from pyveda.frameworks.tf import has_tf
+from pyveda.exceptions import FrameworkNotSupported
+
+import unittest
+
+
+class FrameworksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5 = os.path.join(self.tmpdir, "base.h5")
+        self.images = np.arange(10 * 3 * 2 * 2, dtype=np.uint8).reshape(10, 3, 2, 2)
+        self.labels = np.array([[i % 2, 1 - i % 2] for i in range(10)], dtype=np.uint8)
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                image_shape=[3, 2, 2], image_dtype=np.uint8)
+        vb.train.append_batch(self.images, self.labels)
+        vb.close()
+        self.vb = VedaBase.from_path(self.h5, mode="r")
+
+    def tearDown(self):
+        self.vb.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_default_loader(self):
+        x = np.zeros(3)
+        self.assertIs(framework_loader(None)(x), x)
+
+    def _sample_types(self, vb):
+        clone = pickle.loads(pickle.dumps(vb))
+        types = [type(vb.train.images[0]), type(clone.train.images[0])]
+        clone.close()
+        return types
+
+    def test_framework_survives_pickle(self):
+        vb = VedaBase.from_path(self.h5, mode="r", framework="Keras")
+        self.assertEqual(self._sample_types(vb), [np.ndarray, np.ndarray])
+        vb.close()
+        with self.assertRaises(FrameworkNotSupported):
+            VedaBase.from_path(self.h5, mode="r", framework="foo")
+
+    @unittest.skipUnless(has_torch, "requires torch")
+    def test_torch_framework_survives_pickle(self):
+        import torch
+        vb = VedaBase.from_path(self.h5, mode="r", framework="PyTorch")
+        self.assertEqual(self._sample_types(vb), [torch.Tensor, torch.Tensor])
+        vb.close()
+
+    @unittest.skipUnless(has_torch, "requires torch")
+    def test_torch_dataset(self):
+        import torch
+        from pyveda.frameworks.pytorch import VedaDataset, VedaIterableDataset, dataloader
+        ds = VedaDataset(self.vb.train)
+        image, label = ds[3]
+        self.assertTrue(torch.equal(image, torch.from_numpy(self.images[3])))
+        images, labels = ds[[4, 1]]
+        self.assertEqual(tuple(images.shape), (2, 3, 2, 2))
+        batches = list(dataloader(self.vb.train, 4, shuffle=False))
+        self.assertEqual([len(x) for x, y in batches], [4, 4, 2])
+        batches = list(VedaIterableDataset(self.vb.train, batch_size=3, block_rows=4))
+        np.testing.assert_array_equal(torch.cat([x for x, y in batches]).numpy(), self.images)
+
+    @unittest.skipUnless(has_tf, "requires tensorflow")
+    def test_tf_dataset(self):
+        from pyveda.frameworks.tf import tf_dataset
+        batches = list(tf_dataset(self.vb.train, batch_size=4, block_rows=3, cycle_length=1))
+        images = np.concatenate([x.numpy() for x, y in batches])
+        np.testing.assert_array_equal(images, self.images)
+
+
+if __name__ == '__main__':
+    unittest.main()
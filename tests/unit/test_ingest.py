@@ -0,0 +1,63 @@
+''' Tests for offline ingest of local tiles '''
+
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import pyveda as pv
+from pyveda.fetch.local import find_samples, ingest
+from pyveda.vedaset.store.directory import DirectoryDataBase
+
+import unittest
+
+
+class IngestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tiles = os.path.join(self.tmpdir, "tiles")
+        os.makedirs(self.tiles)
+        self.images = np.arange(10 * 2 * 4 * 4, dtype=np.uint16).reshape(10, 2, 4, 4)
+        for i, image in enumerate(self.images):
+            np.save(os.path.join(self.tiles, "{:04d}.npy".format(i)), image)
+            with open(os.path.join(self.tiles, "{:04d}.json".format(i)), "w") as f:
+                json.dump({"properties": {"label": {"a": i % 2, "b": 1}, "id": "tile{}".format(i),
+                                          "bounds": [i, 0, i + 1, 1]}}, f)
+        np.save(os.path.join(self.tiles, "unlabeled.npy"), self.images[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_samples(self):
+        samples = find_samples(self.tiles)
+        self.assertEqual(len(samples), 10)
+        self.assertTrue(samples[3][0].endswith("0003.npy"))
+        self.assertTrue(samples[3][1].endswith("0003.json"))
+
+    def test_ingest_classification(self):
+        h5 = os.path.join(self.tmpdir, "ingest.h5")
+        vb = pv.ingest(h5, self.tiles, "classification", ["a", "b"], batch_size=4, workers=2)
+        self.assertEqual(list(vb.image_shape), [2, 4, 4])
+        self.assertEqual(len(vb), 10)
+        images = np.concatenate([vb.train.images[:], vb.test.images[:], vb.validate.images[:]])
+        labels = np.concatenate([vb.train.labels[:], vb.test.labels[:], vb.validate.labels[:]])
+        order = np.argsort(images[:, 0, 0, 0])
+        np.testing.assert_array_equal(images[order], self.images)
+        np.testing.assert_array_equal(labels[order], [[i % 2, 1] for i in range(10)])
+        ids = vb._data.metadata.read_batch(np.arange(10))["id"]
+        self.assertEqual(sorted(ids), sorted(["tile{}".format(i) for i in range(10)]))
+        rows = vb._data.query_bbox([3.5, 0, 3.6, 1])
+        self.assertEqual(list(ids[rows]), ["tile3"])
+        vb.close()
+
+    def test_ingest_pairs(self):
+        path = os.path.join(self.tmpdir, "store")
+        db = DirectoryDataBase(path, mltype="object_detection", klasses=["a"],
+                               image_shape=[2, 4, 4], image_dtype=np.uint16)
+        pairs = [(self.images[i], {"a": [[0, 0, i, i]] * i}) for i in range(5)]
+        pairs.append((np.zeros((3, 4, 4)), {"a": []}))
+        stats = ingest(db, pairs, partition=[100, 0, 0], workers=0)
+        self.assertEqual(stats["count"], 5)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(db.train.labels[3], [[[0, 0, 3, 3]] * 3])
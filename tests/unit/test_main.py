@@ -78,6 +78,28 @@ class MainFunctionsTest(unittest.TestCase):
         model = pv.model_from_id('eb1e1e0b-c48e-494f-b56a-4bb0734c98fc')
         self.assertIsInstance(model, Model)
 
+    @patch('pyveda.main.build_vedabase')
+    @patch('pyveda.main.from_id')
+    def test_store_resume(self, from_id, build_vedabase):
+        coll = from_id.return_value
+        coll.mltype, coll.classes, coll.imshape, coll.dtype = "classification", ["a", "b"], [1, 2, 2], np.uint8
+        coll.gen_sample_ids.return_value = ["dp{}".format(i) for i in range(5)]
+        coll._sample_urls_from_id.side_effect = lambda _id: (_id + "/label", _id + "/image")
+        h5 = './resume.h5'
+        vb = VedaBase.from_path(h5, mltype="classification", klasses=["a", "b"], image_shape=[1, 2, 2],
+                                image_dtype=np.uint8, overwrite=True)
+        vb.train.append_batch(np.zeros((2, 1, 2, 2), dtype=np.uint8), np.zeros((2, 2), dtype=np.uint8),
+                              metadata=[{"id": "dp1"}, {"id": "dp3"}])
+        vb.close()
+        try:
+            vb = pv.store(h5, dataset_id="abc", count=5, resume=True)
+            urls, total = build_vedabase.call_args[0][1], build_vedabase.call_args[0][3]
+            self.assertEqual([url for url, _ in urls], ["dp0/label", "dp2/label", "dp4/label"])
+            self.assertEqual(total, 3)
+            vb.close()
+        finally:
+            os.remove(h5)
+
     @patch('pyveda.main.from_geo')
     def test_createfromgeojson(self, from_geo):
         ''' Test the create_from_geojson method '''
@@ -0,0 +1,82 @@
+''' Tests for frozen, memory-mapped VedaBase copies '''
+
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from pyveda.vedaset import VedaBase
+from pyveda.vedaset.store.memmap import MemmapDataBase
+
+import unittest
+
+
+class MemmapDataBaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5 = os.path.join(self.tmpdir, "base.h5")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_freeze_classification(self):
+        images = np.arange(6 * 3 * 4 * 4, dtype=np.uint8).reshape(6, 3, 4, 4)
+        labels = np.array([[1, 0], [0, 1]] * 3, dtype=np.uint8)
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                image_shape=[3, 4, 4], image_dtype=np.uint8)
+        vb.train.images.append_batch(images)
+        vb.train.labels.append_batch(labels)
+        mb = vb.freeze(os.path.join(self.tmpdir, "frozen"))
+        vb.close()
+
+        self.assertEqual(len(mb), 6)
+        self.assertEqual(len(mb.test), 0)
+        self.assertEqual(mb.image_dtype, np.uint8)
+        self.assertTrue(isinstance(mb.train.images[2], np.memmap))
+        np.testing.assert_array_equal(mb.train.images[2], images[2])
+        x, y = mb.train.read_batch([4, 0])
+        np.testing.assert_array_equal(x, images[[4, 0]])
+        np.testing.assert_array_equal(y, labels[[4, 0]])
+        x, y = next(mb.train.batch_generator(3, shuffle=False))
+        self.assertEqual(x.shape, (3, 3, 4, 4))
+        self.assertTrue(MemmapDataBase.is_frozen(os.path.join(self.tmpdir, "frozen")))
+        clone = pickle.loads(pickle.dumps(mb))
+        np.testing.assert_array_equal(clone.train.images[5], images[5])
+
+    def test_freeze_splits(self):
+        images = np.arange(8 * 3 * 4 * 4, dtype=np.uint8).reshape(8, 3, 4, 4)
+        labels = np.array([[1, 0], [0, 1]] * 4, dtype=np.uint8)
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                image_shape=[3, 4, 4], image_dtype=np.uint8)
+        vb.train.append_batch(images, labels)
+        vb.set_split("holdout", [6, 1])
+        vb.kfold(2, shuffle=False)
+        mb = vb.freeze(os.path.join(self.tmpdir, "frozen"))
+        vb.close()
+
+        self.assertEqual(mb.splits, ["fold0", "fold1", "holdout", "test", "train", "validate"])
+        x, y = mb.split("holdout").read_batch([0, 1])
+        np.testing.assert_array_equal(x, images[[6, 1]])
+        self.assertEqual(len(mb.split("fold1")), 4)
+        with self.assertRaises(KeyError):
+            mb.split("fold2")
+        with self.assertRaises(ValueError):
+            MemmapDataBase.from_path(os.path.join(self.tmpdir, "frozen"), mode="a")
+
+    def test_freeze_object_detection(self):
+        labels = [[[[1, 2, 3, 4]], []], [[], []], [[[5, 6, 7, 8]], [[0, 0, 2, 2], [1, 1, 3, 3]]]]
+        vb = VedaBase.from_path(self.h5, mltype="object_detection", klasses=["a", "b"],
+                                image_shape=[3, 4, 4], image_dtype=np.uint8)
+        vb.train.images.append_batch(np.zeros((3, 3, 4, 4), dtype=np.uint8))
+        vb.train.labels.append_batch(labels)
+        mb = vb.freeze(os.path.join(self.tmpdir, "frozen"))
+        vb.close()
+
+        self.assertEqual(len(mb.train.labels), 3)
+        self.assertEqual(mb.train.labels[0], labels[0])
+        self.assertEqual(mb.train.labels[-1], labels[2])
+        self.assertEqual(mb.train.labels.read_batch([2, 1]), [labels[2], labels[1]])
+        boxes, klasses, counts = mb.train.labels.read_boxes([2, 0], padded=True)
+        np.testing.assert_array_equal(counts, [3, 1])
+        np.testing.assert_array_equal(klasses[1], [0, -1, -1])
@@ -0,0 +1,76 @@
+''' Tests for streaming partition assignment of store builds '''
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from pyveda.vedaset import VedaBase
+from pyveda.fetch.partition import StreamingPartitioner, PartitionedWriter
+from pyveda.vedaset.store.metadata import sample_metadata
+
+import unittest
+
+
+class StreamingPartitionerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ids = ["dp{}".format(i) for i in range(2000)]
+
+    def test_hash_assignment(self):
+        whole = StreamingPartitioner([70, 20, 10], seed=3).assign(self.ids)
+        partitioner = StreamingPartitioner([70, 20, 10], seed=3)
+        batched = np.concatenate([partitioner.assign(self.ids[i:i + 7]) for i in range(0, 2000, 7)])
+        np.testing.assert_array_equal(whole, batched)
+        np.testing.assert_allclose(partitioner.ratios, [0.7, 0.2, 0.1], atol=0.03)
+        other = StreamingPartitioner([70, 20, 10], seed=4).assign(self.ids)
+        self.assertTrue((other != whole).any())
+        self.assertEqual(set(StreamingPartitioner([1, 0, 1]).assign(self.ids)), {0, 2})
+
+    def test_stratify(self):
+        # One sample in 50 has the rare class
+        hits = np.zeros((2000, 2), dtype=np.int64)
+        hits[::50, 1] = 1
+        hits[:, 0] = 1
+        partitioner = StreamingPartitioner([70, 20, 10], seed=0, stratify=True, nclasses=2)
+        parts = partitioner.assign(self.ids, hits=hits)
+        rare = np.bincount(parts[hits[:, 1] > 0], minlength=3)
+        np.testing.assert_allclose(rare, [28, 8, 4], atol=1)
+        np.testing.assert_allclose(partitioner.ratios, [0.7, 0.2, 0.1], atol=0.01)
+        with self.assertRaises(ValueError):
+            StreamingPartitioner(stratify=True)
+
+
+class PartitionedWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.h5 = os.path.join(self.tmpdir, "base.h5")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_writer(self):
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8)
+        images = np.arange(50 * 4, dtype=np.uint8).reshape(50, 1, 2, 2)
+        labels = np.array([[i % 2, 1] for i in range(50)], dtype=np.uint8)
+        metadata = [sample_metadata({"properties": {"id": "dp{}".format(i)}}) for i in range(50)]
+        writer = PartitionedWriter(vb, [60, 40, 0], seed=1, batch_rows=16)
+        for start in range(0, 50, 10):
+            writer([images[start:start + 10], labels[start:start + 10], metadata[start:start + 10]])
+        self.assertLess(len(vb.train) + len(vb.test), 50)
+        writer.flush()
+        self.assertEqual([len(vb.train), len(vb.test), len(vb.validate)], writer.partitioner.counts.tolist())
+        self.assertEqual(len(vb.validate), 0)
+        ids = vb.train.metadata.read_batch(np.arange(len(vb.train)))["id"]
+        x, y = vb.train.read_batch(np.arange(len(ids)))
+        expected = [int(_id[2:]) for _id in ids]
+        np.testing.assert_array_equal(x, images[expected])
+        np.testing.assert_array_equal(y, labels[expected])
+        parts = StreamingPartitioner([60, 40, 0], seed=1).assign(["dp{}".format(i) for i in range(50)])
+        np.testing.assert_array_equal(expected, np.flatnonzero(parts == 0))
+        vb.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+''' Tests for sharded VedaBases '''
+
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from pyveda.vedaset.vedaset import store_backend
+from pyveda.vedaset.store.sharded import ShardedDataBase, MANIFEST_FILE
+
+import unittest
+
+
+class ShardedDataBaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "sharded")
+        self.images = np.arange(23 * 4, dtype=np.uint8).reshape(23, 1, 2, 2)
+        self.labels = np.array([[i % 2, 1] for i in range(23)], dtype=np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _build(self, **kwargs):
+        sb = ShardedDataBase(self.path, mltype="classification", klasses=["a", "b"],
+                             image_shape=[1, 2, 2], image_dtype=np.uint8, **kwargs)
+        sb.train.append_batch(self.images[:7], self.labels[:7])
+        sb.train.append_batch(self.images[7:20], self.labels[7:20])
+        sb.test.append_batch(self.images[20:], self.labels[20:])
+        return sb
+
+    def test_rollover(self):
+        sb = self._build(shard_samples=8)
+        self.assertEqual([shard["count"] for shard in sb.manifest["shards"]], [8, 8, 7])
+        self.assertEqual(len(sb), 23)
+        self.assertEqual(len(sb.train), 20)
+        self.assertEqual(len(sb.test), 3)
+        idx = [19, 0, 8, 7, 15]
+        x, y = sb.train.read_batch(idx)
+        np.testing.assert_array_equal(x, self.images[idx])
+        np.testing.assert_array_equal(y, self.labels[idx])
+        sb.close()
+        with open(os.path.join(self.path, MANIFEST_FILE)) as f:
+            self.assertTrue(all(shard["path"].endswith(".h5") for shard in json.load(f)["shards"]))
+
+    def test_metadata(self):
+        sb = ShardedDataBase(self.path, mltype="classification", klasses=["a", "b"],
+                             image_shape=[1, 2, 2], image_dtype=np.uint8, shard_samples=4)
+        sb.train.append_batch(self.images[:10], self.labels[:10],
+                              metadata=[{"id": str(i), "bounds": [i, 0, i + 1, 1]} for i in range(10)])
+        np.testing.assert_array_equal(sb.train.query_bbox([3.5, 0, 5.5, 1]), [3, 4, 5])
+        self.assertEqual(list(sb.train.metadata.read_batch([9, 4])["id"]), ["9", "4"])
+        sb.close()
+
+    def test_recover(self):
+        sb = ShardedDataBase(self.path, mltype="classification", klasses=["a", "b"],
+                             image_shape=[1, 2, 2], image_dtype=np.uint8, shard_samples=4)
+        sb.train.append_batch(self.images[:6], self.labels[:6], metadata=[{"id": str(i)} for i in range(6)])
+        sb.shards[-1].train.images.append_batch(self.images[6:7])
+        self.assertEqual(sb.recover(), 1)
+        self.assertEqual(sb.stored_ids(), set(str(i) for i in range(6)))
+        self.assertEqual([shard["count"] for shard in sb.manifest["shards"]], [4, 2])
+        sb.close()
+
+    def test_shard_bytes(self):
+        sb = self._build(shard_bytes=40)
+        self.assertEqual(len(sb.manifest["shards"]), 3)
+        sb.close()
+
+    def test_parallel_reads(self):
+        self._build(shard_samples=5).close()
+        self.assertIs(store_backend(self.path), ShardedDataBase)
+        for pool in ("process", "thread"):
+            with ShardedDataBase(self.path, mode="r", workers=2, pool=pool) as sb:
+                idx = [19, 0, 8, 4, 12, 5]
+                x, y = sb.train.read_batch(idx)
+                np.testing.assert_array_equal(x, self.images[idx])
+                np.testing.assert_array_equal(y, self.labels[idx])
+                np.testing.assert_array_equal(sb.test.read_batch([2, 0])[0], self.images[[22, 20]])
+                np.testing.assert_array_equal(sb.train.where(classes=["a"]), np.arange(1, 20, 2))
+
+    def test_pickle_and_resume(self):
+        sb = self._build(shard_samples=8)
+        sb.close()
+        sb = ShardedDataBase(self.path)
+        sb.validate.append_batch(self.images[:3], self.labels[:3])
+        self.assertEqual([shard["count"] for shard in sb.manifest["shards"]], [8, 8, 8, 2])
+        clone = pickle.loads(pickle.dumps(sb))
+        sb.close()
+        self.assertTrue(clone.read_only)
+        np.testing.assert_array_equal(clone.validate.read_batch([0, 2])[0], self.images[[0, 2]])
+        clone.close()
+
+    def test_reset_shard(self):
+        sb = self._build(shard_samples=8)
+        shard = sb.reset_shard(1)
+        self.assertEqual(len(sb), 15)
+        shard.train.append_batch(self.images[8:16], self.labels[8:16])
+        sb.refresh()
+        self.assertEqual(len(sb), 23)
+        np.testing.assert_array_equal(sb.train.read_batch(np.arange(20))[0], self.images[:20])
+        sb.close()
+
+    def test_float_stats(self):
+        sb = ShardedDataBase(self.path, mltype="classification", klasses=["a", "b"],
+                             image_shape=[1, 2, 2], image_dtype=np.float32, shard_samples=4)
+        images = np.concatenate([np.linspace(0, 1, 16), np.linspace(10, 50, 16)]).reshape(8, 1, 2, 2)
+        sb.train.append_batch(images.astype(np.float32), self.labels[:8])
+        self.assertNotEqual(sb.shards[0].stats.range, sb.shards[1].stats.range)
+        stats = sb.stats
+        self.assertEqual(stats.range, [0., 50.])
+        np.testing.assert_array_equal(stats.count, [32])
+        np.testing.assert_allclose(stats.mean, [images.mean()], rtol=1e-6)
+        self.assertEqual(stats.hist.sum(), 32)
+        self.assertEqual(stats.hist[0, :6].sum(), 16)
+        sb.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
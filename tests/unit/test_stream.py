@@ -0,0 +1,194 @@
+''' Tests for the sample ring buffer of VedaStream '''
+
+import asyncio
+import concurrent.futures
+import threading
+import numpy as np
+from pyveda.vedaset.stream.ring import SampleRing
+from pyveda.vedaset.stream.vedastream import BufferedDataStream
+
+import unittest
+
+
+class SampleRingTest(unittest.TestCase):
+
+    def _image(self, i):
+        return np.full((3, 2, 2), i, dtype=np.uint8)
+
+    def test_queue_and_window(self):
+        ring = SampleRing(4)
+        for i in range(3):
+            ring.put([i, 1], self._image(i))
+        images = ring.images
+        label, image = ring.get()
+        np.testing.assert_array_equal(label, [0, 1])
+        self.assertEqual(image[0, 0, 0], 0)
+        self.assertEqual(ring.pending, 2)
+        for i in range(3, 5):
+            ring.put([i, 1], self._image(i))
+        self.assertIs(ring.images, images)
+        self.assertTrue(ring.full())
+        self.assertEqual(len(ring), 4)
+        # Window holds the last four samples, oldest first
+        self.assertEqual(ring.window("images", 0)[0, 0, 0], 1)
+        self.assertEqual(ring.window("images", -1)[0, 0, 0], 4)
+        batch = ring.window("images", slice(0, 3))
+        self.assertTrue(np.shares_memory(batch, ring.images))
+        np.testing.assert_array_equal(batch[:, 0, 0, 0], [1, 2, 3])
+        np.testing.assert_array_equal(ring.window("labels", slice(None))[:, 0], [1, 2, 3, 4])
+        np.testing.assert_array_equal(ring.window("labels", [3, 0])[:, 0], [4, 1])
+        with self.assertRaises(IndexError):
+            ring.window("images", 4)
+        self.assertEqual([ring.get()[0][0] for _ in range(4)], [1, 2, 3, 4])
+        with self.assertRaises(TimeoutError):
+            ring.get(timeout=0.01)
+
+    def test_put_waits_for_consumer(self):
+        ring = SampleRing(2)
+        ring.put([0], self._image(0))
+        ring.put([1], self._image(1))
+        with self.assertRaises(TimeoutError):
+            ring.put([2], self._image(2), timeout=0.01)
+        writer = threading.Thread(target=ring.put, args=([2], self._image(2)))
+        writer.start()
+        self.assertEqual(ring.get()[0][0], 0)
+        writer.join(5)
+        self.assertEqual([ring.get()[0][0] for _ in range(2)], [1, 2])
+
+    def test_consumed_samples_are_copies(self):
+        ring = SampleRing(2)
+        ring.put(np.array([1, 0]), self._image(1))
+        ring.put(np.array([0, 1]), self._image(2))
+        label, image = ring.get()
+        ring.put(np.array([9, 9]), self._image(3))
+        self.assertTrue(ring.full())
+        np.testing.assert_array_equal(label, [1, 0])
+        self.assertTrue((image == 1).all())
+
+    def test_budget_shrinks_below_pending(self):
+        ring = SampleRing(4, max_bytes=2 * 14)
+        for _ in range(3):
+            ring.put(None, None)
+        writer = threading.Thread(target=ring.put, args=(np.array([1, 0], dtype=np.uint8), self._image(7)))
+        writer.start()
+        writer.join(0.1)
+        self.assertEqual(ring.capacity, 2)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual([ring.get() for _ in range(2)], [[None, None], [None, None]])
+        writer.join(5)
+        self.assertEqual(ring.get(), [None, None])
+        self.assertEqual(ring.get()[1][0, 0, 0], 7)
+
+    def test_missing_and_ragged(self):
+        ring = SampleRing(3, ragged_labels=True)
+        self.assertFalse(ring.put(None, None))
+        self.assertTrue(ring.put([[[0, 0, 1, 1]], []], self._image(1)))
+        self.assertFalse(ring.put([[], []], np.zeros((3, 4, 4), dtype=np.uint8)))
+        self.assertEqual(ring.get(), [None, None])
+        label, image = ring.get()
+        self.assertEqual(label, [[[0, 0, 1, 1]], []])
+        self.assertEqual(ring.get(), [None, None])
+
+
+class BufferedSampleArrayTest(unittest.TestCase):
+
+    def test_consume_from_ring(self):
+        vs = BufferedDataStream("classification", ["a", "b"], 10, iter([]), [3, 2, 2], bufsize=4)
+        for i in range(4):
+            vs._buf.put([i % 2, 1], np.full((3, 2, 2), i, dtype=np.uint8))
+        image, label = next(vs.train)
+        self.assertEqual(image[0, 0, 0], 0)
+        np.testing.assert_array_equal(label, [0, 1])
+        self.assertEqual(len(vs.train.images), 4)
+        np.testing.assert_array_equal(vs.train.labels[1:3], [[1, 1], [0, 1]])
+        self.assertEqual([img[0, 0, 0] for img in vs.test.images], [0, 1, 2, 3])
+
+
+class WatermarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.vs = BufferedDataStream("classification", ["a", "b"], 100, iter([]), [3, 2, 2], bufsize=8,
+                                     high_watermark=6, low_watermark=2)
+        self.vs._configure_fetcher()
+        self.loop = asyncio.new_event_loop()
+        self.vs._loop = self.loop
+        self.fetcher = self.vs._fetcher
+        self.fetcher._qreq = asyncio.Queue()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _fetch(self, n):
+        for _ in range(n):
+            self.loop.run_until_complete(self.fetcher._qreq.get())
+            self.vs._buf.put(np.array([1, 0], dtype=np.uint8), np.zeros((3, 2, 2), dtype=np.uint8))
+            self.vs._in_flight -= 1
+
+    def _settle(self):
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+
+    def test_pause_and_resume(self):
+        producer = self.loop.create_task(self.fetcher.produce_reqs(reqs=[("lbl", "img")] * 10))
+        self._settle()
+        self.assertTrue(self.fetcher.paused)
+        self.assertEqual(self.vs.occupancy["in_flight"], 6)
+        self._fetch(6)
+        occupancy = self.vs.occupancy
+        self.assertEqual((occupancy["samples"], occupancy["buffered"], occupancy["bytes"]), (6, 6, 6 * 14))
+        # Production stays paused until the buffer drains to the low watermark
+        for _ in range(3):
+            self.vs._buf.get()
+        self._settle()
+        self.assertTrue(self.fetcher.paused)
+        self.vs._buf.get()
+        self._settle()
+        self.assertTrue(producer.done())
+        self.assertEqual(self.vs.occupancy["samples"], 6)
+        self.assertTrue(self.vs.occupancy["paused"])
+
+    def test_producer_error_reaches_consumer(self):
+        self.vs._buf.put(np.array([1, 0], dtype=np.uint8), np.zeros((3, 2, 2), dtype=np.uint8))
+        fut = concurrent.futures.Future()
+        fut.set_exception(RuntimeError("boom"))
+        self.vs._on_produced(fut)
+        self.assertIsNotNone(self.vs._buf.get()[0])
+        with self.assertRaises(RuntimeError):
+            self.vs._buf.get(timeout=1)
+
+    def test_first_sample_sizes_budget(self):
+        vs = BufferedDataStream("classification", ["a", "b"], 100, iter([]), [3, 2, 2], bufsize=8,
+                                high_watermark=6, low_watermark=2, max_bytes=4 * 14)
+        vs._configure_fetcher()
+        vs._loop = self.loop
+        fetcher = vs._fetcher
+        fetcher._qreq = asyncio.Queue()
+        producer = self.loop.create_task(fetcher.produce_reqs(reqs=[("lbl", "img")] * 10))
+        self._settle()
+        # One request in flight until a sample tells how many bytes each one takes
+        self.assertTrue(fetcher.paused)
+        self.assertEqual(vs.occupancy["in_flight"], 1)
+        self.loop.run_until_complete(fetcher._qreq.get())
+        vs._buf.put(np.array([1, 0], dtype=np.uint8), np.zeros((3, 2, 2), dtype=np.uint8))
+        vs._in_flight -= 1
+        self.assertTrue(vs._below_low())
+        fetcher.resume()
+        self._settle()
+        occupancy = vs.occupancy
+        self.assertEqual((occupancy["capacity"], occupancy["buffered"], occupancy["in_flight"]), (4, 1, 3))
+        self.assertTrue(fetcher.paused)
+        producer.cancel()
+
+    def test_byte_budget(self):
+        vs = BufferedDataStream("classification", ["a", "b"], 100, iter([]), [3, 2, 2], bufsize=8, max_bytes=4 * 14)
+        vs._buf.put(np.array([1, 0], dtype=np.uint8), np.zeros((3, 2, 2), dtype=np.uint8))
+        self.assertEqual(vs.occupancy["capacity"], 4)
+        self.assertEqual(vs.occupancy["allocated_bytes"], 4 * 14)
+        self.assertEqual(vs.occupancy["high_watermark"], 4)
+        self.assertEqual(vs.occupancy["low_bytes"], 2 * 14)
+        with self.assertRaises(ValueError):
+            BufferedDataStream("classification", ["a"], 100, iter([]), [3, 2, 2], bufsize=8,
+                               high_watermark=4, low_watermark=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
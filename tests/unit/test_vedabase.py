@@ -1,6 +1,8 @@
 ''' Tests for VedaBase '''
 
 import os, sys
+import numpy as np
+import tables
 from auth_mock import conn, my_vcr
 import pyveda as pv
 pv.config.set_dev()
@@ -8,7 +10,10 @@ pv.config.set_conn(conn)
 
 from pyveda.vedaset import VedaBase
 from pyveda.fetch.compat import build_vedabase
-from pyveda.vedaset.store.vedabase import WrappedDataNode
+from pyveda.vedaset.store.vedabase import WrappedDataNode, DATA_GROUPS
+from pyveda.vedaset.store.layout import StorageLayout
+from pyveda.vedaset.store.metadata import GridIndex
+from pyveda.vedaset.store.stats import BandStats
 from pyveda.exceptions import LabelNotSupported, FrameworkNotSupported
 
 import unittest
@@ -97,3 +102,818 @@ class VedaBaseTest(unittest.TestCase):
         self.assertEqual(type(vb.train), WrappedDataNode)
         self.assertEqual(type(vb.test), WrappedDataNode)
         self.assertEqual(type(vb.validate), WrappedDataNode)
+
+
+class VedaBaseLayoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './layout.h5'
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def tearDown(self):
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_layout_applied(self):
+        layout = StorageLayout(complib="zstd", complevel=4, chunk_samples=1,
+                               expectedrows={"train": 700, "test": 200, "validate": 100})
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                image_shape=[3, 16, 16], image_dtype=np.uint8, layout=layout)
+        images = vb._fileh.root.data.images
+        self.assertEqual(images.chunkshape, (1, 3, 16, 16))
+        self.assertEqual(images.filters.complib, "blosc:zstd")
+        self.assertEqual(images.filters.complevel, 4)
+        self.assertEqual(vb._fileh.root.data.labels.chunkshape, (1, 2))
+        vb.train.images.append_batch(np.ones((5, 3, 16, 16), dtype=np.uint8))
+        vb.close()
+
+        vb = VedaBase.from_path(self.h5)
+        self.assertEqual(vb.layout, layout)
+        self.assertEqual(len(vb.train.images), 5)
+        vb.close()
+
+    def test_layout_presets(self):
+        self.assertEqual(StorageLayout.from_spec("random").chunk_samples, 1)
+        self.assertEqual(StorageLayout.from_spec(None).filters.complevel, 0)
+        self.assertEqual(StorageLayout.from_spec({"complib": "lz4"}).complevel, 5)
+        self.assertEqual(StorageLayout(complib="zstd", complevel=0).complevel, 0)
+        self.assertEqual(StorageLayout(complib="zstd", complevel=0).filters.complevel, 0)
+        with self.assertRaises(ValueError):
+            StorageLayout(complib="zstd", complevel=10)
+        with self.assertRaises(ValueError):
+            StorageLayout(complib="foo")
+        with self.assertRaises(ValueError):
+            StorageLayout.from_spec("foo")
+
+
+class VedaBaseReadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './read.h5'
+        self.vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                     image_shape=[3, 4, 4], image_dtype=np.uint8, overwrite=True)
+        self.images = np.arange(10 * 3 * 4 * 4, dtype=np.uint8).reshape(10, 3, 4, 4)
+        self.labels = np.array([[i % 2, (i + 1) % 2] for i in range(10)], dtype=np.uint8)
+        self.vb.train.images.append_batch(self.images)
+        self.vb.train.labels.append_batch(self.labels)
+
+    def tearDown(self):
+        self.vb.close()
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_read_batch(self):
+        idx = [7, 2, 3, 4, 9, 2, -1]
+        images, labels = self.vb.train.read_batch(idx)
+        np.testing.assert_array_equal(images, self.images[idx])
+        np.testing.assert_array_equal(labels, self.labels[idx])
+        self.assertEqual(self.vb.train.images.read_batch([]).shape, (0, 3, 4, 4))
+        with self.assertRaises(IndexError):
+            self.vb.train.images.read_batch([10])
+
+    def test_generator_batches(self):
+        gen = self.vb.train.batch_generator(4, shuffle=False, channels_last=True)
+        x, y = next(gen)
+        self.assertEqual(x.shape, (4, 4, 4, 3))
+        np.testing.assert_array_equal(x[1], self.images[1].T)
+        np.testing.assert_array_equal(y, self.labels[:4])
+
+
+class ObjDetectionLabelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './objd.h5'
+        self.vb = VedaBase.from_path(self.h5, mltype="object_detection", klasses=["a", "b"],
+                                     image_shape=[1, 4, 4], image_dtype=np.uint8, overwrite=True)
+        self.labels = [[[[1, 2, 3, 4]], []], [[], []], [[[5, 6, 7, 8]], [[0, 0, 2, 2], [1, 1, 3, 3]]]]
+
+    def tearDown(self):
+        self.vb.close()
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_columnar_labels(self):
+        labels = self.vb.train.labels
+        labels.append_batch(self.labels[:2])
+        labels.append(self.labels[2])
+        self.assertEqual(len(labels), 3)
+        self.assertEqual(labels[2], self.labels[2])
+        self.assertEqual(labels[-3], self.labels[0])
+        self.assertEqual(labels.read_batch([2, 0, 1]), [self.labels[2], self.labels[0], self.labels[1]])
+        boxes, klasses, counts = labels.read_boxes([2, 1, 0], padded=True)
+        self.assertEqual(boxes.shape, (3, 3, 4))
+        np.testing.assert_array_equal(counts, [3, 0, 1])
+        np.testing.assert_array_equal(klasses[0], [0, 1, 1])
+        np.testing.assert_array_equal(klasses[1], [-1, -1, -1])
+        np.testing.assert_array_equal(boxes[2, 0], [1, 2, 3, 4])
+        boxes, klasses, counts = labels.read_boxes([2, 0])
+        self.assertEqual(boxes.shape, (4, 4))
+        np.testing.assert_array_equal(boxes[3], [1, 2, 3, 4])
+
+    def test_json_labels(self):
+        import tables
+        self.vb._fileh.remove_node("/data/labels", recursive=True)
+        self.vb._fileh.create_vlarray("/data", "labels", atom=tables.UInt8Atom())
+        self.vb._nodes = {}
+        self.vb.train.labels.append_batch(self.labels)
+        self.assertEqual(self.vb.train.labels[2], self.labels[2])
+        self.assertEqual(self.vb.train.labels.read_batch([1, 0]), [self.labels[1], self.labels[0]])
+
+
+class HitTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './hits.h5'
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def tearDown(self):
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_classification_where(self):
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["house", "damaged building"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8)
+        labels = np.array([[1, 0], [0, 1], [1, 1], [0, 0]], dtype=np.uint8)
+        vb.train.append_batch(np.zeros((4, 1, 2, 2), dtype=np.uint8), labels)
+        vb.train.labels.append(np.array([1, 0], dtype=np.uint8))
+        np.testing.assert_array_equal(vb.train.where(classes=["house"]), [0, 2, 4])
+        np.testing.assert_array_equal(vb.train.where(classes=["house", "damaged building"]), [2])
+        np.testing.assert_array_equal(vb.train.where(match="any"), [0, 1, 2, 4])
+        np.testing.assert_array_equal(vb.train.where(min_count=0, max_count=0), [3])
+        self.assertTrue(vb._fileh.root.data.hit_table.cols._f_col("house").is_indexed)
+        with self.assertRaises(ValueError):
+            vb.train.where(classes=["boat"])
+        vb.close()
+
+    def test_object_detection_where(self):
+        vb = VedaBase.from_path(self.h5, mltype="object_detection", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8)
+        labels = [[[[1, 2, 3, 4]], []], [[], []], [[[5, 6, 7, 8]], [[0, 0, 2, 2], [1, 1, 3, 3]]]]
+        vb.test.append_batch(np.zeros((3, 1, 2, 2), dtype=np.uint8), labels)
+        np.testing.assert_array_equal(vb.test.where(classes=["b"], min_count=2), [2])
+        np.testing.assert_array_equal(vb.test.hit_counts(), [[1, 0], [0, 0], [1, 2]])
+        vb.close()
+
+    def test_segmentation_hits(self):
+        vb = VedaBase.from_path(self.h5, mltype="segmentation", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8)
+        masks = np.array([[[1, 0], [0, 0]], [[2, 2], [1, 0]]], dtype=np.float32)
+        vb.train.append_batch(np.zeros((2, 1, 2, 2), dtype=np.uint8), masks)
+        np.testing.assert_array_equal(vb.train.hit_counts(), [[1, 0], [1, 2]])
+        vb.close()
+
+    def _legacy_table(self, narrow):
+        # Files written before the hit_table was populated hold an empty table
+        with tables.open_file(self.h5, "a") as fileh:
+            fileh.remove_node("/data", "hit_table")
+            col = tables.UInt8Col if narrow else tables.UInt32Col
+            fileh.create_table("/data", "hit_table", {"a": col(pos=1), "b": col(pos=2)})
+
+    def test_legacy_table_read_only(self):
+        vb = VedaBase.from_path(self.h5, mltype="segmentation", klasses=["a", "b"],
+                                image_shape=[1, 20, 20], image_dtype=np.uint8)
+        masks = np.zeros((3, 20, 20), dtype=np.float32)
+        masks[[0, 2]] = 1
+        masks[2, :5] = 2
+        vb.train.append_batch(np.zeros((3, 1, 20, 20), dtype=np.uint8), masks)
+        vb.close()
+        expected = [[400, 0], [0, 0], [300, 100]]
+        for narrow in (True, False):
+            self._legacy_table(narrow)
+            vb = VedaBase.from_path(self.h5, mode="r")
+            np.testing.assert_array_equal(vb.train.hit_counts(), expected)
+            np.testing.assert_array_equal(vb.train.where(classes=["a"], min_count=300), [0, 2])
+            np.testing.assert_array_equal(vb.train.where(min_count=0, max_count=0), [1])
+            vb.close()
+        # Writable files fill in the rows of current tables
+        vb = VedaBase.from_path(self.h5)
+        np.testing.assert_array_equal(vb.train.hit_counts(), expected)
+        self.assertEqual(len(vb._fileh.root.data.hit_table), 3)
+        vb.close()
+
+
+class SamplerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './sampler.h5'
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+        self.vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["common", "rare"],
+                                     image_shape=[1, 2, 2], image_dtype=np.uint8)
+        # 90 samples of "common", 5 of "rare" and 5 without any class
+        labels = np.zeros((100, 2), dtype=np.uint8)
+        labels[:90, 0] = 1
+        labels[90:95, 1] = 1
+        images = np.arange(100, dtype=np.uint8).reshape(100, 1, 1, 1) * np.ones((1, 1, 2, 2), dtype=np.uint8)
+        self.vb.train.append_batch(images, labels)
+
+    def tearDown(self):
+        self.vb.close()
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def _epoch(self, gen):
+        return np.concatenate([next(gen)[0][:, 0, 0, 0] for _ in range(len(gen))])
+
+    def test_balanced(self):
+        np.random.seed(0)
+        gen = self.vb.train.batch_generator(30, sampler="balanced")
+        first = self._epoch(gen)
+        self.assertEqual(len(first), 90)
+        np.testing.assert_array_equal(np.bincount((first >= 90).astype(int) + (first >= 95), minlength=3), [30, 30, 30])
+        second = self._epoch(gen)
+        self.assertFalse(np.array_equal(first, second))
+
+    def test_inverse_frequency(self):
+        np.random.seed(0)
+        gen = self.vb.train.batch_generator(100, sampler="inverse_frequency")
+        drawn = np.concatenate([self._epoch(gen) for _ in range(10)])
+        rare = np.mean((drawn >= 90) & (drawn < 95))
+        self.assertAlmostEqual(rare, 1.0 / 3, delta=0.05)
+
+    def test_weights(self):
+        weights = np.zeros(100)
+        weights[[3, 7]] = 1
+        gen = self.vb.train.batch_generator(10, sampler=weights, shuffle=False)
+        self.assertEqual(set(self._epoch(gen)), {3, 7})
+        with self.assertRaises(ValueError):
+            self.vb.train.batch_generator(10, sampler=np.ones(5))
+        with self.assertRaises(ValueError):
+            self.vb.train.batch_generator(10, sampler="rarest")
+
+
+class BlockShuffleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './blockshuffle.h5'
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+        self.vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a"],
+                                     image_shape=[1, 2, 2], image_dtype=np.uint16,
+                                     layout=StorageLayout(chunk_samples=16))
+        images = np.arange(256, dtype=np.uint16).reshape(256, 1, 1, 1) * np.ones((1, 1, 2, 2), dtype=np.uint16)
+        self.vb.train.append_batch(images, np.ones((256, 1), dtype=np.uint8))
+        self.vb.test.append_batch(images[:32], np.ones((32, 1), dtype=np.uint8))
+
+    def tearDown(self):
+        self.vb.close()
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_block_shuffle(self):
+        np.random.seed(0)
+        gen = self.vb.train.batch_generator(16, shuffle="block", loop=False)
+        np.testing.assert_array_equal(gen.chunk_ids, np.arange(256) // 16)
+        self.assertEqual(gen.chunk_reads_per_batch, 1.0)
+        seen = np.concatenate([x[:, 0, 0, 0] for x, y in gen]).astype(np.int64)
+        np.testing.assert_array_equal(np.sort(seen), np.arange(256))
+        self.assertFalse(np.array_equal(seen, np.arange(256)))
+
+        wide = self.vb.train.batch_generator(16, shuffle="block", shuffle_window=64)
+        self.assertLessEqual(wide.chunk_reads_per_batch, 4.0)
+        full = self.vb.train.batch_generator(16, shuffle=True)
+        self.assertGreater(full.chunk_reads_per_batch, wide.chunk_reads_per_batch)
+        for shuffle in (None, 0, 1):
+            gen = self.vb.train.batch_generator(16, shuffle=shuffle)
+            self.assertEqual(bool(gen.shuffle), bool(shuffle))
+
+    def test_partition_chunks(self):
+        # test rows follow the 256 train rows in the store
+        np.testing.assert_array_equal(self.vb.test.images.chunk_ids(), 16 + np.arange(32) // 16)
+
+
+def _read_worker(args):
+    node, idx = args
+    images, labels = node.read_batch(idx)
+    return images.sum(), labels.sum()
+
+
+class VedaBaseWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './workers.h5'
+        self.vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                     image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True)
+        self.images = np.arange(8 * 4, dtype=np.uint8).reshape(8, 1, 2, 2)
+        self.labels = np.array([[i % 2, 1] for i in range(8)], dtype=np.uint8)
+        self.vb.train.append_batch(self.images, self.labels)
+
+    def tearDown(self):
+        self.vb.close()
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_pickle(self):
+        import pickle
+        state, node_state = pickle.dumps(self.vb), pickle.dumps(self.vb.train)
+        self.vb.close()
+        vb = pickle.loads(state)
+        self.assertIsNone(vb._handle)
+        self.assertTrue(vb.read_only)
+        self.assertEqual(vb.layout, self.vb.layout)
+        np.testing.assert_array_equal(vb.train.images.read_batch([3, 1]), self.images[[3, 1]])
+        node = pickle.loads(node_state)
+        np.testing.assert_array_equal(node.labels.read_batch([5]), self.labels[[5]])
+        node._vset.close()
+        vb.close()
+
+    def test_workers(self):
+        import multiprocessing as mp
+        self.vb.close()
+        reader = VedaBase.from_path(self.h5, mode="r")
+        self.assertEqual(len(reader.train), 8)
+        jobs = [(reader.train, [i, 7 - i]) for i in range(4)]
+        expected = [(self.images[[i, 7 - i]].sum(), self.labels[[i, 7 - i]].sum()) for i in range(4)]
+        for method in ("fork", "spawn"):
+            with mp.get_context(method).Pool(2) as pool:
+                self.assertEqual(pool.map(_read_worker, jobs), expected)
+        reader.close()
+
+    def test_file_registry(self):
+        # Fork-safe reopening relies on PyTables' private registry, checked against PyTables 3.x
+        from unittest import mock
+        from pyveda.vedaset.store import vedabase
+        self.assertTrue(tables.__version__.startswith("3."))
+        self.assertIsNotNone(vedabase._file_registry())
+        self.vb.close()
+        with mock.patch.object(vedabase, "_file_registry", return_value=None):
+            reader = VedaBase.from_path(self.h5, mode="r")
+            self.assertEqual(len(reader.train), 8)
+            reader.close()
+
+
+class AppendBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './buffer.h5'
+
+    def tearDown(self):
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_buffered_appends(self):
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True, buffer_rows=4)
+        images = np.arange(6 * 4, dtype=np.uint8).reshape(6, 1, 2, 2)
+        for i in range(3):
+            vb.train.images.append(images[i])
+            vb.train.labels.append(np.array([i % 2, 1], dtype=np.uint8))
+        self.assertEqual(vb._fileh.root.data.images.nrows, 0)
+        self.assertEqual(len(vb.train), 3)
+        vb.train.images.append(images[3])
+        self.assertEqual(vb._fileh.root.data.images.nrows, 4)
+        vb.train.labels.append(np.array([1, 1], dtype=np.uint8))
+        np.testing.assert_array_equal(vb.train.where(classes=["a"]), [1, 3])
+        for i in range(4, 6):
+            vb.train.images.append(images[i])
+            vb.train.labels.append(np.array([0, 0], dtype=np.uint8))
+        np.testing.assert_array_equal(vb.train.images[5], images[5])
+        vb.train.images.append(images[0])
+        vb.close()
+        vb = VedaBase.from_path(self.h5)
+        self.assertEqual(len(vb.train), 7)
+        self.assertEqual(len(vb._data.images), 7)
+        self.assertEqual(len(vb._data.labels), 6)
+        vb.close()
+
+    def test_buffered_boxes(self):
+        vb = VedaBase.from_path(self.h5, mltype="object_detection", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True)
+        labels = [[[[i, i, i + 1, i + 1]] * i, []] for i in range(5)]
+        for label in labels:
+            vb.train.labels.append(label)
+        self.assertEqual(vb._fileh.root.data.labels.offsets.nrows, 0)
+        self.assertEqual(vb.train.labels.read_batch([4, 0, 2]), [labels[4], labels[0], labels[2]])
+        vb.train.labels.append(labels[3])
+        np.testing.assert_array_equal(vb.train.hit_counts()[:, 0], [0, 1, 2, 3, 4, 3])
+        vb.close()
+
+    def test_unbuffered(self):
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True, buffer_bytes=0)
+        vb.train.images.append(np.zeros((1, 2, 2), dtype=np.uint8))
+        self.assertEqual(vb._fileh.root.data.images.nrows, 1)
+        vb.close()
+
+
+class LegacyVedaBase(VedaBase):
+    """ Writes the older layout with a full set of arrays per partition group """
+    def _build_filetree(self, dg=DATA_GROUPS):
+        for name, desc in dg.items():
+            self._fileh.create_group("/", name.lower(), desc)
+        self._create_tables(self._classifications, filters=self.layout.filters)
+        self._create_arrays(self._image_klass, self.image_dtype)
+        self._create_arrays(self._label_klass)
+
+
+class PartitionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './partitions.h5'
+        self.images = np.arange(10 * 4, dtype=np.uint8).reshape(10, 1, 2, 2)
+        self.labels = np.array([[i % 2, 1] for i in range(10)], dtype=np.uint8)
+
+    def tearDown(self):
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def _build(self, klass=VedaBase):
+        vb = klass.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                             image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True)
+        vb.train.append_batch(self.images[:7], self.labels[:7])
+        vb.test.images.append_batch(self.images[7:])
+        vb.test.labels.append_batch(self.labels[7:])
+        return vb
+
+    def test_views(self):
+        vb = self._build()
+        self.assertEqual(vb.splits, ["test", "train", "validate"])
+        np.testing.assert_array_equal(vb.test.rows, [7, 8, 9])
+        self.assertEqual(len(vb), 10)
+        x, y = vb.test.read_batch([2, 0])
+        np.testing.assert_array_equal(x, self.images[[9, 7]])
+        np.testing.assert_array_equal(y, self.labels[[9, 7]])
+        np.testing.assert_array_equal(vb.test.images[-1], self.images[9])
+        self.assertEqual(len(vb.test.labels[:]), 3)
+        np.testing.assert_array_equal(vb.test.where(classes=["a"]), [0, 2])
+        np.testing.assert_array_equal(vb.test.hit_counts()[:, 0], [1, 0, 1])
+        vb.close()
+
+    def test_partition(self):
+        vb = self._build()
+        vb.partition([50, 30, 20], seed=0)
+        self.assertEqual([len(vb.train), len(vb.test), len(vb.validate)], [5, 3, 2])
+        rows = np.concatenate([vb.train.rows, vb.test.rows, vb.validate.rows])
+        np.testing.assert_array_equal(np.sort(rows), np.arange(10))
+        np.testing.assert_array_equal(vb.validate.images.read_batch([0, 1]), self.images[vb.validate.rows])
+        self.assertEqual(vb._fileh.root.data.images.nrows, 10)
+        vb.set_split("holdout", [3, 1])
+        vb.close()
+
+        vb = VedaBase.from_path(self.h5)
+        np.testing.assert_array_equal(vb.split("holdout").labels.read_batch([0, 1]), self.labels[[3, 1]])
+        vb.partition([80, 20], names=["train", "test"], shuffle=False)
+        self.assertEqual(vb.splits, ["test", "train", "validate"])
+        self.assertEqual(len(vb.validate), 0)
+        np.testing.assert_array_equal(vb.test.rows, [8, 9])
+        with self.assertRaises(IndexError):
+            vb.set_split("bad", [10])
+        vb.close()
+
+    def test_kfold(self):
+        vb = self._build()
+        folds = vb.kfold(5, seed=1)
+        self.assertEqual(len(folds), 5)
+        train, test = folds[2]
+        self.assertEqual((len(train), len(test)), (8, 2))
+        self.assertEqual(len(np.intersect1d(train.rows, test.rows)), 0)
+        x, y = next(train.batch_generator(4, shuffle=False))
+        np.testing.assert_array_equal(y, self.labels[train.rows[:4]])
+        with self.assertRaises(ValueError):
+            train.images.append(self.images[0])
+        self.assertIn("fold4", vb.splits)
+        vb.close()
+
+    def test_legacy_layout(self):
+        vb = self._build(LegacyVedaBase)
+        vb.close()
+        vb = VedaBase.from_path(self.h5)
+        self.assertFalse(vb._indexed)
+        self.assertEqual(len(vb.train), 7)
+        np.testing.assert_array_equal(vb.test.images[0], self.images[7])
+        with self.assertRaises(NotImplementedError):
+            vb.partition()
+        vb.close()
+
+
+class RepackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './source.h5'
+        self.out = './repacked.h5'
+        self.images = np.arange(10 * 4, dtype=np.uint8).reshape(10, 1, 2, 2)
+        self.labels = np.array([[i % 2, 1] for i in range(10)], dtype=np.uint8)
+
+    def tearDown(self):
+        for path in (self.h5, self.out):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _build(self, klass=VedaBase):
+        vb = klass.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                             image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True)
+        vb.train.append_batch(self.images[:7], self.labels[:7])
+        vb.test.append_batch(self.images[7:], self.labels[7:])
+        return vb
+
+    def test_repack(self):
+        vb = self._build()
+        out = vb.repack(self.out, layout="random", exclude={"train": [1, 5], "test": [0]}, block_bytes=8)
+        self.assertEqual(out.layout.complib, "blosc:zstd")
+        self.assertEqual(out._fileh.root.data.images.chunkshape, (1, 1, 2, 2))
+        self.assertEqual([len(out.train), len(out.test), len(out.validate)], [5, 2, 0])
+        keep = [0, 2, 3, 4, 6, 8, 9]
+        np.testing.assert_array_equal(out._data.images.read_batch(np.arange(7)), self.images[keep])
+        np.testing.assert_array_equal(out.test.labels.read_batch([0, 1]), self.labels[[8, 9]])
+        np.testing.assert_array_equal(out.train.where(classes=["a"]), [2])
+        with self.assertRaises(ValueError):
+            vb.repack(self.out)
+        out.close()
+        vb.close()
+
+    def test_repack_legacy(self):
+        vb = self._build(LegacyVedaBase)
+        out = vb.repack(self.out, exclude={"test": [2]})
+        self.assertTrue(out._indexed)
+        np.testing.assert_array_equal(out.test.rows, [7, 8])
+        np.testing.assert_array_equal(out.train.images.read_batch(np.arange(7)), self.images[:7])
+        with self.assertRaises(ValueError):
+            vb.repack(self.out, exclude=[1], overwrite=True)
+        out.close()
+        vb.close()
+
+
+class StatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './stats.h5'
+        self.images = np.random.RandomState(0).randint(0, 255, (30, 2, 3, 3)).astype(np.uint8)
+        self.labels = np.array([[i % 2, 1] for i in range(30)], dtype=np.uint8)
+        self.vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                     image_shape=[2, 3, 3], image_dtype=np.uint8, overwrite=True)
+
+    def tearDown(self):
+        self.vb.close()
+        os.remove(self.h5)
+
+    def test_running_stats(self):
+        self.vb.train.append_batch(self.images[:12], self.labels[:12])
+        for i in range(12, 30):
+            self.vb.test.images.append(self.images[i])
+            self.vb.test.labels.append(self.labels[i])
+        bands = self.images.transpose(1, 0, 2, 3).reshape(2, -1)
+        stats = self.vb.stats
+        np.testing.assert_array_equal(stats.count, [270, 270])
+        np.testing.assert_allclose(stats.mean, bands.mean(axis=1))
+        np.testing.assert_allclose(stats.std, bands.std(axis=1))
+        np.testing.assert_array_equal(stats.min, bands.min(axis=1))
+        np.testing.assert_array_equal(stats.hist[1], np.bincount(bands[1], minlength=256))
+        self.vb.close()
+        self.vb = VedaBase.from_path(self.h5, mode="r")
+        np.testing.assert_allclose(self.vb.stats.mean, bands.mean(axis=1))
+        computed = self.vb.compute_stats(block_rows=7, workers=2)
+        np.testing.assert_allclose(computed.m2, stats.m2)
+        np.testing.assert_array_equal(computed.hist, stats.hist)
+
+    def test_float_histogram_range(self):
+        floats = np.random.RandomState(2).uniform(0, 1, (30, 1, 2, 2)).astype(np.float32)
+        floats[20:] *= 10
+        floats[25:] -= 20
+        values = floats.ravel()
+        stats = BandStats(1, bins=8)
+        stats.update(floats[:10]).update(floats[10:20]).update(floats[20:])
+        self.assertLessEqual(stats.range[0], values.min())
+        self.assertGreaterEqual(stats.range[1], values.max())
+        np.testing.assert_array_equal(stats.hist[0], np.histogram(values, bins=8, range=stats.range)[0])
+
+        vb = VedaBase.from_path('./stats_float.h5', mltype="classification", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.float32, overwrite=True)
+        try:
+            vb.train.append_batch(floats, self.labels)
+            computed = vb.compute_stats(bins=8, block_rows=10)
+            self.assertEqual(computed.range, [float(values.min()), float(values.max())])
+            self.assertEqual(computed.hist.sum(), values.size)
+            self.assertEqual(computed.hist[0, 0], np.sum(values < values.min() + (values.max() - values.min()) / 8))
+        finally:
+            vb.close()
+            os.remove('./stats_float.h5')
+
+    def test_generator_normalizes(self):
+        self.vb.train.append_batch(self.images, self.labels)
+        scale, offset = self.vb.stats.normalizer("standard")
+        gen = self.vb.train.batch_generator(10, shuffle=False, rescale="standard")
+        x, y = next(gen)
+        expected = self.images[:10] * scale[:, None, None] + offset[:, None, None]
+        np.testing.assert_allclose(x, expected)
+        x, y = next(self.vb.train.batch_generator(30, shuffle=False, rescale=True, channels_last=True))
+        self.assertAlmostEqual(x.min(), 0)
+        self.assertAlmostEqual(x.max(), 1)
+
+
+class InMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './inmemory.h5'
+        self.images = np.random.RandomState(1).randint(0, 4, (20, 2, 4, 4)).astype(np.uint16)
+        self.labels = np.array([[i % 2, 1] for i in range(20)], dtype=np.uint8)
+        self.vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                     image_shape=[2, 4, 4], image_dtype=np.uint16, overwrite=True)
+        self.vb.train.append_batch(self.images[:15], self.labels[:15])
+        self.vb.test.append_batch(self.images[15:], self.labels[15:])
+
+    def tearDown(self):
+        self.vb.close()
+        os.remove(self.h5)
+
+    def test_load(self):
+        for compress in (None, "zlib", "lz4"):
+            node = self.vb.train.load(compress=compress, workers=2, block_rows=4)
+            self.assertEqual(len(node), 15)
+            idx = [14, 0, 3, 3, -1]
+            x, y = node.read_batch(idx)
+            np.testing.assert_array_equal(x, self.images[:15][idx])
+            np.testing.assert_array_equal(y, self.labels[:15][idx])
+            np.testing.assert_array_equal(node.images[2], self.images[2])
+            np.testing.assert_array_equal(node.where(classes=["a"]), np.arange(1, 15, 2))
+            x, y = next(node.batch_generator(5, shuffle=False))
+            np.testing.assert_array_equal(x, self.images[:5])
+            with self.assertRaises(NotImplementedError):
+                node.append_batch(self.images[:1], self.labels[:1])
+            if compress is not None:
+                self.assertLess(node.images.nbytes, self.images[:15].nbytes)
+            node.close()
+
+    def test_memory_budget(self):
+        with self.assertRaises(MemoryError):
+            self.vb.train.load(memory_budget=100)
+        with self.assertRaises(MemoryError):
+            self.vb.train.load(memory_budget=10, compress="zlib")
+
+
+class SampleCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './cached.h5'
+        self.images = np.arange(10 * 4, dtype=np.uint8).reshape(10, 1, 2, 2)
+        self.vb = VedaBase.from_path(self.h5, mltype="object_detection", klasses=["a", "b"],
+                                     image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True, cache=2**20)
+        self.labels = [[[[0, 0, 1, 1]] * (i % 3), []] for i in range(10)]
+        self.vb.train.append_batch(self.images[:6], self.labels[:6])
+        self.vb.test.append_batch(self.images[6:], self.labels[6:])
+
+    def tearDown(self):
+        self.vb.close()
+        os.remove(self.h5)
+
+    def test_cached_reads(self):
+        cache = self.vb.cache
+        x, y = self.vb.test.read_batch([1, 0, 1])
+        np.testing.assert_array_equal(x, self.images[[7, 6, 7]])
+        self.assertEqual(y, [self.labels[i] for i in (7, 6, 7)])
+        self.assertEqual((cache.hits, cache.misses), (0, 4))
+        # A new wrapper over the same partition hits the cached samples
+        self.vb._nodes = {}
+        x, y = self.vb.test.read_batch([0, 2])
+        np.testing.assert_array_equal(x, self.images[[6, 8]])
+        self.assertEqual(y, [self.labels[6], self.labels[8]])
+        self.assertEqual((cache.hits, cache.misses), (2, 6))
+        np.testing.assert_array_equal(self.vb.test[0][0], self.images[6])
+        self.assertEqual(cache.hits, 4)
+
+    def test_eviction(self):
+        self.vb.cache = 8
+        self.vb.train.images.read_batch(np.arange(6))
+        self.assertEqual(len(self.vb.cache), 2)
+        self.assertEqual(self.vb.cache.evictions, 4)
+        self.assertEqual(self.vb.cache.nbytes, 8)
+        self.vb.cache = None
+        np.testing.assert_array_equal(self.vb.train.images.read_batch([5]), self.images[[5]])
+
+
+class MetadataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './metadata.h5'
+        self.out = './metadata-repacked.h5'
+        self.images = np.arange(10 * 4, dtype=np.uint8).reshape(10, 1, 2, 2)
+        self.labels = np.array([[i % 2, 1] for i in range(10)], dtype=np.uint8)
+        # A row of unit tiles along x, the last three samples carry no metadata
+        self.features = [{"properties": {"id": "dp{}".format(i), "bounds": [i, 0, i + 1, 1],
+                                         "tile_coords": [i, 0]}} for i in range(7)]
+        self.vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                     image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True)
+        self.vb.train.append_batch(self.images[:4], self.labels[:4], metadata=self.features[:4])
+        self.vb.test.append_batch(self.images[4:7], self.labels[4:7], metadata=self.features[4:7])
+        self.vb.validate.append_batch(self.images[7:], self.labels[7:])
+
+    def tearDown(self):
+        self.vb.close()
+        for path in (self.h5, self.out):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def test_metadata(self):
+        meta = self.vb.test.metadata.read_batch([2, 0])
+        self.assertEqual(list(meta["id"]), ["dp6", "dp4"])
+        np.testing.assert_array_equal(meta["minx"], [6, 4])
+        self.assertEqual(self.vb.train.metadata[1]["tile_x"], 1)
+        self.assertEqual(self.vb.validate.metadata[0]["id"], "")
+        np.testing.assert_array_equal(self.vb.train.query_bbox([1.5, 0.2, 2.5, 0.8]), [1, 2])
+        np.testing.assert_array_equal(self.vb.test.query_bbox([0, 0, 10, 1], predicate="within"), [0, 1, 2])
+        np.testing.assert_array_equal(self.vb.test.query_bbox([5.2, 0.2, 5.3, 0.3], predicate="contains"), [1])
+        self.assertEqual(len(self.vb.validate.query_bbox([0, 0, 10, 1])), 0)
+        # Appends without metadata keep the table aligned with the samples
+        self.vb.train.append_batch(self.images[:1], self.labels[:1])
+        self.vb.train.append_batch(self.images[:1], self.labels[:1],
+                                   metadata=[{"id": "late", "bounds": [20, 0, 21, 1]}])
+        np.testing.assert_array_equal(self.vb.train.query_bbox([19, 0, 22, 1]), [5])
+        self.assertEqual(self.vb._data.metadata[11]["id"], "late")
+
+    def test_repack(self):
+        out = self.vb.repack(self.out, exclude={"test": [0]})
+        np.testing.assert_array_equal(out.test.query_bbox([0, 0, 10, 1]), [0, 1])
+        self.assertEqual(list(out.test.metadata.read_batch([0, 1])["id"]), ["dp5", "dp6"])
+        out.close()
+
+    def test_grid_index(self):
+        rng = np.random.RandomState(0)
+        lo = rng.uniform(0, 100, size=(500, 2))
+        bounds = np.concatenate([lo, lo + rng.uniform(0, 5, size=(500, 2))], axis=1)
+        bounds[10] = np.nan
+        index = GridIndex(bounds)
+        self.assertEqual(len(index), 499)
+        for bbox in ([10, 10, 30, 20], [50, 50, 50, 50], [-5, -5, 200, 200]):
+            expected = np.flatnonzero((bounds[:, 0] <= bbox[2]) & (bounds[:, 2] >= bbox[0]) &
+                                      (bounds[:, 1] <= bbox[3]) & (bounds[:, 3] >= bbox[1]))
+            np.testing.assert_array_equal(index.query(bbox), expected)
+
+
+class RecoverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.h5 = './recover.h5'
+        self.images = np.arange(6 * 4, dtype=np.uint8).reshape(6, 1, 2, 2)
+        self.features = [{"id": "dp{}".format(i), "bounds": [i, 0, i + 1, 1]} for i in range(6)]
+
+    def tearDown(self):
+        try:
+            os.remove(self.h5)
+        except OSError:
+            pass
+
+    def test_recover_classification(self):
+        labels = np.array([[i % 2, 1] for i in range(6)], dtype=np.uint8)
+        vb = VedaBase.from_path(self.h5, mltype="classification", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True)
+        vb.train.append_batch(self.images[:4], labels[:4], metadata=self.features[:4])
+        # A writer dying mid-batch leaves metadata and images without labels
+        vb.train.metadata.append_batch(self.features[4:])
+        vb.train.images.append_batch(self.images[4:])
+        vb.close()
+
+        vb = VedaBase.from_path(self.h5)
+        self.assertEqual(vb.recover(), 2)
+        self.assertEqual(len(vb.train), 4)
+        self.assertEqual(vb.stored_ids(), {"dp0", "dp1", "dp2", "dp3"})
+        vb.train.append_batch(self.images[4:], labels[4:], metadata=self.features[4:])
+        x, y = vb.train.read_batch([5, 4])
+        np.testing.assert_array_equal(x, self.images[[5, 4]])
+        np.testing.assert_array_equal(y, labels[[5, 4]])
+        np.testing.assert_array_equal(vb.train.where(classes=["a"]), [1, 3, 5])
+        self.assertEqual(list(vb.train.metadata.read_batch([4, 5])["id"]), ["dp4", "dp5"])
+        vb.close()
+
+    def test_recover_object_detection(self):
+        labels = [[[[0, 0, 1, 1]] * i, []] for i in range(6)]
+        vb = VedaBase.from_path(self.h5, mltype="object_detection", klasses=["a", "b"],
+                                image_shape=[1, 2, 2], image_dtype=np.uint8, overwrite=True)
+        vb.test.append_batch(self.images[:3], labels[:3], metadata=self.features[:3])
+        vb.test.labels.append_batch(labels[3:5])
+        self.assertEqual(vb.recover(), 2)
+        self.assertEqual(len(vb._fileh.root.data.labels.boxes), 3)
+        vb.test.append_batch(self.images[3:], labels[3:])
+        self.assertEqual(vb.test.labels.read_batch([5, 3]), [labels[5], labels[3]])
+        self.assertEqual(vb.stored_ids(), {"dp0", "dp1", "dp2"})
+        vb.close()